@@ -0,0 +1,140 @@
+"""
+Explain every query shape the app runs and report the ones Mongo answers
+with a collection scan or an in-memory sort.
+
+    python -m app.check_indexes            # check against the current indexes
+    python -m app.check_indexes --apply    # apply app/indexes.py first
+
+Exits non-zero when any query still scans, so it can run in CI against a
+staging database.
+"""
+
+from datetime import datetime, timezone
+import asyncio
+import os
+import sys
+import time
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.indexes import ensure_indexes
+from app.services.analytics_pipelines import cohort_pipeline, student_pipeline
+
+load_dotenv()
+
+
+# Placeholder values: the plan depends on the shape, not the values
+USER_ID = ObjectId()
+SESSION_ID = ObjectId()
+NOW = int(time.time())
+
+# (name, collection, filter, sort)
+FIND_QUERIES = [
+    ("auth: user by id", "users", {"_id": USER_ID}, None),
+    ("login/register: user by email", "users", {"email": "student@example.com"}, None),
+    ("telegram: user by chat_id", "users", {"chat_id": 0}, None),
+    ("scheduler: subscriptions to renew", "users", {
+        "plan": "pro",
+        "subscription_status": "active",
+        "subscription_current_period_end": {"$lte": datetime.now(timezone.utc)}
+    }, None),
+    ("mock start/resume: active session", "test_sessions", {"user_id": USER_ID, "status": "active"}, None),
+    ("mock submit/save-answer: session", "test_sessions",
+     {"_id": SESSION_ID, "user_id": USER_ID, "status": "active"}, None),
+    ("completed tests in order", "test_sessions", {"user_id": USER_ID, "status": "completed"},
+     [("completed_at", 1), ("_id", 1)]),
+    ("mock start: recently seen questions", "test_sessions", {"user_id": USER_ID},
+     [("started_at", -1)]),
+    ("question bank: read-through", "questions", {"_id": {"$in": [ObjectId(), ObjectId()]}}, None),
+    ("questions by syllabus", "questions",
+     {"board": "CBSE", "subject": "Maths", "class": 10, "chapter": "Real Numbers"}, None),
+    ("session store: load", "chat_sessions", {"_id": "0", "rev": {"$ne": 1}}, None),
+    ("user stats", "user_stats", {"_id": USER_ID}, None),
+]
+
+# (name, collection, pipeline)
+AGGREGATIONS = [
+    ("stats backfill", "test_sessions", student_pipeline(USER_ID, 50, 1000)),
+    ("cohort analytics", "test_sessions", cohort_pipeline(since=NOW - 30 * 86400)),
+]
+
+
+def plan_stages(node, found=None):
+    """Every `stage` name under the winning plan(s) of an explain document."""
+    if found is None:
+        found = []
+
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "rejectedPlans":
+                continue
+            if key == "stage" and isinstance(value, str):
+                found.append(value)
+            else:
+                plan_stages(value, found)
+
+    elif isinstance(node, list):
+        for item in node:
+            plan_stages(item, found)
+
+    return found
+
+
+def verdict(stages) -> str:
+    if "COLLSCAN" in stages:
+        return "❌ COLLSCAN"
+    if "SORT" in stages:
+        return "⚠️ in-memory SORT"
+    return "✅ index"
+
+
+async def explain_find(db, collection, query, sort):
+    cursor = db[collection].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    return await cursor.explain()
+
+
+async def explain_aggregate(db, collection, pipeline):
+    return await db.command("aggregate", collection, pipeline=pipeline, explain=True)
+
+
+async def check(apply: bool = False) -> int:
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        raise RuntimeError("❌ MONGO_URI not set")
+
+    client = AsyncIOMotorClient(mongo_uri)
+    db = client["stepwise"]
+
+    if apply:
+        await ensure_indexes(db)
+
+    scans = 0
+    checks = [
+        (name, explain_find(db, collection, query, sort))
+        for name, collection, query, sort in FIND_QUERIES
+    ] + [
+        (name, explain_aggregate(db, collection, pipeline))
+        for name, collection, pipeline in AGGREGATIONS
+    ]
+
+    for name, explain in checks:
+        stages = plan_stages(await explain)
+        result = verdict(stages)
+
+        if "COLLSCAN" in stages:
+            scans += 1
+
+        print(f"{result:<20} {name:<40} {' > '.join(stages)}")
+
+    client.close()
+
+    print(f"\n{scans} of {len(checks)} queries scan a collection")
+    return scans
+
+
+if __name__ == "__main__":
+    sys.exit(1 if asyncio.run(check(apply="--apply" in sys.argv)) else 0)
@@ -0,0 +1,6 @@
+import os
+
+
+# Tutoring sessions untouched for this long are dropped: from memory by the
+# session store, from Mongo by the chat_sessions TTL index (app/indexes.py)
+SESSION_IDLE_HOURS = float(os.getenv("SESSION_IDLE_HOURS", "24"))
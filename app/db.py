@@ -1,17 +1,22 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 
+from app.indexes import ensure_indexes
+
 client = None
 db = None
 users_collection = None
 questions_collection = None
 mock_results_collection = None
 test_sessions_collection = None
+chat_sessions_collection = None
+meta_collection = None
+user_stats_collection = None
 
 
 
-def init_db():
-    global client, db, users_collection, questions_collection, mock_results_collection, test_sessions_collection
+async def init_db():
+    global client, db, users_collection, questions_collection, mock_results_collection, test_sessions_collection, chat_sessions_collection, meta_collection, user_stats_collection
 
     mongo_uri = os.getenv("MONGO_URI")
     if not mongo_uri:
@@ -30,5 +35,11 @@ def init_db():
     questions_collection = db["questions"]
     mock_results_collection = db["mock_results"]
     test_sessions_collection = db["test_sessions"]   # 👈 NEW
+    chat_sessions_collection = db["chat_sessions"]    # tutoring state (SESSION_STORE=mongo)
+    meta_collection = db["app_meta"]                  # version counters (question bank)
+    user_stats_collection = db["user_stats"]          # per-user test statistics, one doc each
+
+    print("✅ MongoDB client initialized")
 
-    print("✅ MongoDB client initialized")
\ No newline at end of file
+    failed = await ensure_indexes(db)
+    print("✅ Indexes ensured" if not failed else f"⚠️ {failed} indexes not applied")
\ No newline at end of file
@@ -0,0 +1,85 @@
+"""
+Every index the app's queries rely on, applied at startup by `init_db`.
+
+`create_index` is a no-op when an index with the same keys and options
+already exists, so applying these on every start is cheap. A failure (an
+existing index with different options, duplicate data under a unique
+index) is logged and skipped; it never blocks startup.
+
+When adding a query, add its index here and its shape to
+app/check_indexes.py.
+"""
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+from app.config import SESSION_IDLE_HOURS
+
+
+# Unique only where the field is set: Telegram users have no email and
+# web users have no chat_id
+HAS_EMAIL = {"email": {"$type": "string"}}
+HAS_CHAT_ID = {"chat_id": {"$exists": True}}
+
+
+# collection -> [(keys, create_index options)]
+INDEXES = {
+    "users": [
+        # Login, register
+        ([("email", ASCENDING)], {"name": "email", "unique": True,
+                                  "partialFilterExpression": HAS_EMAIL}),
+        # Telegram webhook
+        ([("chat_id", ASCENDING)], {"name": "chat_id", "unique": True,
+                                    "partialFilterExpression": HAS_CHAT_ID}),
+        # Monthly credit reset (subscription_scheduler)
+        ([("plan", ASCENDING), ("subscription_status", ASCENDING),
+          ("subscription_current_period_end", ASCENDING)], {"name": "subscription_renewal"}),
+    ],
+    "test_sessions": [
+        # Active session lookup (start/resume/save-answer/submit) and a
+        # student's completed tests in order (stats backfill)
+        ([("user_id", ASCENDING), ("status", ASCENDING),
+          ("completed_at", ASCENDING), ("_id", ASCENDING)], {"name": "user_status_completed"}),
+        # Questions of a student's latest tests (question_sampler.recently_seen)
+        ([("user_id", ASCENDING), ("started_at", DESCENDING)], {"name": "user_started"}),
+        # Cohort analytics over a time window
+        ([("status", ASCENDING), ("completed_at", DESCENDING)], {"name": "status_completed"}),
+    ],
+    "questions": [
+        # Same spec as app/seed_questions.py, so neither recreates the other's
+        ([("question", ASCENDING)], {"unique": True}),
+        # Question bank filters
+        ([("board", ASCENDING), ("subject", ASCENDING), ("class", ASCENDING),
+          ("chapter", ASCENDING), ("topic", ASCENDING), ("difficulty", ASCENDING)],
+         {"name": "syllabus"}),
+    ],
+    "chat_sessions": [
+        # SESSION_STORE=mongo: idle expiry only drops the in-memory copy,
+        # Mongo removes the document itself
+        ([("last_active", ASCENDING)], {"name": "idle_ttl",
+                                        "expireAfterSeconds": int(SESSION_IDLE_HOURS * 3600)}),
+    ],
+    # user_stats and app_meta are only read by _id
+}
+
+
+async def ensure_indexes(db) -> int:
+    """Create any missing index; returns how many could not be applied."""
+    failed = 0
+
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+
+        for keys, options in indexes:
+            try:
+                await collection.create_index(keys, **options)
+            except ConnectionFailure as e:
+                # Unreachable: every other index would wait out the same timeout
+                print("⚠️ Indexes not applied, MongoDB unreachable:", str(e))
+                return failed + 1
+            except PyMongoError as e:
+                failed += 1
+                name = options.get("name") or "_".join(f"{k}_{d}" for k, d in keys)
+                print(f"⚠️ Index {collection_name}.{name} not applied:", str(e))
+
+    return failed
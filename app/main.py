@@ -16,18 +16,21 @@ from app.services.subscription_scheduler import start_scheduler
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, Field
+from dataclasses import asdict
 from typing import Optional, Dict, List, Any
 import asyncio
 from bson import ObjectId
 from app.services.razorpay_client import client as razorpay_client
 from app.services.credit_manager import check_credits, consume_credits, CHAT_COST, MOCK_COST
+from app.services.user_cache import user_cache
 from app.mock_explainer import generate_explanation
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
-from fastapi import Depends, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials,  OAuth2PasswordBearer
+from fastapi import Depends
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.services.adaptive_explanation import generate_adaptive_explanation
 from app.services.adaptive_explanation import extract_json
 from app.services.learning_steps import get_gravity_steps
@@ -39,7 +42,17 @@ from app.services.step_generator import generate_steps
 import time
 print("SYSTEM TIME:", int(time.time()))
 
-from app.socratic import chat_reply, cleanup_old_sessions, get_state, analyze_student_profile
+from app.socratic import chat_reply, get_state, analyze_student_profile
+from app.services.analytics_pipelines import cohort_aggregates, cohort_view
+from app.services.question_bank import question_bank
+from app.services.mock_assembly import assemble_mock
+from app.services.mock_sessions import active_session, answer_buffer, resume_view
+from app.services.session_locks import SessionBusy
+from app.services.user_stats import (
+    get_user_stats, history_view, insights_view, progress_view, record_test, test_summary
+)
+from app.services.session_snapshot import create_session_snapshots
+from app.services.session_store import SESSION_IDLE_HOURS, SESSION_SWEEP_SECONDS, session_store
 from app.telegram import router as telegram_router
 from app.db import init_db
 import app.db as db
@@ -65,40 +78,8 @@ app.add_middleware(
 
 
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
-
 security = HTTPBearer()
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-
-    print("Auth header received:", token)
-
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("user_id")
-
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token"
-            )
-
-    except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
-
-    user = await db.users_collection.find_one({"_id": ObjectId(user_id)})
-
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found"
-        )
-
-    return user
-
 
 def sanitize_json_string(text: str) -> str:
     # Remove markdown
@@ -122,9 +103,16 @@ def sanitize_json_string(text: str) -> str:
 async def startup_event():
     """Initialize database and start background tasks"""
     print("🚀 Starting StepWise AI...")
-    init_db()
+    await init_db()
     start_scheduler()
     print("✅ Database initialized")
+
+    # Warm the question bank so the first mock request does not pay for it
+    try:
+        await question_bank.ensure_fresh()
+    except Exception as e:
+        print("⚠️ Question bank not loaded yet:", str(e))
+
     print("✅ Server ready")
 
 class MockQuestionResponse(BaseModel):
@@ -181,7 +169,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
 
-        user = await db.users_collection.find_one({"_id": ObjectId(user_id)})
+        # Shared by the request's dependencies and handler; Mongo is read at most every USER_CACHE_SECONDS
+        user = await user_cache.get(user_id)
 
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
@@ -239,6 +228,7 @@ async def verify_payment(
                 }
             }
         )
+        user_cache.invalidate(user_id)
 
         return {
             "message": "Payment verified. Pro activated.",
@@ -302,6 +292,7 @@ async def verify_extra_credits(
                 }
             }
         )
+        user_cache.invalidate(user_id)
 
         print("STEP 4: Credits updated")
 
@@ -451,6 +442,7 @@ async def dev_upgrade(current_user: dict = Depends(get_current_user)):
             }
         }
     )
+    user_cache.invalidate(user_id)
 
     return {
         "message": "User upgraded to Pro (dev mode)",
@@ -581,18 +573,35 @@ async def protected_route(current_user = Depends(get_current_user)):
 async def shutdown_event():
     """Cleanup on shutdown"""
     print("🛑 Shutting down StepWise AI...")
-    cleanup_old_sessions(max_age_hours=0)  # Clean all sessions
+    await session_store.close()  # Persist pending writes (Mongo store)
+
+    try:
+        await answer_buffer.flush()
+    except Exception as e:
+        print("⚠️ Answer flush failed:", str(e))
+
+    # Keep live sessions across the restart (memory store)
+    if session_snapshots is not None:
+        try:
+            saved = await session_snapshots.compact()
+            print(f"💾 Saved {saved} sessions")
+        except Exception as e:
+            print("⚠️ Session snapshot failed:", str(e))
+
     print("✅ Cleanup complete")
 
 
 # =========================
 # BACKGROUND TASKS
 # =========================
+session_snapshots = create_session_snapshots(session_store)
+
+
 async def periodic_cleanup():
-    """Periodically clean up old sessions"""
+    """Expire idle sessions continuously, a slice at a time"""
     while True:
-        await asyncio.sleep(3600)  # Run every hour
-        removed = cleanup_old_sessions(max_age_hours=24)
+        await asyncio.sleep(SESSION_SWEEP_SECONDS)
+        removed = await session_store.reap(SESSION_IDLE_HOURS * 3600)
         if removed > 0:
             print(f"🧹 Cleaned up {removed} inactive sessions")
 
@@ -600,7 +609,12 @@ async def periodic_cleanup():
 # Start cleanup task on startup
 @app.on_event("startup")
 async def start_background_tasks():
+    if session_snapshots is not None:
+        session_snapshots.restore()
+        asyncio.create_task(session_snapshots.run())
+
     asyncio.create_task(periodic_cleanup())
+    asyncio.create_task(answer_buffer.run())
 
 
 # =========================
@@ -625,11 +639,9 @@ async def health_check():
 @app.get("/health")
 async def detailed_health():
     """Detailed health check"""
-    from app.socratic import chat_states
-    
     return {
         "status": "healthy",
-        "active_sessions": len(chat_states),
+        "active_sessions": len(session_store),
         "endpoints": {
             "chat": "/chat",
             "stream": "/chat/stream",
@@ -645,52 +657,9 @@ async def detailed_health():
 @app.get("/mock/history")
 async def get_mock_history(user=Depends(get_current_user)):
 
-    sessions = await db.test_sessions_collection.find(
-        {
-            "user_id": ObjectId(user["_id"]),
-            "status": "completed"
-        }
-    ).sort("completed_at", -1).to_list(length=50)
-
-    history = []
-
-    for s in sessions:
-
-        topic_stats = {}
+    stats = await get_user_stats(ObjectId(user["_id"]))
 
-        for r in s.get("results", []):
-            topic = r.get("topic", "General")
-
-            if topic not in topic_stats:
-                topic_stats[topic] = {"correct": 0, "total": 0}
-
-            topic_stats[topic]["total"] += 1
-
-            if r.get("isCorrect"):
-                topic_stats[topic]["correct"] += 1
-
-        topic_accuracy = {}
-
-        for t, stats in topic_stats.items():
-            topic_accuracy[t] = round(
-                (stats["correct"] / stats["total"]) * 100
-            )
-
-        history.append({
-            "session_id": str(s["_id"]),
-            "subject": s.get("subject"),
-            "class_level": s.get("class_level"),
-            "score": s.get("score"),
-            "total": s.get("total"),
-            "accuracy": s.get("accuracy"),
-            "chapter": s.get("chapter"),
-            "weak_topics": s.get("weak_topics", []),
-            "topic_accuracy": topic_accuracy,
-            "duration": s.get("duration"),
-            "completed_at": s.get("completed_at")
-        })
-
-    return history
+    return history_view(stats)
 
 
 @app.post("/mock-test/submit")
@@ -704,15 +673,26 @@ async def submit_mock_test(
     # ------------------------------------------------
     # 1️⃣ Find Active Session
     # ------------------------------------------------
-    session = await db.test_sessions_collection.find_one({
-        "_id": ObjectId(data.session_id),
-        "user_id": user_id,
-        "status": "active"
-    })
+    session = await db.test_sessions_collection.find_one(
+        {
+            "_id": ObjectId(data.session_id),
+            "user_id": user_id,
+            "status": "active"
+        },
+        {"duration": 1, "subject": 1, "class_level": 1, "chapter": 1}
+    )
 
     if not session:
         raise HTTPException(status_code=400, detail="No active session found")
 
+    # Write answers still buffered before the session is completed
+    await answer_buffer.close(session["_id"])
+
+    # ------------------------------------------------
+    # 2️⃣ Resolve All Questions (question bank, in memory)
+    # ------------------------------------------------
+    question_map = await question_bank.get_many(data.answers)
+
     score = 0
     total = len(data.answers)
     detailed_results = []
@@ -720,31 +700,29 @@ async def submit_mock_test(
     now_ts = int(datetime.now(timezone.utc).timestamp())
 
     # ------------------------------------------------
-    # 2️⃣ Evaluate Answers
+    # 3️⃣ Evaluate Answers (in memory)
     # ------------------------------------------------
     for question_id, selected_index in data.answers.items():
 
-        q = await db.questions_collection.find_one({
-            "_id": ObjectId(question_id)
-        })
+        q = question_map.get(question_id)
 
         if not q:
             continue
 
-        correct_index = q["correctAnswer"]
-        correct_option = q["options"][correct_index]
+        correct_index = q.correct
+        correct_option = q.options[correct_index]
 
-        topic = q.get("topic", "General")
-        difficulty = q.get("difficulty", "medium")
-        concept = q.get("concept", topic)
+        topic = q.topic
+        difficulty = q.difficulty
+        concept = q.concept
 
         # ----------------------------------------------
         # Selected Answer
         # ----------------------------------------------
         if selected_index == -1:
             selected_option = "Not Attempted"
-        elif selected_index < len(q["options"]):
-            selected_option = q["options"][selected_index]
+        elif selected_index < len(q.options):
+            selected_option = q.options[selected_index]
         else:
             selected_option = "Invalid Option"
 
@@ -757,7 +735,7 @@ async def submit_mock_test(
             score += 1
             explanation = "Correct. Well done."
         else:
-            base_explanation = q.get("explanation", "Explanation not available.")
+            base_explanation = q.explanation
             explanation = f"Incorrect. The correct answer is '{correct_option}'. {base_explanation}"
         
         # ----------------------------------------------
@@ -765,11 +743,11 @@ async def submit_mock_test(
         # ----------------------------------------------
         detailed_results.append({
             "question_id": question_id,
-            "question": q["question"],
-            "difficulty": q.get("difficulty", "medium"),
+            "question": q.question,
+            "difficulty": difficulty,
             "selectedAnswer": selected_index,
             "selectedOption": selected_option,
-            "concept": q.get("topic", "General"),
+            "concept": topic,
             "correctAnswer": correct_index,
             "correctOption": correct_option,
 
@@ -785,12 +763,12 @@ async def submit_mock_test(
         })
 
     # ------------------------------------------------
-    # 3️⃣ Accuracy Calculation
+    # 4️⃣ Accuracy Calculation
     # ------------------------------------------------
     accuracy = round((score / total) * 100) if total > 0 else 0
 
     # ------------------------------------------------
-    # 4️⃣ Weak Topics Detection
+    # 5️⃣ Weak Topics Detection
     # ------------------------------------------------
     weak_topics = list({
         r["topic"]
@@ -798,24 +776,13 @@ async def submit_mock_test(
         if not r["isCorrect"]
     })
 
-    # ------------------------------------------------
-    # 5️⃣ Credit Deduction
-    # ------------------------------------------------
-    await consume_credits(str(user_id), MOCK_COST, "mock_test")
-
-    await db.users_collection.update_one(
-        {"_id": user_id},
-        {
-            "$inc": {"mock_attempts_used": 1},
-            "$set": {"updated_at": datetime.now(timezone.utc)}
-        }
-    )
-
     # ------------------------------------------------
     # 6️⃣ Update Session (Completed)
     # ------------------------------------------------
-    await db.test_sessions_collection.update_one(
-        {"_id": session["_id"]},
+    # Only from active: of two concurrent submits (double tap, retry) one
+    # completes the test, the other is rejected before it charges or counts
+    completed = await db.test_sessions_collection.update_one(
+        {"_id": session["_id"], "status": "active"},
         {
             "$set": {
                 "status": "completed",
@@ -829,8 +796,46 @@ async def submit_mock_test(
         }
     )
 
+    if completed.modified_count == 0:
+        raise HTTPException(status_code=400, detail="No active session found")
+
     # ------------------------------------------------
-    # 7️⃣ Return Response
+    # 7️⃣ Credit Deduction + Attempt Count (one write)
+    # ------------------------------------------------
+    try:
+        await consume_credits(
+            current_user, MOCK_COST, "mock_test",
+            inc={"mock_attempts_used": 1}
+        )
+    except Exception:
+        # Not paid for (402, or the write failed): the test stays open to
+        # submit again, without the results of this attempt
+        await db.test_sessions_collection.update_one(
+            {"_id": session["_id"], "status": "completed"},
+            {
+                "$set": {"status": "active"},
+                "$unset": {
+                    "score": "",
+                    "total": "",
+                    "accuracy": "",
+                    "weak_topics": "",
+                    "results": "",
+                    "completed_at": ""
+                }
+            }
+        )
+        raise
+
+    # ------------------------------------------------
+    # 8️⃣ Fold Into Learning Stats (one $inc)
+    # ------------------------------------------------
+    await record_test(user_id, test_summary(
+        session["_id"], session, detailed_results,
+        score, total, accuracy, weak_topics, now_ts
+    ))
+
+    # ------------------------------------------------
+    # 9️⃣ Return Response
     # ------------------------------------------------
     return {
         "score": score,
@@ -993,175 +998,17 @@ def check_correctness(student_answer: str, correct_answer: str):
 @app.get("/analytics/learning-insights")
 async def get_learning_insights(user=Depends(get_current_user)):
 
-    sessions = await db.test_sessions_collection.find(
-        {
-            "user_id": ObjectId(user["_id"]),
-            "status": "completed"
-        }
-    ).sort("completed_at", -1).to_list(length=20)
-
-    if not sessions:
-        return {
-            "learning_velocity": 0,
-            "difficulty_strength": {},
-            "weakest_topic": None,
-            "strongest_topic": None,
-            "recommended_topic": None
-        }
-
-    topic_stats = {}
-    difficulty_stats = {}
-
-    accuracies = []
-
-    for s in sessions:
-
-        accuracies.append(s.get("accuracy", 0))
-
-        for r in s.get("results", []):
-
-            topic = r.get("topic", "General")
-            difficulty = r.get("difficulty", "medium")
-
-            # Topic stats
-            if topic not in topic_stats:
-                topic_stats[topic] = {"correct": 0, "total": 0}
-
-            topic_stats[topic]["total"] += 1
-
-            if r.get("isCorrect"):
-                topic_stats[topic]["correct"] += 1
-
-            # Difficulty stats
-            if difficulty not in difficulty_stats:
-                difficulty_stats[difficulty] = {"correct": 0, "total": 0}
+    stats = await get_user_stats(ObjectId(user["_id"]))
 
-            difficulty_stats[difficulty]["total"] += 1
-
-            if r.get("isCorrect"):
-                difficulty_stats[difficulty]["correct"] += 1
-
-    # ------------------------------------------------
-    # Topic accuracy
-    # ------------------------------------------------
-    topic_accuracy = {}
-
-    for t, stats in topic_stats.items():
-        topic_accuracy[t] = round(
-            (stats["correct"] / stats["total"]) * 100
-        )
-
-    # ------------------------------------------------
-    # Difficulty strength
-    # ------------------------------------------------
-    difficulty_strength = {}
-
-    for d, stats in difficulty_stats.items():
-        difficulty_strength[d] = round(
-            (stats["correct"] / stats["total"]) * 100
-        )
-
-    # ------------------------------------------------
-    # Weakest & strongest topics
-    # ------------------------------------------------
-    weakest_topic = None
-    strongest_topic = None
-
-    if topic_accuracy:
-        weakest_topic = min(topic_accuracy, key=topic_accuracy.get)
-        strongest_topic = max(topic_accuracy, key=topic_accuracy.get)
-
-    # ------------------------------------------------
-    # Learning velocity
-    # ------------------------------------------------
-    learning_velocity = 0
-
-    if len(accuracies) >= 2:
-        learning_velocity = round(
-            accuracies[0] - accuracies[-1]
-        )
-
-    return {
-        "learning_velocity": learning_velocity,
-        "difficulty_strength": difficulty_strength,
-        "weakest_topic": weakest_topic,
-        "strongest_topic": strongest_topic,
-        "recommended_topic": weakest_topic
-    }
+    return insights_view(stats)
     
 
 @app.get("/progress")
 async def get_user_progress(current_user: dict = Depends(get_current_user)):
 
-    user_id = ObjectId(current_user["_id"])
-
-    cursor = db.test_sessions_collection.find(
-        {
-            "user_id": user_id,
-            "status": "completed"
-        }
-    ).sort("completed_at", 1)
-
-    sessions = await cursor.to_list(length=1000)
-
-    if not sessions:
-        return {
-            "total_tests": 0,
-            "average_accuracy": 0,
-            "best_score": 0,
-            "last_score": 0,
-            "accuracy_history": [],
-            "topic_mastery": {},
-            "improvement_rate": 0
-        }
+    stats = await get_user_stats(ObjectId(current_user["_id"]))
 
-    total_tests = len(sessions)
-
-    accuracies = [s.get("accuracy", 0) for s in sessions]
-
-    average_accuracy = round(sum(accuracies) / total_tests)
-    best_score = max(accuracies)
-    last_score = accuracies[-1]
-
-    improvement_rate = last_score - accuracies[0]
-
-    # -------------------------------
-    # Topic mastery
-    # -------------------------------
-
-    topic_data = {}
-
-    for session in sessions:
-
-        for q in session.get("results", []):
-
-            topic = q.get("topic", "General")
-
-            if topic not in topic_data:
-                topic_data[topic] = {"correct": 0, "total": 0}
-
-            topic_data[topic]["total"] += 1
-
-            if q.get("isCorrect"):
-                topic_data[topic]["correct"] += 1
-
-    topic_mastery = {}
-
-    for topic, data in topic_data.items():
-
-        mastery = (data["correct"] / data["total"]) * 100
-
-        topic_mastery[topic] = round(mastery)
-
-    return {
-        "total_tests": total_tests,
-        "average_accuracy": average_accuracy,
-        "best_score": best_score,
-        "last_score": last_score,
-        "accuracy_history": accuracies,
-        "topic_mastery": topic_mastery,
-        "improvement_rate": improvement_rate
-    }
+    return progress_view(stats)
 
 @app.get("/mock-test", response_model=List[MockQuestionResponse])
 async def get_mock_test(
@@ -1180,24 +1027,18 @@ async def get_mock_test(
     if chapter:
         query["chapter"] = chapter
 
-    cursor = db.questions_collection.aggregate([
-        {"$match": query},
-        {"$sample": {"size": count}}
-    ])
-
-    questions = await cursor.to_list(length=count)
+    questions = await question_bank.sample(
+        count,
+        board=query["board"],
+        subject=query["subject"],
+        class_level=query["class"],
+        chapter=chapter
+    )
 
     if not questions:
         raise HTTPException(status_code=404, detail="No matching questions found")
 
-    return [
-        {
-            "id": str(q["_id"]),
-            "question": q["question"],
-            "options": q["options"]
-        }
-        for q in questions
-    ]
+    return [q.public() for q in questions]
 
 
 # =========================
@@ -1276,18 +1117,22 @@ def generate_session_id(req: ChatRequest) -> str:
         # Fallback — should not happen for web
         return str(id(req))
 
+
+def turn_fingerprint(kind: str, req: ChatRequest) -> str:
+    """Same endpoint and same payload while a turn is in flight = a double tap or a retry."""
+    payload = json.dumps(jsonable_encoder(req), sort_keys=True)
+    return hashlib.sha1(f"{kind}:{payload}".encode("utf-8")).hexdigest()
+
 def get_session_metadata(chat_id: int) -> dict:
     """Get session metadata without exposing internal state"""
-    from app.socratic import chat_states
-    
-    if chat_id not in chat_states:
+    state = session_store.peek(chat_id)
+
+    if state is None:
         return {}
-    
-    state = chat_states[chat_id]
 
-    micro_history = state.get("micro_history", [])
+    micro_history = state.micro_history
 
-    diagnostic_profile = state.get("diagnostic_profile") or {}
+    diagnostic_profile = state.diagnostic_profile or {}
 
 
     latest_misconception = any(
@@ -1295,29 +1140,30 @@ def get_session_metadata(chat_id: int) -> dict:
         for m in micro_history
     ) if micro_history else False
 
-    
+    socratic_active = state.mode == "socratic"
+
     return {
-        "domain": state.get("domain"),
-        "subject": state.get("subject"),
-        "intent": state.get("intent"),
-        "mode": state.get("mode"),
-        "board": state.get("board"),
+        "domain": state.domain,
+        "subject": state.subject,
+        "intent": state.intent,
+        "mode": state.mode,
+        "board": state.board,
 
         # 🔥 Adaptive Metrics
-        "rolling_confidence": state.get("rolling_confidence", 0.5),
-        "discipline_score": state.get("discipline_score", 0.5),
-        "training_mode": state.get("current_training_mode", "guided"),
+        "rolling_confidence": state.rolling_confidence,
+        "discipline_score": state.discipline_score,
+        "training_mode": state.current_training_mode,
         "misconception_recent": latest_misconception,
         "weakness_type": diagnostic_profile.get("weakness_type"),
         
          # 🔥 NEW
-        "mock_active": state.get("mock_active", False),
-        "exam_simulation_active": state.get("exam_simulation_active", False),
-        "question_type": state.get("question_type"),
-        "conversation_length": len(state.get("history", [])),
-        "socratic_active": state.get("mode") == "socratic",
-        "current_step": state.get("socratic", {}).get("current", 0) if state.get("mode") == "socratic" else None,
-        "total_steps": len(state.get("socratic", {}).get("steps", [])) if state.get("mode") == "socratic" else None
+        "mock_active": state.quiz_active,
+        "exam_simulation_active": state.exam_active,
+        "question_type": state.question_type,
+        "conversation_length": len(state.history),
+        "socratic_active": socratic_active,
+        "current_step": state.socratic.current if socratic_active else None,
+        "total_steps": len(state.socratic.steps) if socratic_active else None
     }
 
 
@@ -1328,6 +1174,7 @@ async def start_mock_test(
     subject: str,
     class_level: int,
     chapter: str | None = None,
+    adaptive: bool = True,
     user=Depends(get_current_user)
 ):
 
@@ -1350,20 +1197,18 @@ async def start_mock_test(
     # CREDIT + PLAN CHECK
     # --------------------------------------------------
 
-    user_doc = await db.users_collection.find_one({"_id": user_id})
-
     # Admin bypass
-    if user_doc.get("role") != "admin":
+    if user.get("role") != "admin":
 
         # Free plan restriction
-        if user_doc.get("plan_type") == "free" and user_doc.get("mock_attempts_used", 0) >= 1:
+        if user.get("plan_type") == "free" and user.get("mock_attempts_used", 0) >= 1:
             raise HTTPException(
                 status_code=403,
                 detail="Free plan allows only 1 mock test"
             )
 
         # Check if enough credits exist
-        await check_credits(str(user_id), MOCK_COST)
+        await check_credits(user, MOCK_COST)
 
     print("===== TIME DEBUG =====")
     print("NOW UTC:", now)
@@ -1373,63 +1218,11 @@ async def start_mock_test(
     # ==================================================
     # 1️⃣ CHECK FOR ACTIVE SESSION
     # ==================================================
-    existing_session = await db.test_sessions_collection.find_one({
-        "user_id": user_id,
-        "status": "active"
-    })
+    existing_session = await active_session(user_id)
 
+    # Resume session if still valid
     if existing_session:
-
-        started_at = existing_session["started_at"]
-        duration_seconds = existing_session["duration"]
-
-        now_ts = int(datetime.now(timezone.utc).timestamp())
-
-        if isinstance(started_at, datetime):
-            started_ts = int(started_at.timestamp())
-        else:
-            started_ts = int(started_at)
-
-        elapsed = now_ts - started_ts
-
-        # Resume session if still valid
-        if elapsed < duration_seconds:
-
-            question_ids = existing_session["question_ids"]
-            object_ids = [ObjectId(qid) for qid in question_ids]
-
-            cursor = db.questions_collection.find(
-                {"_id": {"$in": object_ids}}
-            )
-
-            questions = await cursor.to_list(length=len(object_ids))
-
-            question_map = {str(q["_id"]): q for q in questions}
-
-            ordered_questions = []
-            for qid in question_ids:
-                q = question_map.get(qid)
-                if q:
-                    ordered_questions.append({
-                        "id": qid,
-                        "question": q["question"],
-                        "options": q["options"]
-                    })
-
-            return {
-                "session_id": str(existing_session["_id"]),
-                "questions": ordered_questions,
-                "selected_answers": existing_session["selected_answers"],
-                "current_question_index": existing_session["current_question_index"],
-                "duration": duration_seconds,
-                "started_at": int(started_at if isinstance(started_at, int) else started_at.timestamp())           
-                 }
-
-        # Mark expired session
-        await db.test_sessions_collection.update_one(
-            {"_id": existing_session["_id"]},
-            {"$set": {"status": "expired"}}
-        )
+        return await resume_view(existing_session)
 
     # ==================================================
     # 2️⃣ CREATE NEW SESSION
@@ -1444,12 +1237,15 @@ async def start_mock_test(
     if chapter:
         query["chapter"] = chapter
 
-    cursor = db.questions_collection.aggregate([
-        {"$match": query},
-        {"$sample": {"size": count}}
-    ])
-
-    questions = await cursor.to_list(length=count)
+    questions, selection = await assemble_mock(
+        user_id,
+        count,
+        board=query["board"],
+        subject=query["subject"],
+        class_level=query["class"],
+        chapter=chapter,
+        adaptive=adaptive
+    )
 
     if not questions:
         raise HTTPException(
@@ -1457,14 +1253,7 @@ async def start_mock_test(
             detail="No matching questions found"
         )
 
-    question_data = [
-        {
-            "id": str(q["_id"]),
-            "question": q["question"],
-            "options": q["options"]
-        }
-        for q in questions
-    ]
+    question_data = [q.public() for q in questions]
 
     question_ids = [q["id"] for q in question_data]
 
@@ -1478,6 +1267,8 @@ async def start_mock_test(
         "duration": duration_seconds,
         "started_at": int(now.timestamp()),
         "status": "active",
+        "questions": question_data,
+        "selection": selection,
         "created_at": now
     }
 
@@ -1489,7 +1280,8 @@ async def start_mock_test(
         "selected_answers": session_data["selected_answers"],
         "current_question_index": 0,
         "duration": duration_seconds,
-        "started_at": int(now.timestamp())
+        "started_at": int(now.timestamp()),
+        "selection": selection
     }
 
 
@@ -1497,56 +1289,12 @@ async def start_mock_test(
 @app.get("/mock/resume")
 async def resume_mock(user=Depends(get_current_user)):
 
-    user_id = ObjectId(user["_id"])
-
-    existing_session = await db.test_sessions_collection.find_one({
-        "user_id": user_id,
-        "status": "active"
-    })
+    existing_session = await active_session(ObjectId(user["_id"]))
 
     if not existing_session:
         return {"active": False}
 
-    now_ts = int(datetime.now(timezone.utc).timestamp())
-    started_ts = int(existing_session["started_at"])
-    duration = existing_session["duration"]
-
-    elapsed = now_ts - started_ts
-
-    if elapsed >= duration:
-        await db.test_sessions_collection.update_one(
-            {"_id": existing_session["_id"]},
-            {"$set": {"status": "expired"}}
-        )
-        return {"active": False}
-
-    question_ids = existing_session["question_ids"]
-
-    object_ids = [ObjectId(qid) for qid in question_ids]
-    cursor = db.questions_collection.find({"_id": {"$in": object_ids}})
-    questions = await cursor.to_list(length=len(object_ids))
-
-    question_map = {str(q["_id"]): q for q in questions}
-
-    ordered_questions = []
-    for qid in question_ids:
-        q = question_map.get(qid)
-        if q:
-            ordered_questions.append({
-                "id": qid,
-                "question": q["question"],
-                "options": q["options"]
-            })
-
-    return {
-        "active": True,
-        "session_id": str(existing_session["_id"]),
-        "questions": ordered_questions,
-        "selected_answers": existing_session["selected_answers"],
-        "current_question_index": existing_session["current_question_index"],
-        "duration": duration,
-        "started_at": started_ts
-    }
+    return {"active": True, **await resume_view(existing_session)}
 
 
 from pydantic import BaseModel
@@ -1562,21 +1310,16 @@ async def save_answer(
     payload: SaveAnswerRequest,
     user=Depends(get_current_user)
 ):
-    result = await db.test_sessions_collection.update_one(
-        {
-            "_id": ObjectId(payload.session_id),
-            "user_id": ObjectId(user["_id"]),
-            "status": "active"
-        },
-        {
-            "$set": {
-                f"selected_answers.{payload.question_id}": payload.selected_option,
-                "current_question_index": payload.current_index
-            }
-        }
+    # Written now, or with the session's other answers on the next flush (write-behind)
+    saved = await answer_buffer.save(
+        ObjectId(payload.session_id),
+        ObjectId(user["_id"]),
+        payload.question_id,
+        payload.selected_option,
+        payload.current_index
     )
 
-    if result.modified_count == 0:
+    if not saved:
         raise HTTPException(status_code=400, detail="Failed to save answer")
 
     return {"success": True}
@@ -1641,19 +1384,19 @@ def gemini(prompt: str) -> str:
 
 def generate_practice_from_chat(state):
 
-    topic = state.get("last_topic")
+    topic = state.last_topic
 
     if not topic:
         return ChatResponse(
             reply="Tell me the topic you want to practice.",
-            session_id=state["session_id"]
+            session_id=state.session_id
         )
 
     question = generate_practice_question_internal(topic)
 
     return ChatResponse(
         reply=f"Try solving this:\n\n{question}",
-        session_id=state["session_id"]
+        session_id=state.session_id
     )
 
 
@@ -1666,6 +1409,16 @@ async def chat_endpoint(
     background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user)
 ):
+    # The session store loads state before the turn and persists it after,
+    # one turn per session at a time
+    return await session_store.run_turn(
+        generate_session_id(req),
+        turn_fingerprint("chat", req),
+        lambda: chat_turn(req, background_tasks, current_user)
+    )
+
+
+async def chat_turn(req: ChatRequest, background_tasks: BackgroundTasks, current_user: dict):
     try:
         import json
 
@@ -1673,36 +1426,25 @@ async def chat_endpoint(
         session_id = generate_session_id(req)
         state = get_state(session_id)
 
-        if state is None:
-            state = {}
-
-        state["session_id"] = session_id
+        state.session_id = session_id
         user_id = str(current_user["_id"])
-        state["user_id"] = user_id
+        state.user_id = user_id
 
         if req.board:
-            state["board"] = req.board
-
-        state.setdefault("mode", "chat")
-
-        state.setdefault("learning_gate", {
-            "awaiting_attempt": False,
-            "attempt_count": 0,
-            "solution_unlocked": False
-        })
+            state.board = req.board
 
         # ========================= CONTEXT =========================
         if req.topic:
-            state["last_topic"] = req.topic
+            state.last_topic = req.topic
 
         if req.diagnosis:
-            state["diagnosis"] = req.diagnosis
+            state.diagnosis = req.diagnosis
 
         message = (req.message or "").strip()
-        topic = req.topic or state.get("last_topic")
-        diagnosis = state.get("diagnosis", "unknown")
+        topic = req.topic or state.last_topic
+        diagnosis = state.diagnosis or "unknown"
 
-        await check_credits(user_id, CHAT_COST)
+        await check_credits(current_user, CHAT_COST)
 
         # ========================= BASELINE =========================
         if message == "baseline" and req.topic:
@@ -1717,7 +1459,7 @@ async def chat_endpoint(
             except:
                 structured = {}
 
-            await consume_credits(user_id, CHAT_COST, "chat")
+            await consume_credits(current_user, CHAT_COST, "chat")
 
             return ChatResponse(
                 reply="ok",
@@ -1772,7 +1514,7 @@ async def chat_endpoint(
                 except:
                     structured = {}
 
-                await consume_credits(user_id, CHAT_COST, "chat")
+                await consume_credits(current_user, CHAT_COST, "chat")
 
                 return ChatResponse(
                     reply="ok",
@@ -1807,7 +1549,7 @@ async def chat_endpoint(
             else:
                 reply_text = "Let’s continue practicing."
 
-            await consume_credits(user_id, CHAT_COST, "chat")
+            await consume_credits(current_user, CHAT_COST, "chat")
 
             return ChatResponse(
                 reply=reply_text,
@@ -1843,7 +1585,7 @@ async def chat_endpoint(
             except:
                 structured = {}
 
-            await consume_credits(user_id, CHAT_COST, "chat")
+            await consume_credits(current_user, CHAT_COST, "chat")
 
             return ChatResponse(
                 reply="ok",
@@ -1855,7 +1597,7 @@ async def chat_endpoint(
         # ========================= FOLLOWUP =========================
         if message.lower() in ["not sure", "confused", "explain again"]:
 
-            topic = state.get("last_topic")
+            topic = state.last_topic
             if not topic:
                 raise HTTPException(status_code=400, detail="Topic missing")
 
@@ -1866,7 +1608,7 @@ async def chat_endpoint(
             except:
                 structured = {}
 
-            await consume_credits(user_id, CHAT_COST, "chat")
+            await consume_credits(current_user, CHAT_COST, "chat")
 
             return ChatResponse(
                 reply="ok",
@@ -1882,7 +1624,7 @@ async def chat_endpoint(
             board=req.board
         )
 
-        await consume_credits(user_id, CHAT_COST, "chat")
+        await consume_credits(current_user, CHAT_COST, "chat")
 
         return ChatResponse(
             reply=reply_text,
@@ -2143,20 +1885,19 @@ async def problems_endpoint(
     req: ChatRequest,
     current_user: dict = Depends(get_current_user)
 ):
+    return await session_store.run_turn(
+        generate_session_id(req),
+        turn_fingerprint("problems", req),
+        lambda: problems_turn(req, current_user)
+    )
+
+
+async def problems_turn(req: ChatRequest, current_user: dict):
     try:
-        user_id = str(current_user["_id"])
-        await check_credits(user_id, CHAT_COST)
+        await check_credits(current_user, CHAT_COST)
 
         session_id = generate_session_id(req)
-        state = get_state(session_id)
-
-        # ---------- INIT ----------
-        state.setdefault("mode", "problems")
-        state.setdefault("problem", None)
-        state.setdefault("ptype", None)
-        state.setdefault("solved", False)
-        state.setdefault("interaction_count", 0)
-        state.setdefault("last_response", "")
+        practice = get_state(session_id).practice
 
         message = (req.message or "").strip()
 
@@ -2178,24 +1919,24 @@ async def problems_endpoint(
                 return True
             return False
 
-        if is_new_problem(message, state["problem"]):
-            state["problem"] = message
-            state["ptype"] = classify_problem(message)
-            state["interaction_count"] = 0
-            state["solved"] = False
+        if is_new_problem(message, practice.problem):
+            practice.problem = message
+            practice.ptype = classify_problem(message)
+            practice.interaction_count = 0
+            practice.solved = False
 
             # INVALID
-            if state["ptype"] == "invalid":
+            if practice.ptype == "invalid":
                 return ChatResponse(
                     reply="⚠️ Invalid equation. Only one '=' is allowed.",
                     session_id=session_id
                 )
 
             # ARITHMETIC
-            if state["ptype"] == "arithmetic":
+            if practice.ptype == "arithmetic":
                 result = evaluate_arithmetic(message)
                 if result:
-                    await consume_credits(user_id, CHAT_COST, "chat")
+                    await consume_credits(current_user, CHAT_COST, "chat")
                     return ChatResponse(reply=result, session_id=session_id)
 
             # FIRST STEP PROMPT
@@ -2215,18 +1956,18 @@ IMPORTANT:
 """
             )
 
-            state["last_response"] = reply
-            state["interaction_count"] += 1
+            practice.last_response = reply
+            practice.interaction_count += 1
 
-            await consume_credits(user_id, CHAT_COST, "chat")
+            await consume_credits(current_user, CHAT_COST, "chat")
             return ChatResponse(reply=reply, session_id=session_id)
 
         # ---------- CONTEXT ----------
-        step_num = state["interaction_count"]
+        step_num = practice.interaction_count
 
         CONTEXT = f"""
 Problem:
-{state['problem']}
+{practice.problem}
 
 Current step: {step_num}
 
@@ -2242,8 +1983,8 @@ RULES:
         # ---------- INTENTS ----------
 
         if intent == "attempt":
-            if state["ptype"] == "arithmetic":
-                reply = evaluate_arithmetic(state["problem"]) or "⚠️ Couldn't evaluate."
+            if practice.ptype == "arithmetic":
+                reply = evaluate_arithmetic(practice.problem) or "⚠️ Couldn't evaluate."
             else:
                 reply = chat_reply(
                     chat_id=session_id,
@@ -2286,7 +2027,7 @@ Give next step only.
 Solve fully and give final answer.
 """
             )
-            state["solved"] = True
+            practice.solved = True
 
         elif intent == "hint":
             reply = chat_reply(
@@ -2319,7 +2060,7 @@ Explain in simple terms and continue solving.
             )
 
         elif intent == "repeat":
-            reply = state.get("last_response", "Let's continue.")
+            reply = practice.last_response
 
         else:
             reply = chat_reply(
@@ -2341,10 +2082,10 @@ Never restart.
         if not reply or len(reply.strip()) < 5:
             reply = "⚠️ Try rephrasing."
 
-        state["last_response"] = reply
-        state["interaction_count"] += 1
+        practice.last_response = reply
+        practice.interaction_count += 1
 
-        await consume_credits(user_id, CHAT_COST, "chat")
+        await consume_credits(current_user, CHAT_COST, "chat")
 
         return ChatResponse(reply=reply, session_id=session_id)
 
@@ -2394,21 +2135,21 @@ async def learn_endpoint(
     req: ChatRequest,
     current_user: dict = Depends(get_current_user)
 ):
-    try:
-        user_id = str(current_user["_id"])
+    return await session_store.run_turn(
+        generate_session_id(req),
+        turn_fingerprint("learn", req),
+        lambda: learn_turn(req, current_user)
+    )
 
+
+async def learn_turn(req: ChatRequest, current_user: dict):
+    try:
         # 🔥 ALWAYS CHECK CREDIT FIRST
-        await check_credits(user_id, CHAT_COST)
+        await check_credits(current_user, CHAT_COST)
 
         session_id = generate_session_id(req)
         state = get_state(session_id)
-
-        # ---------- INIT ----------
-        state.setdefault("mode", "idle")
-        state.setdefault("step_index", 0)
-        state.setdefault("steps", [])
-        state.setdefault("attempts", {})
-        state.setdefault("concept_check", False)
+        learn = state.learn
 
         message = (req.message or "").strip()
         user_input = message.lower()
@@ -2425,15 +2166,15 @@ async def learn_endpoint(
                         s["input_mode"] = "short"
                         s["options"] = []
 
-            state["mode"] = "learn"
-            state["step_index"] = 0
-            state["steps"] = steps
-            state["attempts"] = {}
-            state["concept_check"] = False
+            state.mode = "learn"
+            learn.step_index = 0
+            learn.steps = steps
+            learn.attempts = {}
+            learn.concept_check = False
 
             step = steps[0]
 
-            await consume_credits(user_id, CHAT_COST, "chat")
+            await consume_credits(current_user, CHAT_COST, "chat")
 
             return ChatResponse(
                 reply=step["question"],
@@ -2445,29 +2186,29 @@ async def learn_endpoint(
             )
 
         # ---------- NORMAL CHAT MODE ----------
-        if state["mode"] != "learn":
+        if state.mode != "learn":
             reply = chat_reply(
                 chat_id=session_id,
                 user_text=message
             )
 
-            await consume_credits(user_id, CHAT_COST, "chat")
+            await consume_credits(current_user, CHAT_COST, "chat")
 
             return ChatResponse(reply=reply, session_id=session_id)
 
-        steps = state["steps"]
-        step_index = state["step_index"]
+        steps = learn.steps
+        step_index = learn.step_index
 
         # ---------- COMPLETED ----------
         if step_index >= len(steps):
-            state["mode"] = "idle"
+            state.mode = "idle"
 
             reply = chat_reply(
                 chat_id=session_id,
                 user_text=message
             )
 
-            await consume_credits(user_id, CHAT_COST, "chat")
+            await consume_credits(current_user, CHAT_COST, "chat")
 
             return ChatResponse(
                 reply=reply or "✅ Completed! Ask anything.",
@@ -2488,7 +2229,7 @@ async def learn_endpoint(
                 user_text=f"Explain simply: {step['question']}"
             )
 
-            await consume_credits(user_id, CHAT_COST, "chat")
+            await consume_credits(current_user, CHAT_COST, "chat")
 
             return ChatResponse(
                 reply=f"🤝 No problem:\n\n{teaching.strip()}\n\nNow try:",
@@ -2496,7 +2237,7 @@ async def learn_endpoint(
             )
 
         if user_input.strip() in garbage or len(user_input) < 2:
-            await consume_credits(user_id, CHAT_COST, "chat")
+            await consume_credits(current_user, CHAT_COST, "chat")
 
             return ChatResponse(
                 reply="⚠️ Give a proper attempt.",
@@ -2505,8 +2246,8 @@ async def learn_endpoint(
 
         # ---------- ATTEMPTS ----------
         key = f"step_{step_index}"
-        state["attempts"][key] = state["attempts"].get(key, 0) + 1
-        attempts = state["attempts"][key]
+        learn.attempts[key] = learn.attempts.get(key, 0) + 1
+        attempts = learn.attempts[key]
 
         # ---------- MCQ ----------
         is_mcq = (
@@ -2519,7 +2260,7 @@ async def learn_endpoint(
             options_lower = [o.lower() for o in options]
 
             if user_input not in options_lower:
-                await consume_credits(user_id, CHAT_COST, "chat")
+                await consume_credits(current_user, CHAT_COST, "chat")
                 return ChatResponse(
                     reply="❌ Choose from options",
                     session_id=session_id,
@@ -2527,17 +2268,17 @@ async def learn_endpoint(
                 )
 
             if user_input == expected:
-                state["step_index"] += 1
-                state["attempts"] = {}
+                learn.step_index += 1
+                learn.attempts = {}
 
-                if state["step_index"] >= len(steps):
-                    state["mode"] = "idle"
-                    await consume_credits(user_id, CHAT_COST, "chat")
+                if learn.step_index >= len(steps):
+                    state.mode = "idle"
+                    await consume_credits(current_user, CHAT_COST, "chat")
                     return ChatResponse(reply="✅ Completed!", session_id=session_id)
 
-                next_step = steps[state["step_index"]]
+                next_step = steps[learn.step_index]
 
-                await consume_credits(user_id, CHAT_COST, "chat")
+                await consume_credits(current_user, CHAT_COST, "chat")
 
                 return ChatResponse(
                     reply=f"✅ Correct\n\nNext:\n{next_step['question']}",
@@ -2548,7 +2289,7 @@ async def learn_endpoint(
                     }
                 )
 
-            await consume_credits(user_id, CHAT_COST, "chat")
+            await consume_credits(current_user, CHAT_COST, "chat")
 
             return ChatResponse(
                 reply="❌ Incorrect. Try again.",
@@ -2560,17 +2301,17 @@ async def learn_endpoint(
         is_correct = any(word in user_input for word in expected.split())
 
         if is_correct:
-            state["step_index"] += 1
-            state["attempts"] = {}
+            learn.step_index += 1
+            learn.attempts = {}
 
-            if state["step_index"] >= len(steps):
-                state["mode"] = "idle"
-                await consume_credits(user_id, CHAT_COST, "chat")
+            if learn.step_index >= len(steps):
+                state.mode = "idle"
+                await consume_credits(current_user, CHAT_COST, "chat")
                 return ChatResponse(reply="✅ Completed!", session_id=session_id)
 
-            next_step = steps[state["step_index"]]
+            next_step = steps[learn.step_index]
 
-            await consume_credits(user_id, CHAT_COST, "chat")
+            await consume_credits(current_user, CHAT_COST, "chat")
 
             return ChatResponse(
                 reply=f"✅ Correct\n\nNext:\n{next_step['question']}",
@@ -2585,10 +2326,10 @@ async def learn_endpoint(
         elif attempts == 3:
             reply = f"📘 Learn this:\n\n{step['expected_answer']}\n\nTry again:"
         else:
-            state["step_index"] += 1
+            learn.step_index += 1
             reply = "➡️ Moving ahead. We'll revisit."
 
-        await consume_credits(user_id, CHAT_COST, "chat")
+        await consume_credits(current_user, CHAT_COST, "chat")
 
         return ChatResponse(reply=reply, session_id=session_id)
 
@@ -3022,12 +2763,11 @@ async def reset_session(req: ResetRequest):
     ```
     """
     try:
-        from app.socratic import chat_states
-        
         if req.session_id:
             session_id = req.session_id
-            if session_id in chat_states:
-                chat_states.pop(session_id)
+            await session_store.load(session_id)
+            if session_store.delete(session_id):
+                await session_store.save(session_id)
                 return ResetResponse(
                     message="Session reset successfully",
                     session_id=session_id
@@ -3039,8 +2779,8 @@ async def reset_session(req: ResetRequest):
                 )
         else:
             # Reset all sessions (use with caution)
-            count = len(chat_states)
-            chat_states.clear()
+            count = session_store.clear()
+            await session_store.flush()
             return ResetResponse(
                 message=f"All {count} sessions reset successfully"
             )
@@ -3058,19 +2798,17 @@ async def reset_session(req: ResetRequest):
 @app.get("/sessions")
 async def list_sessions():
     """List active sessions (for debugging/admin)"""
-    from app.socratic import chat_states
-    
     sessions = []
-    for chat_id, state in chat_states.items():
+    for chat_id, state in session_store.items():
         sessions.append({
             "session_id": chat_id,
-            "board": state.get("board"),
-            "diagnosis":state.get("diagnosis"),
-            "domain": state.get("domain"),
-            "subject": state.get("subject"),
-            "mode": state.get("mode"),
-            "messages": len(state.get("history", [])),
-            "last_active": state.get("last_active").isoformat() if state.get("last_active") else None
+            "board": state.board,
+            "diagnosis": state.diagnosis,
+            "domain": state.domain,
+            "subject": state.subject,
+            "mode": state.mode,
+            "messages": len(state.history),
+            "last_active": state.last_active.isoformat() if state.last_active else None
         })
     
     return {
@@ -3082,10 +2820,9 @@ async def list_sessions():
 @app.delete("/sessions/{session_id}")
 async def delete_session(session_id: int):
     """Delete a specific session"""
-    from app.socratic import chat_states
-    
-    if session_id in chat_states:
-        chat_states.pop(session_id)
+    await session_store.load(session_id)
+    if session_store.delete(session_id):
+        await session_store.save(session_id)
         return {"message": "Session deleted", "session_id": session_id}
     else:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -3103,17 +2840,17 @@ async def chat_stream(
 
     try:
         session_id = generate_session_id(req)
-        user_id = str(current_user["_id"])
 
         # Check credits before generating response
-        await check_credits(user_id, CHAT_COST)
+        await check_credits(current_user, CHAT_COST)
 
         intent = detect_student_intent(req.message)
 
-        if intent == "concept_question":
-            state["last_topic"] = (req.message)
-        
-        else:
+        async with session_store.turn(session_id):
+            if intent == "concept_question":
+                state = get_state(session_id)
+                state.last_topic = (req.message)
+
             reply_text = chat_reply(
                 chat_id=session_id,
                 user_text=req.message,
@@ -3121,10 +2858,8 @@ async def chat_stream(
                 board=req.board
             )
 
-
-
         # Deduct credits AFTER response generation
-        await consume_credits(user_id, CHAT_COST, "chat_stream")
+        await consume_credits(current_user, CHAT_COST, "chat_stream")
 
         async def generate():
             words = reply_text.split()
@@ -3137,6 +2872,9 @@ async def chat_stream(
             media_type="text/plain"
         )
 
+    except SessionBusy:
+        raise
+
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -3158,6 +2896,18 @@ async def http_exception_handler(request, exc):
     )
 
 
+@app.exception_handler(SessionBusy)
+async def session_busy_handler(request, exc):
+    """Overlapping turn for a session that is still answering the previous one"""
+    return JSONResponse(
+        status_code=409,
+        content={
+            "error": "Still answering your previous message, please wait",
+            "status_code": 409
+        }
+    )
+
+
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc):
     """Catch-all exception handler"""
@@ -3177,31 +2927,71 @@ async def general_exception_handler(request, exc):
 @app.get("/debug/session/{session_id}")
 async def debug_session(session_id: int):
     """Get detailed session information for debugging"""
-    from app.socratic import chat_states
-    
-    if session_id not in chat_states:
+    await session_store.load(session_id)
+    state = session_store.peek(session_id)
+
+    if state is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    state = chat_states[session_id]
-    
     return {
         "session_id": session_id,
         "state": {
-            "board": state.get("board"),
-            "domain": state.get("domain"),
-            "subject": state.get("subject"),
-            "intent": state.get("intent"),
-            "mode": state.get("mode"),
-            "last_question": state.get("last_question"),
-            "last_topic": state.get("last_topic"),
-            "history_length": len(state.get("history", [])),
-            "socratic": state.get("socratic") if state.get("mode") == "socratic" else None,
-            "last_active": state.get("last_active").isoformat()
+            "board": state.board,
+            "domain": state.domain,
+            "subject": state.subject,
+            "intent": state.intent,
+            "mode": state.mode,
+            "last_question": state.last_question,
+            "last_topic": state.last_topic,
+            "history_length": len(state.history),
+            "socratic": asdict(state.socratic) if state.mode == "socratic" else None,
+            "last_active": state.last_active.isoformat()
         },
-        "history": state.get("history", [])[-5:]  # Last 5 messages
+        "history": list(state.history)[-5:]  # Last 5 messages
     }
 
 
+@app.get("/admin/rag/status")
+async def vector_store_status(user=Depends(get_current_user)):
+    """Which vector store build is serving retrieval, and how well its result cache hits"""
+    from app.rag import retriever
+
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+
+    return {**retriever.store.info(), "cache": retriever.cache_stats()}
+
+
+@app.post("/admin/rag/reload")
+async def reload_vector_store(user=Depends(get_current_user)):
+    """Swap in a rebuilt vector store without restarting; in-flight queries finish on the old one"""
+    from app.rag.manifest import IndexMismatch
+    from app.rag.retriever import reload_store
+
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+
+    try:
+        # Reading + checksumming the files is blocking work
+        info = await asyncio.to_thread(reload_store)
+    except IndexMismatch as e:
+        raise HTTPException(status_code=409, detail=f"Vector store rejected: {e}")
+
+    return {"status": "reloaded", **info}
+
+
+
+@app.get("/admin/analytics/cohort")
+async def cohort_analytics(days: int = 30, user=Depends(get_current_user)):
+    """Completed mock tests across all students over the last `days` days, aggregated in Mongo"""
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+
+    since = int(time.time()) - max(days, 1) * 86400
+    agg = await cohort_aggregates(since=since)
+
+    return cohort_view(agg, days)
+
 # =========================
 # RUN (for development)
 # =========================
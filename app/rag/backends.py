@@ -0,0 +1,250 @@
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from app.rag.bm25 import tokenize
+
+GEMINI_EMBED_MODEL = "models/gemini-embedding-001"
+
+
+class EmbeddingUnavailable(Exception):
+    """Raised when a backend cannot produce embeddings right now."""
+
+
+# ======================================================
+# INTERFACE
+# ======================================================
+class EmbeddingBackend:
+    """
+    Turns texts into float32 vectors. Each backend lives in its own vector
+    space, so every backend is paired with its own FAISS index.
+    """
+
+    name = "base"
+    model = None
+    dim = None
+
+    def available(self) -> bool:
+        return True
+
+    def embed(self, texts) -> np.ndarray:
+        """Return a (len(texts), dim) float32 array or raise EmbeddingUnavailable."""
+        raise NotImplementedError
+
+
+# ======================================================
+# GEMINI (network)
+# ======================================================
+class GeminiBackend(EmbeddingBackend):
+
+    name = "gemini"
+
+    def __init__(
+        self,
+        model: str = GEMINI_EMBED_MODEL,
+        api_key: str = None,
+        timeout: float = 3.0,
+        cooldown: float = 30.0,
+    ):
+        self.model = model
+        self.api_key = api_key if api_key is not None else os.getenv("GEMINI_API_KEY")
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self.down_until = 0.0
+        self.pool = ThreadPoolExecutor(max_workers=4)
+        self.client = None
+        self.client_lock = threading.Lock()
+
+    def available(self) -> bool:
+        return bool(self.api_key) and time.monotonic() >= self.down_until
+
+    def _client(self):
+        # Our own client with our key, rather than the SDK's global configuration
+        with self.client_lock:
+            if self.client is None:
+                from google.ai import generativelanguage as glm
+                self.client = glm.GenerativeServiceClient(client_options={"api_key": self.api_key})
+            return self.client
+
+    def _call(self, content):
+        import google.generativeai as genai
+
+        result = genai.embed_content(model=self.model, content=content, client=self._client())
+        vecs = np.array(result["embedding"], dtype="float32")
+        return vecs.reshape(1, -1) if vecs.ndim == 1 else vecs
+
+    def embed(self, texts) -> np.ndarray:
+        texts = list(texts)
+
+        if not self.available():
+            raise EmbeddingUnavailable("Gemini embeddings disabled or cooling down")
+
+        try:
+            # One string -> one embedding; a list -> one batched call
+            content = texts[0] if len(texts) == 1 else texts
+            vecs = self.pool.submit(self._call, content).result(timeout=self.timeout)
+
+        except FutureTimeout:
+            self.down_until = time.monotonic() + self.cooldown
+            raise EmbeddingUnavailable(f"Embedding timed out after {self.timeout}s")
+
+        except Exception as e:
+            self.down_until = time.monotonic() + self.cooldown
+            raise EmbeddingUnavailable(str(e))
+
+        if vecs.shape[0] != len(texts):
+            raise EmbeddingUnavailable(f"Expected {len(texts)} embeddings, got {vecs.shape[0]}")
+
+        self.dim = vecs.shape[1]
+        return vecs
+
+
+# ======================================================
+# LOCAL (CPU only): hashed TF-IDF + truncated SVD
+# ======================================================
+class LocalBackend(EmbeddingBackend):
+    """
+    Unigrams and bigrams are hashed into `n_features` buckets, weighted by
+    sublinear TF x IDF, and projected to `dim` dimensions with a truncated
+    SVD learned from our own corpus. No network, ~1 ms per query.
+    """
+
+    name = "local"
+    model = "local-hashed-tfidf-svd"
+
+    def __init__(self, idf: np.ndarray, components: np.ndarray):
+        self.idf = idf.astype("float32")                  # (n_features,)
+        self.components = components.astype("float32")    # (n_features, dim)
+        self.n_features = len(idf)
+        self.dim = components.shape[1]
+
+    # --------------------------------------------------
+    # FEATURES
+    # --------------------------------------------------
+    @staticmethod
+    def hashed_counts(text: str, n_features: int):
+        tokens = tokenize(text)
+        features = tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+
+        counts = {}
+        for feature in features:
+            col = zlib.crc32(feature.encode("utf-8")) % n_features
+            counts[col] = counts.get(col, 0) + 1
+
+        cols = np.fromiter(counts.keys(), dtype="int64", count=len(counts))
+        tf = 1 + np.log(np.fromiter(counts.values(), dtype="float32", count=len(counts)))
+        return cols, tf
+
+    @classmethod
+    def to_csr(cls, texts, n_features: int):
+        indptr = [0]
+        indices = []
+        data = []
+
+        for text in texts:
+            cols, tf = cls.hashed_counts(text, n_features)
+            indices.append(cols)
+            data.append(tf)
+            indptr.append(indptr[-1] + len(cols))
+
+        return (
+            np.asarray(indptr, dtype="int64"),
+            np.concatenate(indices) if indices else np.zeros(0, dtype="int64"),
+            np.concatenate(data).astype("float32") if data else np.zeros(0, dtype="float32"),
+        )
+
+    @staticmethod
+    def _normalize_rows(rows, data, n: int):
+        norms = np.sqrt(np.maximum(np.bincount(rows, weights=data ** 2, minlength=n), 1e-12))
+        return (data / norms[rows]).astype("float32")
+
+    # --------------------------------------------------
+    # TRAINING
+    # --------------------------------------------------
+    @staticmethod
+    def _nnz_blocks(indptr, block: int = 200000):
+        """Slices over the non-zeros so temporaries stay bounded on big corpora."""
+        nnz = int(indptr[-1])
+        for start in range(0, nnz, block):
+            yield slice(start, min(start + block, nnz))
+
+    @classmethod
+    def fit(cls, texts, dim: int = 256, n_features: int = 2 ** 14, oversample: int = 16, seed: int = 0):
+        """Learn IDF weights and an SVD projection from the corpus texts."""
+        texts = list(texts)
+        n = len(texts)
+        indptr, indices, data = cls.to_csr(texts, n_features)
+
+        df = np.bincount(indices, minlength=n_features).astype("float32")
+        idf = np.log((1 + n) / (1 + df)) + 1
+
+        rows = np.repeat(np.arange(n), np.diff(indptr))
+        data = cls._normalize_rows(rows, data * idf[indices], n)
+
+        # Randomized SVD (Halko et al.) using only sparse products
+        rank = min(dim, n, n_features)
+        width = min(rank + oversample, n, n_features)
+        rng = np.random.default_rng(seed)
+
+        omega = rng.standard_normal((n_features, width)).astype("float32")
+        y = np.zeros((n, width), dtype="float32")
+        for sl in cls._nnz_blocks(indptr):
+            np.add.at(y, rows[sl], data[sl, None] * omega[indices[sl]])     # X @ omega
+
+        q, _ = np.linalg.qr(y)
+        bt = np.zeros((n_features, q.shape[1]), dtype="float32")
+        for sl in cls._nnz_blocks(indptr):
+            np.add.at(bt, indices[sl], data[sl, None] * q[rows[sl]])        # X.T @ q
+
+        _, _, vt = np.linalg.svd(bt.T, full_matrices=False)
+        components = np.zeros((n_features, dim), dtype="float32")
+        components[:, :rank] = vt[:rank].T
+
+        return cls(idf, components)
+
+    # --------------------------------------------------
+    # INFERENCE
+    # --------------------------------------------------
+    def embed(self, texts) -> np.ndarray:
+        texts = list(texts)
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+
+        for row, text in enumerate(texts):
+            cols, tf = self.hashed_counts(text, self.n_features)
+            if len(cols) == 0:
+                continue
+
+            weights = tf * self.idf[cols]
+            weights /= max(float(np.linalg.norm(weights)), 1e-12)
+            out[row] = weights @ self.components[cols]
+
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+    # --------------------------------------------------
+    # PERSISTENCE
+    # --------------------------------------------------
+    def save(self, path: Path):
+        np.savez(path, idf=self.idf, components=self.components)
+
+    @classmethod
+    def load(cls, path: Path):
+        data = np.load(path, allow_pickle=False)
+        return cls(data["idf"], data["components"])
+
+
+def load_local_backend(path: Path):
+    path = Path(path)
+    if not path.exists():
+        return None
+
+    try:
+        return LocalBackend.load(path)
+    except Exception as e:
+        print("⚠️ Failed to load local embedding model:", str(e))
+        return None
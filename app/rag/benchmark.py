@@ -0,0 +1,247 @@
+from pathlib import Path
+from difflib import SequenceMatcher
+import argparse
+import hashlib
+import json
+import time
+
+import numpy as np
+
+from app.rag.bm25 import BM25Index, rrf_fuse, tokenize
+from app.rag.chunker import DATA_PATH, build_chunks
+from app.rag.quantize import ENCODINGS, build_index
+
+ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+SEED_DIR = ROOT_DIR / "seed_data"
+
+CHUNK_CONFIGS = [
+    {"max_tokens": 120, "overlap": 20},
+    {"max_tokens": 180, "overlap": 30},
+    {"max_tokens": 300, "overlap": 50},
+]
+
+
+# ======================================================
+# DETERMINISTIC EMBEDDING STUB
+# ======================================================
+class StubEmbedder:
+    """
+    Offline stand-in for the Gemini embedding API: signed feature hashing of
+    unigrams and bigrams, L2-normalised. Same text -> same vector on every
+    machine, no network needed.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _bucket(self, feature: str):
+        h = int.from_bytes(hashlib.md5(feature.encode("utf-8")).digest()[:8], "little")
+        return h % self.dim, 1.0 if (h >> 63) & 1 else -1.0
+
+    def embed(self, texts):
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+            for feature in features:
+                col, sign = self._bucket(feature)
+                out[row, col] += sign
+
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-6)
+
+
+# ======================================================
+# LABELLED QUERIES (seed_data question -> chapter)
+# ======================================================
+def load_queries(subject: str = "Maths", class_level: int = 10, limit: int = None):
+    queries = []
+
+    for path in sorted(SEED_DIR.glob("*/*.json")):
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except Exception as e:
+            print(f"⚠️ Skipping {path.name}: {e}")
+            continue
+
+        for q in data:
+            if q.get("subject") == subject and q.get("class") == class_level and q.get("chapter"):
+                queries.append({"question": q["question"], "chapter": q["chapter"]})
+
+    return queries[:limit] if limit else queries
+
+
+def normalize_title(title: str):
+    return " ".join(tokenize(title))
+
+
+def chapter_matches(seed_chapter: str, chunk_chapter: str) -> bool:
+    """Textbook headings carry typos ("Aritmetic Progressions"), so match loosely."""
+    a, b = normalize_title(seed_chapter), normalize_title(chunk_chapter)
+    return bool(a) and (a in b or SequenceMatcher(None, a, b).ratio() >= 0.75)
+
+
+def relevance_matrix(queries, chunks):
+    """bool (n_queries, n_chunks): does chunk j belong to query i's chapter?"""
+    chapters = sorted({q["chapter"] for q in queries})
+    chunk_chapters = [c.get("chapter", "") for c in chunks]
+
+    per_chapter = {
+        ch: np.array([chapter_matches(ch, cc) for cc in chunk_chapters], dtype=bool)
+        for ch in chapters
+    }
+
+    return np.stack([per_chapter[q["chapter"]] for q in queries])
+
+
+# ======================================================
+# METRICS
+# ======================================================
+def score_rankings(rankings, relevant, k: int):
+    hits = 0
+    reciprocal = 0.0
+
+    for row, ranking in enumerate(rankings):
+        ranking = [int(i) for i in ranking if i >= 0]
+
+        for rank, doc_id in enumerate(ranking):
+            if relevant[row, doc_id]:
+                reciprocal += 1.0 / (rank + 1)
+                if rank < k:
+                    hits += 1
+                break
+
+    n = max(len(rankings), 1)
+    return {f"recall@{k}": round(hits / n, 4), "mrr": round(reciprocal / n, 4)}
+
+
+def timed_search(search_one, queries):
+    """Run `search_one` per query; returns (rankings, p50_ms, p95_ms)."""
+    rankings = []
+    latencies = []
+
+    for q in queries:
+        t0 = time.perf_counter()
+        rankings.append(search_one(q))
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    return rankings, round(float(np.percentile(latencies, 50)), 3), round(float(np.percentile(latencies, 95)), 3)
+
+
+# ======================================================
+# BENCHMARK
+# ======================================================
+def run_benchmark(
+    subject: str = "Maths",
+    class_level: int = 10,
+    data_path: Path = DATA_PATH,
+    k: int = 5,
+    depth: int = 40,
+    chunk_configs=CHUNK_CONFIGS,
+    encodings=ENCODINGS,
+    embedder=None,
+    limit: int = None,
+):
+    """
+    For each chunking config, build BM25 and every index encoding over the
+    textbook, then score the labelled seed questions. Embeddings come from
+    `embedder` (default: the offline StubEmbedder).
+    """
+    embedder = embedder or StubEmbedder()
+    queries = load_queries(subject, class_level, limit)
+
+    if not queries:
+        raise ValueError(f"No labelled queries for {subject} class {class_level}")
+
+    texts = [q["question"] for q in queries]
+    q_vecs = embedder.embed(texts)
+
+    report = []
+
+    for config in chunk_configs:
+        chunks = build_chunks(data_path, **config)
+        relevant = relevance_matrix(queries, chunks)
+        label = f"{config['max_tokens']}/{config['overlap']}"
+
+        if not relevant.any():
+            print(f"⚠️ No chunk chapters match the seed chapters for config {label}")
+
+        t0 = time.perf_counter()
+        vectors = embedder.embed([c["text"] for c in chunks])
+        embed_seconds = time.perf_counter() - t0
+
+        # Lexical baseline
+        t0 = time.perf_counter()
+        bm25 = BM25Index.build([c["text"] for c in chunks])
+        build_seconds = time.perf_counter() - t0
+
+        bm25_rankings, p50, p95 = timed_search(
+            lambda q: [i for i, _ in bm25.search(q, depth)], texts
+        )
+        report.append({
+            "chunks": label, "n_chunks": len(chunks), "index": "bm25",
+            **score_rankings(bm25_rankings, relevant, k),
+            "p50_ms": p50, "p95_ms": p95, "build_s": round(build_seconds, 3)
+        })
+
+        for encoding in encodings:
+            t0 = time.perf_counter()
+            index = build_index(vectors, encoding)
+            build_seconds = time.perf_counter() - t0
+
+            vec_rankings, p50, p95 = timed_search(
+                lambda i: index.search(q_vecs[i:i + 1], depth)[1][0], range(len(texts))
+            )
+            report.append({
+                "chunks": label, "n_chunks": len(chunks), "index": encoding,
+                **score_rankings(vec_rankings, relevant, k),
+                "p50_ms": p50, "p95_ms": p95,
+                "build_s": round(build_seconds + embed_seconds, 3)
+            })
+
+            hybrid, p50, p95 = timed_search(
+                lambda i: rrf_fuse([
+                    [int(j) for j in index.search(q_vecs[i:i + 1], depth)[1][0] if j >= 0],
+                    [j for j, _ in bm25.search(texts[i], depth)]
+                ]),
+                range(len(texts))
+            )
+            report.append({
+                "chunks": label, "n_chunks": len(chunks), "index": f"{encoding}+bm25",
+                **score_rankings(hybrid, relevant, k),
+                "p50_ms": p50, "p95_ms": p95,
+                "build_s": round(build_seconds + embed_seconds, 3)
+            })
+
+    return report
+
+
+def print_report(report):
+    for row in report:
+        print(" | ".join(f"{key}={value}" for key, value in row.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark")
+    parser.add_argument("--subject", default="Maths")
+    parser.add_argument("--class-level", type=int, default=10)
+    parser.add_argument("--data", default=str(DATA_PATH))
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    result = run_benchmark(
+        subject=args.subject,
+        class_level=args.class_level,
+        data_path=Path(args.data),
+        k=args.k,
+        limit=args.limit,
+    )
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
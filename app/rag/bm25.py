@@ -0,0 +1,163 @@
+from pathlib import Path
+from collections import Counter
+import json
+import math
+import re
+
+import numpy as np
+
+# ======================================================
+# TOKENIZER
+# ======================================================
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = {
+    "the", "is", "a", "an", "of", "and", "to", "in", "that", "it",
+    "as", "for", "on", "with", "this", "are", "be", "by", "or", "at",
+    "from", "we", "what", "which", "how", "why", "can", "do", "does",
+    "i", "me", "my", "you", "your", "its", "was", "were", "will", "if",
+    "then", "so", "such", "these", "those", "there", "has", "have", "also"
+}
+
+
+def tokenize(text: str):
+    return [
+        t for t in TOKEN_RE.findall((text or "").lower())
+        if t not in STOPWORDS
+    ]
+
+
+# ======================================================
+# BM25 INVERTED INDEX
+# ======================================================
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index of chunk texts.
+    Doc ids are positions in the chunk metadata list (same ids as FAISS).
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}          # term -> (doc_ids int32[], tfs float32[])
+        self.idf = {}
+        self.doc_len = np.zeros(0, dtype="float32")
+        self.avgdl = 0.0
+
+    @property
+    def size(self):
+        return len(self.doc_len)
+
+    @classmethod
+    def build(cls, texts, **kwargs):
+        index = cls(**kwargs)
+
+        raw_postings = {}
+        doc_len = []
+
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_len.append(len(tokens))
+
+            for term, tf in Counter(tokens).items():
+                raw_postings.setdefault(term, ([], []))
+                raw_postings[term][0].append(doc_id)
+                raw_postings[term][1].append(tf)
+
+        index._finalize(raw_postings, doc_len)
+        return index
+
+    def _finalize(self, raw_postings, doc_len):
+        self.doc_len = np.asarray(doc_len, dtype="float32")
+        self.avgdl = float(self.doc_len.mean()) if len(doc_len) else 0.0
+
+        n = len(doc_len)
+        self.postings = {}
+        self.idf = {}
+
+        for term, (ids, tfs) in raw_postings.items():
+            self.postings[term] = (
+                np.asarray(ids, dtype="int32"),
+                np.asarray(tfs, dtype="float32")
+            )
+            df = len(ids)
+            self.idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def scores(self, query: str):
+        """Dense BM25 score vector over all documents."""
+        scores = np.zeros(self.size, dtype="float32")
+
+        if not self.size:
+            return scores
+
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len / max(self.avgdl, 1e-6))
+
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+
+            ids, tfs = posting
+            scores[ids] += self.idf[term] * tfs * (self.k1 + 1) / (tfs + norm[ids])
+
+        return scores
+
+    def search(self, query: str, top_k: int = 10):
+        """Return [(doc_id, score), ...] for the best matching documents."""
+        scores = self.scores(query)
+
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) == 0:
+            return []
+
+        if len(hits) > top_k:
+            hits = hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]]
+
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(int(i), float(scores[i])) for i in hits]
+
+    # --------------------------------------------------
+    # PERSISTENCE
+    # --------------------------------------------------
+    def save(self, path: Path):
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "doc_len": self.doc_len.astype(int).tolist(),
+            "postings": {
+                term: [ids.tolist(), tfs.astype(int).tolist()]
+                for term, (ids, tfs) in self.postings.items()
+            }
+        }
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path: Path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        index = cls(k1=data["k1"], b=data["b"])
+        index._finalize(
+            {term: (ids, tfs) for term, (ids, tfs) in data["postings"].items()},
+            data["doc_len"]
+        )
+        return index
+
+
+# ======================================================
+# RECIPROCAL RANK FUSION
+# ======================================================
+def rrf_fuse(rankings, k: int = 60):
+    """
+    Fuse several ranked lists of doc ids with reciprocal-rank fusion.
+    Returns doc ids ordered by fused score.
+    """
+    fused = {}
+
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+
+    return sorted(fused, key=lambda d: fused[d], reverse=True)
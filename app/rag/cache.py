@@ -0,0 +1,91 @@
+from collections import OrderedDict
+import re
+import threading
+import time
+import unicodedata
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Case, whitespace and trailing punctuation do not change what we retrieve."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return _SPACE_RE.sub(" ", text).strip().rstrip("?.! ")
+
+
+class RetrievalCache:
+    """
+    Thread-safe LRU with a TTL, for final retrieval results.
+
+    Keys carry the vector store's index id, so a reload to a new build never
+    serves results from the old one; `clear()` on reload just frees memory.
+    """
+
+    def __init__(self, maxsize: int = 2048, ttl: float = 900.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()    # key -> (expires_at, results)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(index_id: str, question: str, top_k: int):
+        return (index_id, normalize_question(question), top_k)
+
+    def get(self, key):
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._data.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, results = entry
+
+            if expires_at <= now:
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+
+        # Callers may append to the list; the chunk dicts are shared read-only
+        return list(results)
+
+    def put(self, key, results):
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, list(results))
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
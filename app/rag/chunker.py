@@ -1,7 +1,24 @@
 from pathlib import Path
 import re
 
-DATA_PATH = Path("data\class10\maths.txt")
+ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+DATA_PATH = ROOT_DIR / "data" / "class10" / "maths.txt"
+
+# Bump whenever chunk boundaries or metadata change (recorded with each index)
+CHUNKER_VERSION = 2
+
+CHUNK_TOKENS = 180
+OVERLAP_TOKENS = 30
+
+# Shorter leftovers at a heading are page furniture ("REAL NUMBERS 1 1 R N"), not content
+MIN_CHUNK_TOKENS = 12
+
+RULE_RE = re.compile(r"^=+$")
+# Tolerates typos seen in the source texts ("chaper 13 : Statistics")
+CHAPTER_RE = re.compile(r"^chap\w*\s*(\d+)\s*[:.\-]?\s*([A-Za-z][^,;()]{0,60})?$", re.IGNORECASE)
+SECTION_RE = re.compile(r"^(\d+)\.(\d+)\s+([A-Z].{2,80})$")
+CLASS_DIR_RE = re.compile(r"class\s*(\d+)", re.IGNORECASE)
+
 
 def clean_para(p: str) -> str:
     low = p.lower()
@@ -17,101 +34,189 @@ def clean_para(p: str) -> str:
     return p
 
 
-def split_by_chapter(text: str):
+def clean_title(title: str) -> str:
+    title = re.sub(r"\s+", " ", title).strip(" :-")
+    return title.title() if title.isupper() or title.islower() else title
+
+
+def infer_source(path: Path):
+    """data/class10/maths.txt -> ("10", "maths")"""
+    match = CLASS_DIR_RE.search(path.parent.name)
+    class_level = match.group(1) if match else path.parent.name
+    return class_level, path.stem.lower()
+
+
+# ======================================================
+# HEADING DETECTION (streaming)
+# ======================================================
+def iter_events(lines):
     """
-    Splits text by CHAPTER headings.
-    Assumes headings like: CHAPTER 1: REAL NUMBERS
+    Turn raw lines into ("chapter", (number, title)), ("section", (number, title))
+    and ("text", line) events, one line at a time.
+
+    Chapter headings are either "CHAPTER n: TITLE" or a bare title fenced by
+    ===== rule lines; sections look like "4.2 Quadratic Equations".
     """
-    pattern = re.compile(r"(CHAPTER\s+\d+[:\s].*)", re.IGNORECASE)
-    parts = pattern.split(text)
+    after_rule = False
+    pending = None
+
+    for raw in lines:
+        line = raw.strip()
+
+        if not line:
+            continue
+
+        if RULE_RE.match(line):
+            if pending is not None:
+                yield ("chapter", parse_chapter(pending))
+                pending = None
+                after_rule = False
+            else:
+                after_rule = True
+            continue
+
+        if after_rule:
+            pending = line
+            after_rule = False
+            continue
 
-    chapters = []
-    for i in range(1, len(parts), 2):
-        title = parts[i].strip()
-        content = parts[i + 1].strip()
-        chapters.append((title, content))
+        if pending is not None:
+            # Single rule line, not a fenced heading — treat as text
+            yield from text_or_heading(pending)
+            pending = None
 
-    return chapters
+        yield from text_or_heading(line)
 
+    if pending is not None:
+        yield from text_or_heading(pending)
 
-def chunk_chapter(chapter_title: str, content: str):
-    paragraphs = [
-        clean_para(p.strip())
-        for p in content.split("\n\n")
-        if clean_para(p.strip())
-    ]
 
-    chunks = []
-    buffer = []
-    buffer_len = 0
+def parse_chapter(line: str):
+    match = CHAPTER_RE.match(line)
 
-    for para in paragraphs:
-        buffer.append(para)
-        buffer_len += len(para.split())
+    if match:
+        return int(match.group(1)), clean_title(match.group(2) or "")
 
-        if buffer_len >= 180:
-            chunks.append(" ".join(buffer))
-            buffer = []
-            buffer_len = 0
+    return None, clean_title(line)
 
-    if buffer:
-        chunks.append(" ".join(buffer))
 
-    return chunks
+def text_or_heading(line: str):
+    if CHAPTER_RE.match(line):
+        yield ("chapter", parse_chapter(line))
+        return
 
+    match = SECTION_RE.match(line)
+    if match:
+        yield ("section", (int(match.group(1)), clean_title(match.group(3))))
+        return
 
-def build_chunks():
-    raw_text = DATA_PATH.read_text(encoding="utf-8", errors="ignore")
+    cleaned = clean_para(line)
+    if cleaned:
+        yield ("text", cleaned)
 
-    # 🔑 split by SINGLE newline, not double
-    lines = [
-        clean_para(line.strip())
-        for line in raw_text.splitlines()
-        if clean_para(line.strip())
-    ]
 
-    all_chunks = []
-    buffer = []
-    buffer_len = 0
-    part = 1
+# ======================================================
+# CHUNKING
+# ======================================================
+def iter_chunks(
+    path: Path = DATA_PATH,
+    class_level: str = None,
+    subject: str = None,
+    max_tokens: int = CHUNK_TOKENS,
+    overlap: int = OVERLAP_TOKENS,
+):
+    """
+    Stream `path` line by line and yield overlapping chunks of at most
+    `max_tokens` words, labelled with the chapter and section they come from.
+    Memory stays bounded by one chunk regardless of file size.
+    """
+    path = Path(path)
+    inferred_class, inferred_subject = infer_source(path)
+    class_level = class_level or inferred_class
+    subject = subject or inferred_subject
+
+    overlap = min(overlap, max_tokens - 1)
+
+    chapter_no = None
+    chapter = f"Class {class_level} {subject.title()}"
+    topic = None
+    part = 0
+
+    words = []
+    fresh = 0   # words in `words` not yet emitted in any chunk
+
+    def worth_flushing():
+        # A short tail after a full chunk is real content; a short chunk on its own is not
+        return fresh >= MIN_CHUNK_TOKENS or (fresh > 0 and len(words) > fresh)
+
+    def make_chunk(chunk_words):
+        nonlocal part
+        part += 1
+        return {
+            "class": class_level,
+            "subject": subject,
+            "chapter": chapter,
+            "chapter_no": chapter_no,
+            "topic": topic or f"Part {part}",
+            "part": part,
+            "text": " ".join(chunk_words)
+        }
 
-    for line in lines:
-        buffer.append(line)
-        buffer_len += len(line.split())
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for kind, value in iter_events(f):
 
-        if buffer_len >= 180:
-            all_chunks.append({
-                "class": "10",
-                "subject": "maths",
-                "chapter": "Class 10 Maths",
-                "topic": f"Part {part}",
-                "text": " ".join(buffer)
-            })
-            buffer = []
-            buffer_len = 0
-            part += 1
+            if kind == "text":
+                line_words = value.split()
+                words.extend(line_words)
+                fresh += len(line_words)
 
-    if buffer:
-        all_chunks.append({
-            "class": "10",
-            "subject": "maths",
-            "chapter": "Class 10 Maths",
-            "topic": f"Part {part}",
-            "text": " ".join(buffer)
-        })
+                while len(words) >= max_tokens:
+                    yield make_chunk(words[:max_tokens])
+                    words = words[max_tokens - overlap:]
+                    fresh = max(0, len(words) - overlap)
+                continue
 
-    return all_chunks
+            # Heading: close the current chunk, no overlap across boundaries
+            if worth_flushing():
+                yield make_chunk(words)
+            words = []
+            fresh = 0
+
+            number, title = value
+
+            if kind == "chapter":
+                chapter_no = number
+                chapter = title
+                topic = None
+                part = 0
+            else:
+                if chapter_no is None:
+                    chapter_no = number
+                topic = title
+
+    if worth_flushing():
+        yield make_chunk(words)
+
+
+def build_chunks(path: Path = DATA_PATH, **kwargs):
+    return list(iter_chunks(path, **kwargs))
 
 
 
 
 if __name__ == "__main__":
-    chunks = build_chunks()
-    print(f"Total chunks created: {len(chunks)}")
+    total = 0
+    first = None
+
+    for chunk in iter_chunks():
+        total += 1
+        first = first or chunk
+
+    print(f"Total chunks created: {total}")
 
     # Print sample
     print("\n--- SAMPLE CHUNK ---\n")
-    if chunks:
-        print(chunks[0])
+    if first:
+        print(first)
     else:
-        print("⚠️ No chunks created")
\ No newline at end of file
+        print("⚠️ No chunks created")
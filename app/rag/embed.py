@@ -1,78 +1,351 @@
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
 import json
-import faiss
-from google import genai
-from dotenv import load_dotenv
 import os
+import random
+import threading
+import time
+
+import faiss
 import numpy as np
+from dotenv import load_dotenv
 
 load_dotenv()
 
+from app.rag.backends import GEMINI_EMBED_MODEL, LocalBackend
+from app.rag.bm25 import BM25Index
+from app.rag.chunker import CHUNKER_VERSION, build_chunks
+from app.rag.manifest import build_manifest, publish
+from app.rag.quantize import build_index, index_memory_bytes
+from app.rag.tags import compute_tags, save_tags
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+VECTOR_DIR = ROOT_DIR / "vectorstore"
+
+INDEX_PATH = VECTOR_DIR / "class10_maths.index"
+META_PATH = VECTOR_DIR / "class10_maths_meta.json"
+EMBEDDINGS_PATH = VECTOR_DIR / "class10_maths_vectors.f32"
+BM25_PATH = VECTOR_DIR / "class10_maths_bm25.json"
+TAGS_PATH = VECTOR_DIR / "class10_maths_tags.npz"
+LOCAL_MODEL_PATH = VECTOR_DIR / "class10_maths_local_model.npz"
+LOCAL_INDEX_PATH = VECTOR_DIR / "class10_maths_local.index"
 
-print("CWD:", os.getcwd())
-print("GEMINI_API_KEY =", os.getenv("GEMINI_API_KEY"))
+# Everything is built here first, then moved into VECTOR_DIR with its manifest
+STAGING_DIR = VECTOR_DIR / ".staging"
+
+# Must be the model the retriever queries with (checked via the manifest)
+EMBED_MODEL = GEMINI_EMBED_MODEL
+
+# Optional HTTP endpoint (e.g. a local fake embedding server in tests).
+# It must accept {"model": ..., "texts": [...]} and reply {"embeddings": [[...], ...]}
+EMBED_ENDPOINT = os.getenv("EMBED_ENDPOINT")
+
+BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+MAX_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+REQUESTS_PER_MINUTE = float(os.getenv("EMBED_RPM", "60"))
+MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+
+# flat | fp16 | sq8 | pq  (see app/rag/quantize.py; compare with `python -m app.rag.quantize`)
+INDEX_ENCODING = os.getenv("INDEX_ENCODING", "flat")
+
+# "gemini" embeds remotely and also builds the local fallback;
+# "local" builds only the CPU-only backend (no API key needed)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "gemini")
+LOCAL_EMBED_DIM = int(os.getenv("LOCAL_EMBED_DIM", "256"))
 
-from chunker import build_chunks
 
 # -----------------------------
-# CONFIG
+# RATE LIMITER
+# -----------------------------
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+
+                wait = (tokens - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+# -----------------------------
+# BATCH EMBEDDERS
+# -----------------------------
+_genai_client = None
+
+
+def gemini_embed_batch(batch):
+    global _genai_client
+
+    if _genai_client is None:
+        from google import genai
+        _genai_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+
+    response = _genai_client.models.embed_content(
+        model=EMBED_MODEL,
+        contents=batch
+    )
+
+    return [e.values for e in response.embeddings]
+
+
+def http_embed_batch(batch):
+    import httpx
+
+    response = httpx.post(
+        EMBED_ENDPOINT,
+        json={"model": EMBED_MODEL, "texts": batch},
+        timeout=60
+    )
+    response.raise_for_status()
+
+    return response.json()["embeddings"]
+
+
+def default_embed_batch():
+    return http_embed_batch if EMBED_ENDPOINT else gemini_embed_batch
+
+
 # -----------------------------
-INDEX_PATH = Path("vectorstore/class10_maths.index")
-META_PATH = Path("vectorstore/class10_maths_meta.json")
+# CHECKPOINT
+# -----------------------------
+def texts_fingerprint(texts, batch_size):
+    h = hashlib.sha256(str(batch_size).encode())
+    for t in texts:
+        h.update(t.encode("utf-8", errors="ignore"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def load_checkpoint(path: Path, fingerprint: str):
+    if not path.exists():
+        return None
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except Exception as e:
+        print("⚠️ Ignoring unreadable checkpoint:", str(e))
+        return None
+
+    if checkpoint.get("fingerprint") != fingerprint:
+        print("⚠️ Checkpoint belongs to different texts — starting over")
+        return None
 
+    return checkpoint
 
 
+def save_checkpoint(path: Path, checkpoint: dict):
+    tmp = path.with_suffix(path.suffix + ".tmp")
 
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
 
+    os.replace(tmp, path)
 
-client = genai.Client(
-    api_key=os.getenv("GEMINI_API_KEY")
-)
 
 # -----------------------------
-# EMBEDDING FUNCTION
+# EMBEDDING PIPELINE
 # -----------------------------
-def embed_texts(texts, batch_size=100):
-    all_embeddings = []
+def embed_with_retry(embed_batch, batch, bucket: TokenBucket, max_retries: int):
+    for attempt in range(max_retries + 1):
+        bucket.acquire()
+
+        try:
+            vectors = embed_batch(batch)
+
+            if len(vectors) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+
+            return vectors
+
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+
+            delay = min(60, 2 ** attempt) * (0.5 + random.random())
+            print(f"⚠️ Embedding batch failed ({e}) — retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def embed_texts(
+    texts,
+    out_path: Path = EMBEDDINGS_PATH,
+    batch_size: int = BATCH_SIZE,
+    concurrency: int = MAX_CONCURRENCY,
+    requests_per_minute: float = REQUESTS_PER_MINUTE,
+    max_retries: int = MAX_RETRIES,
+    embed_batch=None,
+):
+    """
+    Embed `texts` into a float32 memmap at `out_path` (shape: len(texts) x dim).
+
+    Batches run concurrently (bounded by `concurrency`) behind a token-bucket
+    rate limit. Every finished batch is flushed and recorded in
+    `<out_path>.progress.json`, so a rerun after a crash only embeds what is missing.
+    """
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    progress_path = out_path.with_name(out_path.name + ".progress.json")
+
+    embed_batch = embed_batch or default_embed_batch()
+    bucket = TokenBucket(rate=requests_per_minute / 60, capacity=max(1, concurrency))
+
+    n = len(texts)
+    if n == 0:
+        raise ValueError("No texts to embed")
+
+    batches = [(start, texts[start:start + batch_size]) for start in range(0, n, batch_size)]
+    fingerprint = texts_fingerprint(texts, batch_size)
+
+    checkpoint = load_checkpoint(progress_path, fingerprint)
+
+    if checkpoint and out_path.exists():
+        dim = checkpoint["dim"]
+        matrix = np.memmap(out_path, dtype="float32", mode="r+", shape=(n, dim))
+        done = set(checkpoint["done"])
+        print(f"♻️ Resuming: {len(done)}/{len(batches)} batches already embedded")
+    else:
+        # First batch runs alone so we learn the embedding dimension
+        start, batch = batches[0]
+        first = np.asarray(embed_with_retry(embed_batch, batch, bucket, max_retries), dtype="float32")
+        dim = first.shape[1]
+
+        matrix = np.memmap(out_path, dtype="float32", mode="w+", shape=(n, dim))
+        matrix[start:start + len(batch)] = first
+        matrix.flush()
+
+        done = {start}
+        checkpoint = {"fingerprint": fingerprint, "n": n, "dim": dim, "done": sorted(done)}
+        save_checkpoint(progress_path, checkpoint)
 
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i + batch_size]
-        print(f"Embedding batch {i // batch_size + 1} ({len(batch)} items)")
+    pending = [(start, batch) for start, batch in batches if start not in done]
+    lock = threading.Lock()
 
-        response = client.models.embed_content(
-            model="models/text-embedding-004",
-            contents=batch
-        )
+    def run(start, batch):
+        vectors = np.asarray(embed_with_retry(embed_batch, batch, bucket, max_retries), dtype="float32")
 
-        all_embeddings.extend([e.values for e in response.embeddings])
+        if vectors.shape[1] != dim:
+            raise ValueError(f"Embedding dimension changed: {vectors.shape[1]} != {dim}")
 
-    return all_embeddings
+        with lock:
+            matrix[start:start + len(batch)] = vectors
+            matrix.flush()
+            done.add(start)
+            checkpoint["done"] = sorted(done)
+            save_checkpoint(progress_path, checkpoint)
+
+        return start
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [pool.submit(run, start, batch) for start, batch in pending]
+
+        for future in as_completed(futures):
+            start = future.result()
+            print(f"Embedded batch {start // batch_size + 1}/{len(batches)} ({len(done)} done)")
+
+    return matrix
 
 
 # -----------------------------
 # MAIN
 # -----------------------------
+def staged(path: Path) -> Path:
+    return STAGING_DIR / path.name
+
+
+def build_local_index(texts):
+    """Fit the CPU-only backend on the corpus and index the chunks with it."""
+    backend = LocalBackend.fit(texts, dim=LOCAL_EMBED_DIM)
+    index = build_index(backend.embed(texts), "flat")
+
+    backend.save(staged(LOCAL_MODEL_PATH))
+    faiss.write_index(index, str(staged(LOCAL_INDEX_PATH)))
+
+    return {
+        "model": backend.model,
+        "dim": backend.dim,
+        "index_file": LOCAL_INDEX_PATH.name,
+        "encoding": "flat",
+    }
+
+
 def main():
     chunks = build_chunks()
     texts = [c["text"] for c in chunks]
 
-    print(f"Embedding {len(texts)} chunks...")
+    STAGING_DIR.mkdir(parents=True, exist_ok=True)
 
-    embeddings = embed_texts(texts)
+    files = [META_PATH, BM25_PATH, TAGS_PATH, LOCAL_MODEL_PATH, LOCAL_INDEX_PATH]
+    spaces = {}
 
-    dim = len(embeddings[0])
-    index = faiss.IndexFlatL2(dim)
-    embedding_matrix = np.array(embeddings).astype("float32")
-    index.add(embedding_matrix)
-    INDEX_PATH.parent.mkdir(exist_ok=True)
-    faiss.write_index(index, str(INDEX_PATH))
+    if EMBED_BACKEND != "local":
+        print(f"Embedding {len(texts)} chunks...")
 
-    with open(META_PATH, "w", encoding="utf-8") as f:
+        # Checkpointed in the staging dir, so a crashed run resumes there
+        embedding_matrix = embed_texts(texts, out_path=staged(EMBEDDINGS_PATH))
+
+        # Full-precision vectors stay on disk for re-ranking quantized indexes
+        index = build_index(embedding_matrix, INDEX_ENCODING)
+        print(f"Index encoding: {INDEX_ENCODING} ({index_memory_bytes(index) / 1e6:.1f} MB)")
+
+        faiss.write_index(index, str(staged(INDEX_PATH)))
+
+        files += [INDEX_PATH, EMBEDDINGS_PATH]
+        spaces["gemini"] = {
+            "model": EMBED_MODEL,
+            "dim": index.d,
+            "index_file": INDEX_PATH.name,
+            "encoding": INDEX_ENCODING,
+        }
+
+    # CPU-only vector space: primary with EMBED_BACKEND=local, fallback otherwise
+    spaces["local"] = build_local_index(texts)
+
+    with open(staged(META_PATH), "w", encoding="utf-8") as f:
         json.dump(chunks, f, ensure_ascii=False, indent=2)
 
+    # Lexical index over the same chunk ids as FAISS
+    BM25Index.build(texts).save(staged(BM25_PATH))
+
+    # Topic bitset per chunk id, used for filtered search
+    save_tags(staged(TAGS_PATH), compute_tags(chunks))
+
+    manifest = build_manifest(
+        STAGING_DIR,
+        [p.name for p in files],
+        spaces,
+        chunker_version=CHUNKER_VERSION,
+        chunks=len(chunks),
+    )
+
+    # Atomic renames: a running server keeps its open files until it reloads
+    publish(STAGING_DIR, VECTOR_DIR, manifest)
+
     print("✅ Embeddings stored successfully")
-    print(f"Index: {INDEX_PATH}")
-    print(f"Metadata: {META_PATH}")
+    print(f"Index id: {manifest['index_id']}")
+    for name in manifest["files"]:
+        print(f"  {VECTOR_DIR / name}")
+    print("Reload a running server with POST /admin/rag/reload")
 
 if __name__ == "__main__":
     main()
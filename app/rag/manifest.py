@@ -0,0 +1,172 @@
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+VECTOR_DIR = ROOT_DIR / "vectorstore"
+
+MANIFEST_NAME = "class10_maths_manifest.json"
+MANIFEST_VERSION = 1
+
+
+class IndexMismatch(Exception):
+    """The vector store on disk does not match what the retriever queries with."""
+
+
+# ======================================================
+# CHECKSUMS
+# ======================================================
+def file_checksum(path: Path, block: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+# ======================================================
+# BUILD / WRITE / LOAD
+# ======================================================
+def build_manifest(directory: Path, files, spaces: dict, chunker_version, chunks: int) -> dict:
+    """
+    `files` are names inside `directory`; `spaces` maps a backend name to
+    {"model", "dim", "index_file", ...} describing the vector space it was
+    built in. The index id changes whenever any file's content does.
+    """
+    directory = Path(directory)
+    checksums = {name: file_checksum(directory / name) for name in sorted(files)}
+
+    index_id = hashlib.sha256(
+        json.dumps([checksums, spaces], sort_keys=True).encode("utf-8")
+    ).hexdigest()[:16]
+
+    return {
+        "version": MANIFEST_VERSION,
+        "index_id": index_id,
+        "created_at": int(time.time()),
+        "chunker_version": chunker_version,
+        "chunks": chunks,
+        "spaces": spaces,
+        "files": checksums,
+    }
+
+
+def write_manifest(directory: Path, manifest: dict):
+    path = Path(directory) / MANIFEST_NAME
+    tmp = path.with_suffix(path.suffix + ".tmp")
+
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    os.replace(tmp, path)
+
+
+def load_manifest(directory: Path):
+    path = Path(directory) / MANIFEST_NAME
+
+    if not path.exists():
+        return None
+
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def publish(staging_dir: Path, directory: Path, manifest: dict):
+    """
+    Move freshly built files from `staging_dir` into `directory`, manifest
+    last. Each os.replace is atomic, and a reader that lands between two of
+    them sees checksums that do not match the old manifest and refuses the
+    store instead of mixing generations.
+    """
+    staging_dir, directory = Path(staging_dir), Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    for name in manifest["files"]:
+        os.replace(staging_dir / name, directory / name)
+
+    write_manifest(directory, manifest)
+
+
+# ======================================================
+# VALIDATION
+# ======================================================
+def verify_files(directory: Path, manifest: dict):
+    """Every file listed in the manifest must exist with the recorded checksum."""
+    directory = Path(directory)
+
+    for name, expected in manifest.get("files", {}).items():
+        path = directory / name
+
+        if not path.exists():
+            raise IndexMismatch(f"{name} listed in manifest but missing")
+
+        if file_checksum(path) != expected:
+            raise IndexMismatch(f"{name} checksum does not match manifest")
+
+
+def check_space(manifest: dict, name: str, model: str, dim: int):
+    """Refuse an index built with a different embedding model or dimension."""
+    spec = manifest.get("spaces", {}).get(name)
+
+    if spec is None:
+        raise IndexMismatch(f"Manifest has no '{name}' vector space")
+
+    if spec.get("model") != model:
+        raise IndexMismatch(
+            f"'{name}' index was embedded with {spec.get('model')}, queries use {model}"
+        )
+
+    if spec.get("dim") != dim:
+        raise IndexMismatch(f"'{name}' index has dim {dim}, manifest says {spec.get('dim')}")
+
+
+if __name__ == "__main__":
+    # Stamp a store built before manifests existed (e.g. by build_index.py):
+    #   python -m app.rag.manifest stamp --model models/gemini-embedding-001
+    #   python -m app.rag.manifest check
+    import faiss
+
+    parser = argparse.ArgumentParser(description="Vector store manifest")
+    parser.add_argument("command", choices=["stamp", "check"])
+    parser.add_argument("--dir", default=str(VECTOR_DIR))
+    parser.add_argument("--model", default="models/gemini-embedding-001")
+    parser.add_argument("--index", default="class10_maths.index")
+    parser.add_argument("--meta", default="class10_maths_meta.json")
+    # Stores built by build_index.py do not come from the chunker at all
+    parser.add_argument("--chunker-version", type=int, default=None)
+    args = parser.parse_args()
+
+    directory = Path(args.dir)
+
+    if args.command == "check":
+        manifest = load_manifest(directory)
+        if manifest is None:
+            print(f"⚠️ No manifest in {directory}")
+            sys.exit(1)
+        try:
+            verify_files(directory, manifest)
+        except IndexMismatch as e:
+            print("❌", str(e))
+            sys.exit(1)
+        print(f"✅ {manifest['index_id']}: {json.dumps(manifest['spaces'])}")
+        sys.exit(0)
+
+    index = faiss.read_index(str(directory / args.index))
+    with open(directory / args.meta, "r", encoding="utf-8") as f:
+        chunks = len(json.load(f))
+
+    manifest = build_manifest(
+        directory,
+        [args.index, args.meta],
+        {"gemini": {"model": args.model, "dim": index.d, "index_file": args.index, "encoding": "flat"}},
+        chunker_version=args.chunker_version,
+        chunks=chunks,
+    )
+    write_manifest(directory, manifest)
+    print(f"✅ Manifest written: {manifest['index_id']}")
@@ -0,0 +1,182 @@
+from pathlib import Path
+import math
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+# ======================================================
+# ENCODINGS
+# ======================================================
+# flat : float32, 4 bytes / dim (exact)
+# fp16 : float16, 2 bytes / dim
+# sq8  : 8-bit scalar quantization, 1 byte / dim
+# pq   : product quantization, `pq_m` bytes / vector
+ENCODINGS = ("flat", "fp16", "sq8", "pq")
+
+ADD_BATCH = 10000
+
+
+def default_pq_m(dim: int, target: int = 96) -> int:
+    """Largest divisor of `dim` not above `target` (PQ needs m | dim)."""
+    for m in range(min(target, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def build_index(vectors, encoding: str = "flat", pq_m: int = None):
+    """
+    Build a FAISS index over `vectors` (any float32 array or memmap) using the
+    given encoding. Vectors are added in slices so a memmap is never fully
+    loaded.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}', expected one of {ENCODINGS}")
+
+    n, dim = vectors.shape
+
+    if encoding == "flat":
+        index = faiss.IndexFlatL2(dim)
+
+    elif encoding == "fp16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+
+    elif encoding == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+
+    else:
+        m = pq_m or default_pq_m(dim)
+        # k-means wants ~39 points per centroid; shrink the codebook for small corpora
+        nbits = max(1, min(8, int(math.log2(max(n // 39, 2)))))
+        index = faiss.IndexPQ(dim, m, nbits, faiss.METRIC_L2)
+
+    if not index.is_trained:
+        sample = sample_rows(vectors, 50000)
+        index.train(sample)
+
+    for start in range(0, n, ADD_BATCH):
+        index.add(np.ascontiguousarray(vectors[start:start + ADD_BATCH], dtype="float32"))
+
+    return index
+
+
+def sample_rows(vectors, limit: int, seed: int = 0):
+    n = vectors.shape[0]
+
+    if n <= limit:
+        return np.ascontiguousarray(vectors, dtype="float32")
+
+    rows = np.sort(np.random.default_rng(seed).choice(n, limit, replace=False))
+    return np.ascontiguousarray(vectors[rows], dtype="float32")
+
+
+def index_memory_bytes(index) -> int:
+    return int(faiss.serialize_index(index).nbytes)
+
+
+# ======================================================
+# FULL-PRECISION RE-RANKING
+# ======================================================
+def open_full_vectors(path: Path, dim: int):
+    """Read-only memmap over the float32 vectors written by embed.py."""
+    path = Path(path)
+    if not path.exists():
+        return None
+
+    n = path.stat().st_size // (4 * dim)
+    return np.memmap(path, dtype="float32", mode="r", shape=(n, dim))
+
+
+def rerank(q_vecs, candidate_ids, full_vectors, k: int):
+    """
+    Re-order approximate candidates by exact L2 distance against the
+    full-precision vectors. `candidate_ids` is the (nq, c) id matrix from
+    index.search; returns an (nq, k) id matrix padded with -1.
+    """
+    out = np.full((len(q_vecs), k), -1, dtype="int64")
+
+    for row, (q, ids) in enumerate(zip(q_vecs, candidate_ids)):
+        ids = np.sort(ids[(ids >= 0) & (ids < len(full_vectors))])
+        if len(ids) == 0:
+            continue
+
+        # Sorted ids keep memmap reads sequential
+        exact = np.asarray(full_vectors[ids], dtype="float32")
+        dist = ((exact - q) ** 2).sum(axis=1)
+
+        best = ids[np.argsort(dist, kind="stable")[:k]]
+        out[row, :len(best)] = best
+
+    return out
+
+
+# ======================================================
+# EVALUATION
+# ======================================================
+def recall_at_k(index, vectors, queries, k: int = 10, full_vectors=None, rerank_factor: int = 4):
+    """Fraction of the exact top-k neighbours that `index` returns."""
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    for start in range(0, vectors.shape[0], ADD_BATCH):
+        exact.add(np.ascontiguousarray(vectors[start:start + ADD_BATCH], dtype="float32"))
+
+    _, truth = exact.search(queries, k)
+
+    if full_vectors is not None:
+        _, candidates = index.search(queries, k * rerank_factor)
+        found = rerank(queries, candidates, full_vectors, k)
+    else:
+        _, found = index.search(queries, k)
+
+    hits = sum(len(set(t[t >= 0]) & set(f[f >= 0])) for t, f in zip(truth, found))
+    return hits / float(truth.size)
+
+
+def compare_encodings(vectors, k: int = 10, n_queries: int = 200, encodings=ENCODINGS, pq_m: int = None):
+    """
+    Build every encoding over `vectors` and report memory and recall@k, using
+    a sample of the stored vectors (slightly perturbed) as queries.
+    """
+    rng = np.random.default_rng(1)
+    queries = sample_rows(vectors, n_queries, seed=1)
+    queries = queries + rng.normal(0, queries.std() * 0.05, queries.shape).astype("float32")
+    k = min(k, vectors.shape[0])
+
+    report = []
+
+    for encoding in encodings:
+        t0 = time.perf_counter()
+        index = build_index(vectors, encoding, pq_m=pq_m)
+        build_seconds = time.perf_counter() - t0
+
+        size = index_memory_bytes(index)
+
+        report.append({
+            "encoding": encoding,
+            "memory_bytes": size,
+            "bytes_per_vector": round(size / max(vectors.shape[0], 1), 1),
+            f"recall@{k}": round(recall_at_k(index, vectors, queries, k), 4),
+            f"recall@{k}_reranked": round(recall_at_k(index, vectors, queries, k, full_vectors=vectors), 4),
+            "build_seconds": round(build_seconds, 3)
+        })
+
+    return report
+
+
+if __name__ == "__main__":
+    # python -m app.rag.quantize [vectors.f32] [dim]
+    from app.rag.benchmark import print_report
+    from app.rag.embed import EMBEDDINGS_PATH
+
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else EMBEDDINGS_PATH
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else int(os.getenv("EMBED_DIM", "3072"))
+
+    vectors = open_full_vectors(path, dim)
+    if vectors is None:
+        print(f"⚠️ No vectors at {path} — run app.rag.embed first")
+        sys.exit(1)
+
+    print(f"Comparing encodings over {vectors.shape[0]} x {dim} vectors\n")
+    print_report(compare_encodings(vectors))
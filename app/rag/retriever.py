@@ -1,9 +1,21 @@
 from pathlib import Path
 import json
-import numpy as np
-import google.generativeai as genai
+import threading
 import os
 
+from app.rag.backends import (
+    GEMINI_EMBED_MODEL,
+    EmbeddingUnavailable,
+    GeminiBackend,
+    LocalBackend,
+    load_local_backend,
+)
+from app.rag.bm25 import BM25Index, rrf_fuse
+from app.rag.cache import RetrievalCache
+from app.rag.manifest import IndexMismatch, check_space, load_manifest, verify_files
+from app.rag.quantize import open_full_vectors, rerank
+from app.rag.tags import compute_tags, load_tags, matching_ids, partition_by_tags, query_tag_mask
+
 # Try importing faiss safely
 try:
     import faiss
@@ -20,111 +32,515 @@ API_KEY = os.getenv("GEMINI_API_KEY")
 if not API_KEY:
     print("⚠️ GEMINI_API_KEY missing — embedding disabled")
 
-genai.configure(api_key=API_KEY)
-
 # ======================================================
 # CONFIG
 # ======================================================
 ROOT_DIR = Path.cwd()
 
 VECTOR_DIR = ROOT_DIR / "vectorstore"
-INDEX_PATH = VECTOR_DIR / "class10_maths.index"
-META_PATH = VECTOR_DIR / "class10_maths_meta.json"
+INDEX_FILE = "class10_maths.index"
+META_FILE = "class10_maths_meta.json"
+BM25_FILE = "class10_maths_bm25.json"
+TAGS_FILE = "class10_maths_tags.npz"
+VECTORS_FILE = "class10_maths_vectors.f32"
+LOCAL_INDEX_FILE = "class10_maths_local.index"
+LOCAL_MODEL_FILE = "class10_maths_local_model.npz"
+
+# Must match the "gemini" space in the vector store manifest
+EMBED_MODEL = GEMINI_EMBED_MODEL
+
+# Primary embedding backend: "gemini" (network) or "local" (CPU only).
+# With "gemini", the local backend is the automatic fallback when the API fails.
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "gemini")
+
+# Past this, the query is answered lexically instead of waiting on the API
+EMBED_TIMEOUT_SECONDS = float(os.getenv("EMBED_TIMEOUT_SECONDS", "3"))
+
+# After a failed/slow embedding call, skip the API for this long (lexical only)
+EMBED_COOLDOWN_SECONDS = float(os.getenv("EMBED_COOLDOWN_SECONDS", "30"))
+
+# "hybrid" (BM25 + vectors) or "lexical" (BM25 only, never calls the API)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+
+CANDIDATE_K = 40
 
-EMBED_MODEL = "models/gemini-embedding-001"
+# Quantized indexes (fp16/sq8/pq) over-fetch this many times and re-rank
+# against the full-precision vectors on disk
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR", "4"))
+
+# Final results per (index id, normalized question, top_k); 0 disables
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "2048"))
+RETRIEVAL_CACHE_TTL_SECONDS = float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "900"))
 
 # ======================================================
-# LOAD VECTOR STORE SAFELY
+# VECTOR STORE
 # ======================================================
-index = None
-metadata = []
+class VectorStore:
+    """
+    Everything one build of the vector store needs to answer queries:
+    chunk metadata, BM25, topic tags and one vector space per embedding
+    backend. Loaded completely before it is published, never mutated after.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.manifest = None
+        self.index_id = "unversioned"
+        self.metadata = []
+        self.bm25 = None
+        self.chunk_tags = None
+        self.spaces = []
+        self.refused = []
+
+    @property
+    def ready(self) -> bool:
+        return len(self.metadata) > 0 and (bool(self.spaces) or self.bm25 is not None)
+
+    def info(self) -> dict:
+        return {
+            "index_id": self.index_id,
+            "chunks": len(self.metadata),
+            "spaces": [
+                {"backend": sp["backend"].name, "model": sp["backend"].model, "dim": sp["index"].d}
+                for sp in self.spaces
+            ],
+            "lexical": self.bm25 is not None,
+            "refused": self.refused,
+        }
+
+    # --------------------------------------------------
+    # LOADING
+    # --------------------------------------------------
+    @classmethod
+    def load(cls, directory: Path = VECTOR_DIR, strict: bool = False):
+        """
+        Build a store from `directory`. Files must match their manifest
+        checksums; a vector space whose model or dimension disagrees with the
+        backend that would query it is refused (IndexMismatch when `strict`,
+        dropped with a warning otherwise).
+        """
+        store = cls(directory)
+        path = store.directory
+
+        if not (path / META_FILE).exists():
+            print("⚠️ Vector store not found — fallback mode active")
+            return store
+
+        store.manifest = load_manifest(path)
 
-if FAISS_AVAILABLE and INDEX_PATH.exists() and META_PATH.exists():
-    try:
-        index = faiss.read_index(str(INDEX_PATH))
+        if store.manifest is not None:
+            verify_files(path, store.manifest)
+            store.index_id = store.manifest["index_id"]
+        else:
+            print("⚠️ No vector store manifest — embedding model/dimension unchecked")
+
+        with open(path / META_FILE, "r", encoding="utf-8") as f:
+            store.metadata = json.load(f)
+
+        if store.manifest is not None and store.manifest.get("chunks") != len(store.metadata):
+            raise IndexMismatch(
+                f"Metadata has {len(store.metadata)} chunks, manifest says {store.manifest.get('chunks')}"
+            )
+
+        store._load_lexical()
+        store._load_tags()
+
+        if FAISS_AVAILABLE:
+            store._load_spaces(strict)
+
+        return store
+
+    def _load_lexical(self):
+        texts = [m["text"] for m in self.metadata]
+
+        try:
+            if (self.directory / BM25_FILE).exists():
+                self.bm25 = BM25Index.load(self.directory / BM25_FILE)
+            else:
+                self.bm25 = BM25Index.build(texts)
+
+            if self.bm25.size != len(self.metadata):
+                print("⚠️ BM25 index out of sync with metadata — rebuilding")
+                self.bm25 = BM25Index.build(texts)
+
+        except Exception as e:
+            print("⚠️ Failed to load BM25 index:", str(e))
+            self.bm25 = None
+
+    def _load_tags(self):
+        # uint64 topic bitset per chunk id
+        try:
+            if (self.directory / TAGS_FILE).exists():
+                self.chunk_tags = load_tags(self.directory / TAGS_FILE)
+
+            if self.chunk_tags is None or len(self.chunk_tags) != len(self.metadata):
+                self.chunk_tags = compute_tags(self.metadata)
+
+        except Exception as e:
+            print("⚠️ Failed to load chunk tags:", str(e))
+            self.chunk_tags = None
+
+    def _accept(self, name: str, model: str, space_index, strict: bool) -> bool:
+        if space_index.ntotal != len(self.metadata):
+            problem = f"'{name}' index has {space_index.ntotal} vectors for {len(self.metadata)} chunks"
+        elif self.manifest is None:
+            return True
+        else:
+            try:
+                check_space(self.manifest, name, model, space_index.d)
+                return True
+            except IndexMismatch as e:
+                problem = str(e)
 
-        with open(META_PATH, "r", encoding="utf-8") as f:
-            metadata = json.load(f)
+        if strict:
+            raise IndexMismatch(problem)
 
-        print("✅ FAISS index loaded successfully")
+        print("⚠️ Refusing vector space:", problem)
+        self.refused.append(problem)
+        return False
+
+    def _load_spaces(self, strict: bool):
+        # Each backend has its own vector space, so it is paired with its own
+        # index (and full-precision vectors for re-ranking, when quantized).
+        if EMBED_BACKEND != "local" and (self.directory / INDEX_FILE).exists():
+            try:
+                index = faiss.read_index(str(self.directory / INDEX_FILE))
+
+                if self._accept("gemini", EMBED_MODEL, index, strict):
+                    self.spaces.append({
+                        "backend": gemini_backend,
+                        "index": index,
+                        "full_vectors": self._open_full_vectors(index)
+                    })
+                    print("✅ FAISS index loaded successfully")
+
+            except IndexMismatch:
+                raise
+            except Exception as e:
+                print("⚠️ Failed to load FAISS:", str(e))
+
+        try:
+            backend = load_local_backend(self.directory / LOCAL_MODEL_FILE)
+            local_index = None
+
+            if backend is not None and (self.directory / LOCAL_INDEX_FILE).exists():
+                local_index = faiss.read_index(str(self.directory / LOCAL_INDEX_FILE))
+
+            if local_index is None or local_index.ntotal != len(self.metadata):
+                # Older vector stores predate the local backend: fit it in memory
+                texts = [m["text"] for m in self.metadata]
+                backend = LocalBackend.fit(texts)
+                local_index = faiss.IndexFlatL2(backend.dim)
+                local_index.add(backend.embed(texts))
+
+            elif not self._accept("local", backend.model, local_index, strict):
+                return
+
+            self.spaces.append({"backend": backend, "index": local_index, "full_vectors": None})
+
+        except IndexMismatch:
+            raise
+        except Exception as e:
+            print("⚠️ Failed to prepare local embeddings:", str(e))
+
+    def _open_full_vectors(self, index):
+        # Only quantized indexes need re-ranking
+        if isinstance(index, faiss.IndexFlat):
+            return None
+
+        try:
+            vectors = open_full_vectors(self.directory / VECTORS_FILE, index.d)
+
+            if vectors is not None and len(vectors) != index.ntotal:
+                print("⚠️ Full-precision vectors out of sync with index — re-ranking disabled")
+                return None
+
+            return vectors
+
+        except Exception as e:
+            print("⚠️ Failed to open full-precision vectors:", str(e))
+            return None
 
-    except Exception as e:
-        print("⚠️ Failed to load FAISS:", str(e))
-else:
-    print("⚠️ Vector store not found — fallback mode active")
 
 # ======================================================
-# EMBEDDING FUNCTION
+# EMBEDDING BACKENDS
 # ======================================================
-def embed_query(text: str):
-    if not API_KEY:
-        return None
-
-    try:
-        result = genai.embed_content(
-            model=EMBED_MODEL,
-            content=text
-        )
-        vec = np.array(result["embedding"], dtype="float32").reshape(1, -1)
-        return vec
-
-    except Exception as e:
-        print("⚠️ Embedding failed:", str(e))
-        return None
+# Shared by every store generation so cooldown state survives a reload
+gemini_backend = GeminiBackend(
+    model=EMBED_MODEL,
+    api_key=API_KEY,
+    timeout=EMBED_TIMEOUT_SECONDS,
+    cooldown=EMBED_COOLDOWN_SECONDS
+)
+
+# ======================================================
+# RESULT CACHE
+# ======================================================
+result_cache = RetrievalCache(maxsize=RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL_SECONDS)
+
+
+def cacheable(current: VectorStore, route) -> bool:
+    """
+    Only cache what the primary route produced. A fallback answer (local
+    space or BM25 while the API is down) would otherwise outlive the outage.
+    """
+    if RETRIEVAL_MODE == "lexical":
+        return route == "lexical"
+    return bool(current.spaces) and route is current.spaces[0]
+
+
+def cache_stats() -> dict:
+    return result_cache.stats()
+
+# ======================================================
+# LOAD + HOT RELOAD
+# ======================================================
+# Requests read `store` once and keep that generation for the whole query;
+# a reload builds the next generation off to the side and swaps the
+# reference in one assignment, so there is no gap and no mixed state.
+_reload_lock = threading.Lock()
+
+try:
+    store = VectorStore.load(VECTOR_DIR)
+except Exception as e:
+    print("⚠️ Failed to load vector store:", str(e))
+    store = VectorStore(VECTOR_DIR)
+
+
+def reload_store(directory: Path = VECTOR_DIR) -> dict:
+    """
+    Load a rebuilt vector store and atomically make it current. Raises
+    IndexMismatch (leaving the current store serving) if the new build does
+    not validate.
+    """
+    global store
+
+    with _reload_lock:
+        fresh = VectorStore.load(directory, strict=True)
+
+        if not fresh.ready:
+            raise IndexMismatch(f"No usable vector store in {directory}")
+
+        previous = store.index_id
+        store = fresh
+
+        # Keys already carry the index id; this only drops the dead generation
+        result_cache.clear()
+
+    print(f"✅ Vector store reloaded: {previous} -> {fresh.index_id}")
+    return fresh.info()
+
+
+def embed_queries(texts, current: VectorStore = None):
+    """
+    Embed several queries in one call with the first backend that answers.
+    Returns (vectors, space) or (None, None) when every backend is down.
+    """
+    current = current or store
+    texts = list(texts)
+
+    for space in current.spaces:
+        backend = space["backend"]
+
+        if not backend.available():
+            continue
+
+        try:
+            vecs = backend.embed(texts)
+        except EmbeddingUnavailable as e:
+            print(f"⚠️ {backend.name} embedding failed:", str(e))
+            continue
+
+        if vecs.shape[1] != space["index"].d:
+            # Wrong model behind the backend: never search another model's space
+            print(f"⚠️ {backend.name} returned dim {vecs.shape[1]}, index has {space['index'].d}")
+            continue
+
+        return vecs, space
+
+    return None, None
+
+
+def embed_query(text: str, current: VectorStore = None):
+    return embed_queries([text], current)
 
 # ======================================================
 # RETRIEVER
 # ======================================================
+def lexical_search(question: str, k: int = CANDIDATE_K, current: VectorStore = None):
+    current = current or store
+    if current.bm25 is None:
+        return []
+    return [doc_id for doc_id, _ in current.bm25.search(question, k)]
+
+
+def search_ids(space, q_vecs, k: int, params=None):
+    """index.search returning only ids, re-ranked at full precision when available."""
+    space_index = space["index"]
+    space_vectors = space["full_vectors"]
+    fetch = k * RERANK_FACTOR if space_vectors is not None else k
+
+    if params is not None:
+        _, ids = space_index.search(q_vecs, fetch, params=params)
+    else:
+        _, ids = space_index.search(q_vecs, fetch)
+
+    if space_vectors is not None:
+        ids = rerank(q_vecs, ids, space_vectors, k)
+
+    return ids
+
+
+def vector_search(space, q_vec, k: int = CANDIDATE_K, allowed_ids=None):
+    """
+    FAISS search. When `allowed_ids` is given, an ID selector restricts the
+    scan to those chunks so other chapters are never scored.
+    """
+    if allowed_ids is not None and len(allowed_ids) > 0:
+        try:
+            params = faiss.SearchParameters()
+            params.sel = faiss.IDSelectorBatch(allowed_ids)
+            return search_ids(space, q_vec, min(k, len(allowed_ids)), params=params)
+        except (AttributeError, TypeError, RuntimeError) as e:
+            # Older FAISS builds / index types without selector support
+            print("⚠️ Filtered search unavailable, scanning all:", str(e))
+
+    return search_ids(space, q_vec, k)
+
+
 def retrieve(question: str, top_k: int = 3):
 
-    # Fallback if FAISS not ready
-    if index is None or len(metadata) == 0:
+    # One store generation for the whole query, even if a reload lands mid-way
+    current = store
+
+    # Fallback if the vector store is not ready
+    if not current.ready:
         return [
             {"text": "System not ready. Vector index missing."}
         ]
 
-    q_vec = embed_query(question)
+    key = RetrievalCache.key(current.index_id, question, top_k)
+    cached = result_cache.get(key)
+
+    if cached is not None:
+        return cached
+
+    results, route = retrieve_uncached(current, question, top_k)
 
-    if q_vec is None:
+    if cacheable(current, route):
+        result_cache.put(key, results)
+
+    return results
+
+
+def retrieve_uncached(current: VectorStore, question: str, top_k: int):
+    """
+    Returns (results, route): the vector space that answered, "lexical" for
+    BM25 alone, or None when retrieval failed.
+    """
+    metadata, chunk_tags = current.metadata, current.chunk_tags
+
+    mask = query_tag_mask(question) if chunk_tags is not None else 0
+    allowed_ids = matching_ids(chunk_tags, mask) if mask else None
+
+    lexical_ids = lexical_search(question, current=current)
+
+    q_vec, space = (None, None) if RETRIEVAL_MODE == "lexical" else embed_query(question, current)
+
+    indices = None
+    if q_vec is not None:
+        try:
+            indices = vector_search(space, q_vec, CANDIDATE_K, allowed_ids)
+        except Exception as e:
+            print("⚠️ Search failed:", str(e))
+
+    if indices is None:
+        # Every embedding backend down, or the vector search failed — answer
+        # from the inverted index alone, query-topic chunks first
+        if lexical_ids:
+            ranked = partition_by_tags(lexical_ids, chunk_tags, mask) if chunk_tags is not None else lexical_ids
+            return [metadata[i] for i in ranked[:top_k]], "lexical"
+
+        if q_vec is None:
+            return [
+                {"text": "Embedding failed. Try again later."}
+            ], None
+
+        return [{"text": "Search error occurred"}], None
+
+    return fuse_results(current, indices[0], lexical_ids, mask, top_k), space
+
+
+def fuse_results(current: VectorStore, vector_row, lexical_ids, mask: int, top_k: int):
+    metadata, chunk_tags = current.metadata, current.chunk_tags
+    vector_ids = [int(i) for i in vector_row if 0 <= i < len(metadata)]
+    candidates = rrf_fuse([vector_ids, lexical_ids])
+
+    # Query-topic chunks first, then the rest (vectorized over candidate ids)
+    if chunk_tags is not None:
+        candidates = partition_by_tags(candidates, chunk_tags, mask)
+
+    return [metadata[i] for i in candidates[:top_k]]
+
+
+def retrieve_many(questions, top_k: int = 3):
+    """
+    Batch version of `retrieve`: cached questions are answered directly, the
+    rest share one embedding call and one matrix search against the answering
+    backend's index. Returns one result list per question.
+    """
+    questions = list(questions)
+
+    if not questions:
+        return []
+
+    current = store
+    metadata, chunk_tags = current.metadata, current.chunk_tags
+
+    if not current.ready:
         return [
-            {"text": "Embedding failed. Try again later."}
+            [{"text": "System not ready. Vector index missing."}]
+            for _ in questions
         ]
 
-    try:
-        distances, indices = index.search(q_vec, 40)
-    except Exception as e:
-        print("⚠️ Search failed:", str(e))
-        return [{"text": "Search error occurred"}]
-
-    real_numbers_signals = [
-        "integer",
-        "positive integer",
-        "hcf",
-        "remainder",
-        "divisor",
-        "a = bq",
-        "algorithm",
-        "euclid"
-    ]
-
-    strict = []
-    fallback = []
-
-    for idx in indices[0]:
-        if idx >= len(metadata):
-            continue
+    results = [None] * len(questions)
+    keys = [RetrievalCache.key(current.index_id, q, top_k) for q in questions]
 
-        meta = metadata[idx]
-        text_lower = meta["text"].lower()
+    for i, key in enumerate(keys):
+        results[i] = result_cache.get(key)
 
-        if any(sig in text_lower for sig in real_numbers_signals):
-            strict.append(meta)
-        else:
-            fallback.append(meta)
+    # Only the misses go through embedding + search
+    todo = [i for i in range(len(questions)) if results[i] is None]
 
-    results = strict[:top_k]
+    if not todo:
+        return results
+
+    pending = [questions[i] for i in todo]
+    masks = [query_tag_mask(q) if chunk_tags is not None else 0 for q in pending]
+    lexical = [lexical_search(q, current=current) for q in pending]
+
+    q_vecs, space = (None, None) if RETRIEVAL_MODE == "lexical" else embed_queries(pending, current)
+
+    rows = None
+    if q_vecs is not None:
+        try:
+            # Unfiltered so all queries share one search; tag re-rank happens per row
+            rows = search_ids(space, q_vecs, CANDIDATE_K)
+        except Exception as e:
+            print("⚠️ Batch search failed:", str(e))
+
+    for j, i in enumerate(todo):
+        if rows is not None:
+            results[i], route = fuse_results(current, rows[j], lexical[j], masks[j], top_k), space
+
+        elif lexical[j]:
+            ranked = partition_by_tags(lexical[j], chunk_tags, masks[j]) if chunk_tags is not None else lexical[j]
+            results[i], route = [metadata[x] for x in ranked[:top_k]], "lexical"
+
+        else:
+            results[i], route = [{"text": "Embedding failed. Try again later."}], None
 
-    if len(results) < top_k:
-        results.extend(fallback[: top_k - len(results)])
+        if cacheable(current, route):
+            result_cache.put(keys[i], results[i])
 
-    return results
\ No newline at end of file
+    return results
@@ -0,0 +1,203 @@
+from pathlib import Path
+import re
+
+import numpy as np
+
+# ======================================================
+# TOPIC / CHAPTER SIGNALS
+# ======================================================
+# Each tag is one bit in a uint64 mask (max 64 tags), one per chapter.
+# A chunk's bit comes from the chapter the chunker labelled it with; the
+# keywords below place a question on chapters, and tag only chunks whose
+# chapter is unknown. Keywords match whole words (plural allowed).
+TOPIC_SIGNALS = {
+    "real_numbers": [
+        "real numbers", "integer", "positive integer", "hcf", "lcm", "remainder",
+        "divisor", "a = bq", "euclid", "prime factor", "fundamental theorem of arithmetic",
+        "irrational", "terminating", "decimal expansion"
+    ],
+    "polynomials": [
+        "polynomial", "zeroes of", "zeros of", "quadratic polynomial", "cubic polynomial",
+        "coefficient", "division algorithm for polynomials"
+    ],
+    "linear_equations": [
+        "pair of linear equations", "linear equations in two variables", "substitution method",
+        "elimination method", "cross-multiplication", "consistent", "inconsistent"
+    ],
+    "quadratic_equations": [
+        "quadratic equation", "discriminant", "nature of roots", "completing the square",
+        "quadratic formula", "ax2 + bx + c"
+    ],
+    "arithmetic_progressions": [
+        "arithmetic progression", "common difference", "nth term", "sum of first n terms",
+        "a.p.", "ap"
+    ],
+    "triangles": [
+        "triangle", "similar figures", "similarity", "basic proportionality", "thales",
+        "pythagoras", "aaa", "sss", "sas"
+    ],
+    "coordinate_geometry": [
+        "coordinate", "distance formula", "section formula", "midpoint", "x-axis", "y-axis",
+        "abscissa", "ordinate"
+    ],
+    "trigonometry": [
+        "trigonometry", "trigonometric", "sin", "cos", "tan", "cosec", "sec", "cot",
+        "angle of elevation", "angle of depression", "heights and distances"
+    ],
+    "circles": [
+        "circle", "tangent", "secant", "radius", "point of contact"
+    ],
+    "areas_volumes": [
+        "surface area", "volume", "cylinder", "cone", "sphere", "hemisphere", "cuboid",
+        "frustum", "area of sector", "segment of a circle"
+    ],
+    "statistics": [
+        "statistics", "mean", "median", "mode", "grouped data", "class interval",
+        "frequency", "ogive", "cumulative frequency"
+    ],
+    "probability": [
+        "probability", "random experiment", "outcomes", "dice", "coin", "deck of cards",
+        "equally likely"
+    ],
+}
+
+TAG_NAMES = list(TOPIC_SIGNALS)
+
+assert len(TAG_NAMES) <= 64, "Tag bitset is a uint64"
+
+# Bumped whenever the same tag names start meaning different chunks, so
+# tags saved by an older build are recomputed rather than trusted
+TAGS_VERSION = 2
+
+# Chapter titles naming each tag's chapter. "Areas Related to Circles"
+# comes before "Circles" so it is not taken for that chapter.
+CHAPTER_TITLES = {
+    "areas_volumes": ["areas related to circles", "surface areas and volumes", "areas and volumes"],
+    "real_numbers": ["real numbers"],
+    "polynomials": ["polynomials"],
+    "linear_equations": ["linear equations"],
+    "quadratic_equations": ["quadratic equations"],
+    "arithmetic_progressions": ["arithmetic progressions"],
+    "triangles": ["triangles"],
+    "coordinate_geometry": ["coordinate geometry"],
+    "trigonometry": ["trigonometry"],
+    "circles": ["circles"],
+    "statistics": ["statistics"],
+    "probability": ["probability"],
+}
+
+# NCERT Class 10 Maths chapters by number (the same in the old and the
+# rationalised editions), for titles the source text misspells
+MATHS_10_CHAPTERS = {
+    1: "real_numbers", 2: "polynomials", 3: "linear_equations", 4: "quadratic_equations",
+    5: "arithmetic_progressions", 6: "triangles", 7: "coordinate_geometry",
+    8: "trigonometry", 9: "trigonometry", 10: "circles",
+}
+
+
+def whole_words(phrases) -> re.Pattern:
+    alternatives = "|".join(re.escape(p) for p in sorted(phrases, key=len, reverse=True))
+    return re.compile(rf"(?<!\w)(?:{alternatives})(?:s|es)?(?!\w)")
+
+
+SIGNAL_PATTERNS = [whole_words(TOPIC_SIGNALS[name]) for name in TAG_NAMES]
+TITLE_PATTERNS = [(name, whole_words(titles)) for name, titles in CHAPTER_TITLES.items()]
+
+
+def text_tag_mask(text: str) -> int:
+    text_lower = (text or "").lower()
+    mask = 0
+
+    for i, pattern in enumerate(SIGNAL_PATTERNS):
+        if pattern.search(text_lower):
+            mask |= 1 << i
+
+    return mask
+
+
+def chapter_tag(chunk: dict):
+    """The tag of the chunk's chapter, or None when the chunk has no known chapter."""
+    title = str(chunk.get("chapter") or "").lower()
+
+    for name, pattern in TITLE_PATTERNS:
+        if pattern.search(title):
+            return name
+
+    if str(chunk.get("subject", "")).lower() in ("maths", "mathematics") and str(chunk.get("class")) == "10":
+        return MATHS_10_CHAPTERS.get(chunk.get("chapter_no"))
+
+    return None
+
+
+def chunk_tag_mask(chunk: dict) -> int:
+    name = chapter_tag(chunk)
+
+    if name is not None:
+        return 1 << TAG_NAMES.index(name)
+
+    # A chapter we do not tag (another subject's): no topic bits
+    if chunk.get("chapter_no") is not None:
+        return 0
+
+    # No chapter recorded (older metadata): fall back to the text
+    return text_tag_mask(
+        " ".join([
+            str(chunk.get("topic") or ""),
+            chunk.get("text", "")
+        ])
+    )
+
+
+def query_tag_mask(question: str) -> int:
+    return text_tag_mask(question)
+
+
+# ======================================================
+# BUILD / LOAD
+# ======================================================
+def compute_tags(chunks) -> np.ndarray:
+    """One uint64 tag bitset per chunk, aligned with FAISS ids."""
+    return np.fromiter(
+        (chunk_tag_mask(c) for c in chunks),
+        dtype="uint64",
+        count=len(chunks)
+    )
+
+
+def save_tags(path: Path, tags: np.ndarray):
+    np.savez(path, bits=tags, names=np.array(TAG_NAMES), version=np.array(TAGS_VERSION))
+
+
+def load_tags(path: Path):
+    """
+    Returns the bitset array, or None if the file was built with a different
+    tag vocabulary (bit positions would not line up) or tagging rules.
+    """
+    data = np.load(path, allow_pickle=False)
+
+    if list(data["names"]) != TAG_NAMES:
+        return None
+
+    if "version" not in data.files or int(data["version"]) != TAGS_VERSION:
+        return None
+
+    return data["bits"].astype("uint64")
+
+
+def matching_ids(tags: np.ndarray, mask: int) -> np.ndarray:
+    """Chunk ids carrying at least one of the tags in `mask`."""
+    return np.flatnonzero(tags & np.uint64(mask)).astype("int64")
+
+
+def partition_by_tags(candidates, tags: np.ndarray, mask: int) -> np.ndarray:
+    """
+    Stable re-rank: candidates tagged with the query's topics first,
+    everything else after, both in their original order.
+    """
+    cand = np.asarray(candidates, dtype="int64")
+
+    if not mask or len(cand) == 0:
+        return cand
+
+    hit = (tags[cand] & np.uint64(mask)) != 0
+    return np.concatenate([cand[hit], cand[~hit]])
@@ -107,6 +107,14 @@ async def seed():
                 except Exception as e:
                     print(f"❌ Insert failed: {e}")
 
+    # Running servers reload their in-memory question bank on the next check
+    if total_inserted:
+        await db["app_meta"].update_one(
+            {"_id": "question_bank"},
+            {"$inc": {"version": 1}},
+            upsert=True
+        )
+
     final_count = await collection.count_documents({})
     print("\n================================")
     print(f"📊 Final question count: {final_count}")
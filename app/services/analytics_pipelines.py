@@ -0,0 +1,205 @@
+"""
+Aggregation pipelines over completed mock tests (`test_sessions`).
+
+The counting happens inside Mongo: `$unwind` the per-question results,
+`$group` them into correct/total counters, and `$facet` several views out
+of a single pass. Only the aggregates travel back; percentages are
+rounded here in Python.
+"""
+
+import app.db
+
+
+# Submission order; _id breaks ties between tests completed in the same second
+OLDEST_FIRST = {"completed_at": 1, "_id": 1}
+NEWEST_FIRST = {"completed_at": -1, "_id": -1}
+
+# Correct answers within a $group over unwound results
+CORRECT = {"$sum": {"$cond": ["$results.isCorrect", 1, 0]}}
+
+
+def completed_match(user_id=None, since: int = None, until: int = None) -> dict:
+    """`since`/`until` are completed_at timestamps (seconds)."""
+    match = {"status": "completed"}
+
+    if user_id is not None:
+        match["user_id"] = user_id
+
+    if since is not None or until is not None:
+        match["completed_at"] = {}
+        if since is not None:
+            match["completed_at"]["$gte"] = since
+        if until is not None:
+            match["completed_at"]["$lt"] = until
+
+    return match
+
+
+def counters(field: str, default: str) -> list:
+    """Stages giving {_id: name, correct, total} for a per-question field."""
+    return [
+        {"$unwind": "$results"},
+        {"$group": {
+            "_id": {"$ifNull": [f"$results.{field}", default]},
+            "correct": CORRECT,
+            "total": {"$sum": 1}
+        }}
+    ]
+
+
+def per_test_counters(field: str, default: str, limit: int) -> list:
+    """Stages giving {_id: {session, name}, correct, total} for the newest `limit` tests."""
+    return [
+        {"$sort": NEWEST_FIRST},
+        {"$limit": limit},
+        {"$unwind": "$results"},
+        {"$group": {
+            "_id": {"session": "$_id", "name": {"$ifNull": [f"$results.{field}", default]}},
+            "correct": CORRECT,
+            "total": {"$sum": 1}
+        }}
+    ]
+
+
+# ======================================================
+# PER STUDENT
+# ======================================================
+def student_pipeline(user_id, recent_limit: int, history_limit: int) -> list:
+    """
+    Everything a student's stats document holds, in one round trip:
+    totals and the accuracy series, all-time topic and difficulty
+    counters, and the newest tests with their own counters.
+    """
+    return [
+        {"$match": completed_match(user_id)},
+        {"$sort": OLDEST_FIRST},
+        {"$project": {
+            "score": 1, "total": 1, "accuracy": 1, "weak_topics": 1,
+            "completed_at": 1, "duration": 1, "subject": 1, "class_level": 1, "chapter": 1,
+            "results.topic": 1, "results.difficulty": 1, "results.isCorrect": 1
+        }},
+        {"$facet": {
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "tests": {"$sum": 1},
+                    "accuracy_sum": {"$sum": "$accuracy"},
+                    "best_accuracy": {"$max": "$accuracy"},
+                    "first_accuracy": {"$first": "$accuracy"},
+                    "last_accuracy": {"$last": "$accuracy"},
+                    "accuracy_history": {"$push": "$accuracy"}
+                }},
+                {"$project": {
+                    "tests": 1, "accuracy_sum": 1, "best_accuracy": 1,
+                    "first_accuracy": 1, "last_accuracy": 1,
+                    "accuracy_history": {"$slice": ["$accuracy_history", -history_limit]}
+                }}
+            ],
+            "topics": counters("topic", "General"),
+            "difficulty": counters("difficulty", "medium"),
+            "recent": [
+                {"$sort": NEWEST_FIRST},
+                {"$limit": recent_limit},
+                {"$project": {"results": 0}}
+            ],
+            "recent_topics": per_test_counters("topic", "General", recent_limit),
+            "recent_difficulty": per_test_counters("difficulty", "medium", recent_limit)
+        }}
+    ]
+
+
+async def student_aggregates(user_id, recent_limit: int, history_limit: int) -> dict:
+    cursor = app.db.test_sessions_collection.aggregate(
+        student_pipeline(user_id, recent_limit, history_limit)
+    )
+    rows = await cursor.to_list(length=1)
+    return rows[0]
+
+
+# ======================================================
+# COHORT (ADMIN)
+# ======================================================
+ACCURACY_BANDS = [0, 40, 60, 80, 101]
+
+
+def cohort_pipeline(since: int = None, until: int = None, top: int = 20) -> list:
+    """All students' completed tests in a time window."""
+    return [
+        {"$match": completed_match(since=since, until=until)},
+        {"$project": {
+            "user_id": 1, "accuracy": 1, "completed_at": 1,
+            "results.topic": 1, "results.difficulty": 1, "results.isCorrect": 1
+        }},
+        {"$facet": {
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "tests": {"$sum": 1},
+                    "students": {"$addToSet": "$user_id"},
+                    "average_accuracy": {"$avg": "$accuracy"}
+                }},
+                {"$project": {"tests": 1, "average_accuracy": 1, "students": {"$size": "$students"}}}
+            ],
+            "topics": counters("topic", "General") + [
+                {"$sort": {"total": -1}},
+                {"$limit": top}
+            ],
+            "difficulty": counters("difficulty", "medium"),
+            "accuracy_bands": [
+                {"$bucket": {
+                    "groupBy": "$accuracy",
+                    "boundaries": ACCURACY_BANDS,
+                    "default": "other",
+                    "output": {"tests": {"$sum": 1}}
+                }}
+            ],
+            "daily": [
+                {"$group": {
+                    "_id": {"$dateToString": {
+                        "format": "%Y-%m-%d",
+                        "date": {"$toDate": {"$multiply": ["$completed_at", 1000]}}
+                    }},
+                    "tests": {"$sum": 1},
+                    "average_accuracy": {"$avg": "$accuracy"}
+                }},
+                {"$sort": {"_id": 1}}
+            ]
+        }}
+    ]
+
+
+async def cohort_aggregates(since: int = None, until: int = None, top: int = 20) -> dict:
+    cursor = app.db.test_sessions_collection.aggregate(cohort_pipeline(since, until, top))
+    rows = await cursor.to_list(length=1)
+    return rows[0]
+
+
+def percent(correct, total) -> int:
+    return round((correct / total) * 100) if total else 0
+
+
+def cohort_view(agg: dict, days: int) -> dict:
+    """/admin/analytics/cohort"""
+    totals = agg["totals"][0] if agg["totals"] else {"tests": 0, "students": 0, "average_accuracy": 0}
+
+    topics = sorted(agg["topics"], key=lambda row: percent(row["correct"], row["total"]))
+
+    return {
+        "days": days,
+        "tests": totals["tests"],
+        "students": totals["students"],
+        "average_accuracy": round(totals["average_accuracy"] or 0),
+        "weakest_topics": [
+            {"topic": row["_id"], "accuracy": percent(row["correct"], row["total"]), "answers": row["total"]}
+            for row in topics
+        ],
+        "difficulty_accuracy": {row["_id"]: percent(row["correct"], row["total"]) for row in agg["difficulty"]},
+        "accuracy_bands": {
+            (f"{row['_id']}+" if row["_id"] != "other" else "other"): row["tests"]
+            for row in agg["accuracy_bands"]
+        },
+        "daily": [
+            {"date": row["_id"], "tests": row["tests"], "average_accuracy": round(row["average_accuracy"] or 0)}
+            for row in agg["daily"]
+        ]
+    }
@@ -3,6 +3,7 @@ from datetime import datetime
 from bson import ObjectId
 
 import app.db
+from app.services.user_cache import user_cache
 
 
 # -----------------------------------
@@ -18,7 +19,7 @@ VERIFICATION_COST = 1
 # -----------------------------------
 
 async def get_user(user_id: str):
-    user = await app.db.users_collection.find_one({"_id": ObjectId(user_id)})
+    user = await user_cache.get(str(user_id))
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -30,8 +31,11 @@ async def get_user(user_id: str):
 # Check Credits (no deduction)
 # -----------------------------------
 
-async def check_credits(user_id: str, cost: int):
-    user = await get_user(user_id)
+async def check_credits(user: dict, cost: int):
+    """
+    `user` is the request's current user (get_current_user): no extra read
+    unless the balance looks too low.
+    """
 
     # Admin bypass
     if user.get("role") == "admin":
@@ -39,6 +43,13 @@ async def check_credits(user_id: str, cost: int):
 
     credits = user.get("credits_remaining", 0)
 
+    if credits < cost:
+        # The cached balance can predate a payment another worker handled
+        user_cache.invalidate(user["_id"])
+        fresh = await user_cache.get(str(user["_id"]))
+        if fresh is not None:
+            credits = user["credits_remaining"] = fresh.get("credits_remaining", 0)
+
     if credits < cost:
         raise HTTPException(
             status_code=402,
@@ -52,32 +63,49 @@ async def check_credits(user_id: str, cost: int):
 # Atomic Credit Deduction
 # -----------------------------------
 
-async def consume_credits(user_id: str, cost: int, action: str):
+async def consume_credits(user: dict, cost: int, action: str, inc: dict = None):
     """
-    Safely deduct credits using atomic Mongo update
+    Safely deduct credits using atomic Mongo update.
+    `inc` adds other user counters to the same write (e.g. mock_attempts_used).
     """
 
-    user = await get_user(user_id)
+    user_id = ObjectId(user["_id"])
 
     # Admin bypass
     if user.get("role") == "admin":
+        if inc:
+            await app.db.users_collection.update_one(
+                {"_id": user_id},
+                {"$inc": inc, "$set": {"updated_at": datetime.utcnow()}}
+            )
+            user_cache.apply_inc(user_id, inc)
         return True
 
+    inc = {"credits_remaining": -cost, **(inc or {})}
+
     result = await app.db.users_collection.update_one(
         {
-            "_id": ObjectId(user_id),
+            "_id": user_id,
             "credits_remaining": {"$gte": cost}
         },
         {
-            "$inc": {"credits_remaining": -cost},
+            "$inc": inc,
             "$set": {"updated_at": datetime.utcnow()}
         }
     )
 
     if result.modified_count == 0:
+        # The cached balance was stale (another worker, billing)
+        user_cache.invalidate(user_id)
         raise HTTPException(
             status_code=402,
             detail="Not enough credits"
         )
 
-    return True
\ No newline at end of file
+    user_cache.apply_inc(user_id, inc)
+
+    # Later checks in the same request see the new balance
+    for field, amount in inc.items():
+        user[field] = user.get(field, 0) + amount
+
+    return True
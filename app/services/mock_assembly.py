@@ -0,0 +1,187 @@
+"""
+Adaptive mock tests: more questions from the topics a student gets wrong,
+and a difficulty mix that follows their overall accuracy.
+
+Everything is computed from the student's stats document (user_stats)
+and the question bank's in-memory strata, so assembling a test is the
+stats read, the recently-seen read, and arithmetic over a few hundred
+strata. Why the test looks the way it does is kept in the session
+document as `selection`.
+"""
+
+from collections import Counter
+import asyncio
+import os
+from typing import Dict, List, Tuple
+
+from app.services.question_bank import Question, question_bank
+from app.services.question_sampler import recently_seen
+from app.services.user_stats import get_user_stats, stat_key
+
+
+# -----------------------------------
+# Config
+# -----------------------------------
+
+# How much harder a weak topic pulls: a topic at 0% accuracy weighs
+# 1 + MOCK_ADAPTIVE_FOCUS times as much as one at 100%
+MOCK_ADAPTIVE_FOCUS = float(os.getenv("MOCK_ADAPTIVE_FOCUS", "3"))
+
+# Answers needed before a topic's accuracy is trusted; below that it is
+# weighted as if at 50%
+MIN_TOPIC_ANSWERS = 3
+
+# (average accuracy below, share per difficulty)
+DIFFICULTY_MIX = [
+    (50, {"easy": 0.5, "medium": 0.35, "hard": 0.15}),
+    (75, {"easy": 0.25, "medium": 0.45, "hard": 0.3}),
+    (101, {"easy": 0.15, "medium": 0.35, "hard": 0.5}),
+]
+
+FOCUS_TOPICS_SHOWN = 5
+
+
+def difficulty_mix(average_accuracy) -> Dict[str, float]:
+    for below, mix in DIFFICULTY_MIX:
+        if average_accuracy < below:
+            return mix
+    return DIFFICULTY_MIX[-1][1]
+
+
+def topic_accuracy(stats: dict, topic: str):
+    counters = stats.get("topics", {}).get(stat_key(topic))
+
+    if not counters or counters.get("total", 0) < MIN_TOPIC_ANSWERS:
+        return None
+
+    return counters["correct"] / counters["total"]
+
+
+def topic_weight(accuracy) -> float:
+    return 1 + MOCK_ADAPTIVE_FOCUS * (1 - (0.5 if accuracy is None else accuracy))
+
+
+class AdaptiveWeights:
+    """
+    Stratum weights for `question_bank.sample`.
+
+    Each (topic, difficulty) group gets a weight such that, as closely as
+    the bank allows, topics are drawn in proportion to their topic weight
+    and difficulties in proportion to the mix: a few rounds of iterative
+    proportional fitting over the topic x difficulty table (topics rarely
+    have every difficulty, so neither target alone would do). A group's
+    weight is then split over its chapters by size.
+    """
+
+    FITTING_ROUNDS = 10
+
+    def __init__(self, stats: dict):
+        tests = stats.get("tests", 0)
+
+        self.average_accuracy = round(stats["accuracy_sum"] / tests) if tests else 0
+        self.mix = difficulty_mix(self.average_accuracy)
+        self.stats = stats
+        self.topics: Dict[str, Tuple[float, float]] = {}   # topic -> (accuracy, weight)
+
+    def __call__(self, strata: Dict[tuple, List[str]]) -> Dict[tuple, float]:
+        group_sizes = Counter()
+
+        for key, ids in strata.items():
+            group_sizes[key[4], key[5]] += len(ids)
+
+        for topic, _ in group_sizes:
+            if topic not in self.topics:
+                accuracy = topic_accuracy(self.stats, topic)
+                self.topics[topic] = (accuracy, topic_weight(accuracy))
+
+        groups = self.fit(list(group_sizes))
+
+        return {
+            key: groups[key[4], key[5]] * len(ids) / group_sizes[key[4], key[5]]
+            for key, ids in strata.items()
+        }
+
+    def fit(self, groups: List[Tuple[str, str]]) -> Dict[Tuple[str, str], float]:
+        # Unlisted difficulty labels count like the rarest listed one
+        other = min(self.mix.values())
+
+        topics = {topic for topic, _ in groups}
+        difficulties = {difficulty for _, difficulty in groups}
+
+        topic_total = sum(self.topics[t][1] for t in topics)
+        mix_total = sum(self.mix.get(d, other) for d in difficulties)
+
+        topic_target = {t: self.topics[t][1] / topic_total for t in topics}
+        difficulty_target = {d: self.mix.get(d, other) / mix_total for d in difficulties}
+
+        weights = {(t, d): topic_target[t] * difficulty_target[d] for t, d in groups}
+
+        for _ in range(self.FITTING_ROUNDS):
+            for target, side in ((topic_target, 0), (difficulty_target, 1)):
+                totals = Counter()
+                for group, weight in weights.items():
+                    totals[group[side]] += weight
+                for group in weights:
+                    weights[group] *= target[group[side]] / totals[group[side]]
+
+        return weights
+
+    def focus_topics(self) -> List[dict]:
+        """The weakest topics the test could draw from."""
+        ranked = sorted(self.topics.items(), key=lambda item: item[1][1], reverse=True)
+
+        return [
+            {
+                "topic": topic,
+                "accuracy": None if accuracy is None else round(accuracy * 100),
+                "weight": round(weight, 2)
+            }
+            for topic, (accuracy, weight) in ranked[:FOCUS_TOPICS_SHOWN]
+        ]
+
+
+async def assemble_mock(
+    user_id,
+    count: int,
+    board: str,
+    subject: str,
+    class_level: int,
+    chapter: str = None,
+    adaptive: bool = True
+) -> Tuple[List[Question], dict]:
+    """The questions for a new test, and the selection rationale to store with it."""
+    if adaptive:
+        stats, seen = await asyncio.gather(get_user_stats(user_id), recently_seen(user_id))
+    else:
+        stats, seen = None, await recently_seen(user_id)
+
+    # No tests yet: nothing to adapt to
+    weigh = AdaptiveWeights(stats) if stats and stats.get("tests") else None
+
+    questions = await question_bank.sample(
+        count,
+        exclude=seen,
+        weigh=weigh,
+        board=board,
+        subject=subject,
+        class_level=class_level,
+        chapter=chapter
+    )
+
+    selection = {
+        "strategy": "adaptive" if weigh else "stratified",
+        "excluded_recent": len(seen),
+        # [name, count] pairs: topic names are not safe as field names
+        "topics": [list(item) for item in Counter(q.topic for q in questions).most_common()],
+        "difficulty": [list(item) for item in Counter(q.difficulty for q in questions).most_common()],
+    }
+
+    if weigh:
+        selection.update({
+            "based_on_tests": stats["tests"],
+            "average_accuracy": weigh.average_accuracy,
+            "difficulty_mix": weigh.mix,
+            "focus_topics": weigh.focus_topics(),
+        })
+
+    return questions, selection
@@ -0,0 +1,244 @@
+"""
+A student's running mock test (`test_sessions` with status "active").
+
+A session stores a snapshot of what the student sees (question text and
+options, no answers) when it is created, so resuming a test after a page
+refresh is the one read that finds the session.
+
+Answers clicked during the test are written through `AnswerBuffer`: one
+update per click, or batched when MOCK_ANSWER_WRITE_BEHIND is on.
+"""
+
+from datetime import datetime, timezone
+from typing import Dict, Optional
+import asyncio
+import os
+import time
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+import app.db
+from app.services.question_bank import question_bank
+
+
+# Write each answer as it is saved (0) or batch them every few seconds (1).
+# Single worker only: buffered answers are invisible to other workers, and
+# lost if another worker submits the test first
+MOCK_ANSWER_WRITE_BEHIND = os.getenv("MOCK_ANSWER_WRITE_BEHIND", "0") == "1"
+MOCK_ANSWER_FLUSH_SECONDS = float(os.getenv("MOCK_ANSWER_FLUSH_SECONDS", "15"))
+
+
+# Everything a resume needs from the session document
+ACTIVE_FIELDS = {
+    "questions": 1,
+    "question_ids": 1,
+    "selected_answers": 1,
+    "current_question_index": 1,
+    "duration": 1,
+    "started_at": 1
+}
+
+
+def started_ts(session: dict) -> int:
+    started_at = session["started_at"]
+
+    if isinstance(started_at, datetime):
+        return int(started_at.timestamp())
+
+    return int(started_at)
+
+
+async def active_session(user_id) -> Optional[dict]:
+    """The student's running test. One whose time is up is marked expired instead."""
+    session = await app.db.test_sessions_collection.find_one(
+        {"user_id": user_id, "status": "active"},
+        ACTIVE_FIELDS
+    )
+
+    if session is None:
+        return None
+
+    now_ts = int(datetime.now(timezone.utc).timestamp())
+
+    if now_ts - started_ts(session) >= session["duration"]:
+        # Answers still buffered belong in the session before it closes
+        await answer_buffer.close(session["_id"])
+
+        await app.db.test_sessions_collection.update_one(
+            {"_id": session["_id"], "status": "active"},
+            {"$set": {"status": "expired"}}
+        )
+        return None
+
+    answer_buffer.overlay(session)
+    return session
+
+
+async def resume_view(session: dict) -> dict:
+    questions = session.get("questions")
+
+    # Started before sessions kept a snapshot
+    if questions is None:
+        questions = [q.public() for q in await question_bank.ordered(session["question_ids"])]
+
+    return {
+        "session_id": str(session["_id"]),
+        "questions": questions,
+        "selected_answers": session["selected_answers"],
+        "current_question_index": session["current_question_index"],
+        "duration": session["duration"],
+        "started_at": started_ts(session)
+    }
+
+
+# -----------------------------------
+# Answer buffer
+# -----------------------------------
+
+class AnswerBuffer:
+    """
+    /mock/save-answer writes.
+
+    By default every save is one conditional `$set` on the session, so any
+    worker sees it and a save to a closed test fails. With `write_behind`
+    (one worker only) saves are coalesced into one `$set` per session per
+    flush instead:
+
+    A student clicks through options and questions far faster than the
+    answers need to reach Mongo: every click only updates `pending`, and
+    `run` writes all sessions' pending fields in one bulk write every
+    `flush_seconds`. A session is checked against Mongo once (it exists,
+    is active, belongs to the student); later saves trust `owners`.
+
+    Nothing is lost on the way out: submit and expiry `close` the session
+    (flush, then forget it) before changing its status, shutdown flushes
+    everything, and resume shows pending answers through `overlay`. A
+    hard crash loses at most the last `flush_seconds` of clicks, which
+    submit re-sends anyway.
+    """
+
+    def __init__(self, write_behind: bool = MOCK_ANSWER_WRITE_BEHIND,
+                 flush_seconds: float = MOCK_ANSWER_FLUSH_SECONDS):
+        self.write_behind = write_behind
+        self.flush_seconds = flush_seconds
+        self.owners: Dict[ObjectId, tuple] = {}     # session -> (user_id, ends_at)
+        self.pending: Dict[ObjectId, dict] = {}     # session -> fields to $set
+        self.flush_lock = asyncio.Lock()
+
+        self.saves = 0
+        self.writes = 0
+
+    async def save(self, session_id: ObjectId, user_id, question_id: str, option: int, index: int) -> bool:
+        """Save one answer; False when the session is not the student's active test."""
+        # Becomes a field name: only question ids may go there
+        if not ObjectId.is_valid(question_id):
+            return False
+
+        fields = {f"selected_answers.{question_id}": option, "current_question_index": index}
+
+        if not self.write_behind:
+            result = await app.db.test_sessions_collection.update_one(
+                {"_id": session_id, "user_id": user_id, "status": "active"},
+                {"$set": fields}
+            )
+            if not result.matched_count:
+                return False
+
+            self.saves += 1
+            self.writes += 1
+            return True
+
+        owner = self.owners.get(session_id)
+
+        if owner is None or owner[0] != user_id:
+            session = await app.db.test_sessions_collection.find_one(
+                {"_id": session_id, "user_id": user_id, "status": "active"},
+                {"started_at": 1, "duration": 1}
+            )
+            if session is None:
+                return False
+
+            self.owners[session_id] = (user_id, started_ts(session) + session["duration"])
+
+        self.pending.setdefault(session_id, {}).update(fields)
+
+        self.saves += 1
+        return True
+
+    def overlay(self, session: dict):
+        """Show pending answers on a session read from Mongo."""
+        fields = self.pending.get(session["_id"])
+        if not fields:
+            return
+
+        for field, value in fields.items():
+            if field == "current_question_index":
+                session["current_question_index"] = value
+            else:
+                session["selected_answers"][field.split(".", 1)[1]] = value
+
+    async def flush(self, session_ids=None) -> int:
+        """Write pending answers (of `session_ids`, or all); returns sessions written."""
+        async with self.flush_lock:
+            if session_ids is None:
+                batch, self.pending = self.pending, {}
+            else:
+                batch = {sid: self.pending.pop(sid) for sid in session_ids if sid in self.pending}
+
+            if not batch:
+                return 0
+
+            # Only while active: a submitted or expired test keeps its final answers
+            ops = [
+                UpdateOne({"_id": session_id, "status": "active"}, {"$set": fields})
+                for session_id, fields in batch.items()
+            ]
+
+            try:
+                await app.db.test_sessions_collection.bulk_write(ops, ordered=False)
+            except Exception:
+                # Answers buffered meanwhile are newer than the ones that failed
+                for session_id, fields in batch.items():
+                    self.pending[session_id] = {**fields, **self.pending.get(session_id, {})}
+                raise
+
+            self.writes += len(ops)
+            return len(ops)
+
+    async def close(self, session_id: ObjectId):
+        """Flush one session and stop tracking it (submit, expiry)."""
+        await self.flush([session_id])
+        self.owners.pop(session_id, None)
+
+    def prune(self):
+        """Forget sessions past their time with nothing pending."""
+        now = time.time()
+
+        for session_id, (_, ends_at) in list(self.owners.items()):
+            if ends_at < now and session_id not in self.pending:
+                del self.owners[session_id]
+
+    async def run(self):
+        if not self.write_behind:
+            return
+
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                print("⚠️ Answer flush failed:", str(e))
+            self.prune()
+
+    def stats(self) -> dict:
+        return {
+            "write_behind": self.write_behind,
+            "sessions": len(self.owners),
+            "pending": len(self.pending),
+            "saves": self.saves,
+            "writes": self.writes,
+        }
+
+
+answer_buffer = AnswerBuffer()
@@ -0,0 +1,279 @@
+from dataclasses import dataclass
+import asyncio
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from bson import ObjectId
+
+import app.db
+from app.services.question_sampler import draw
+
+
+# -----------------------------------
+# Config
+# -----------------------------------
+
+# How often a request may check the bank's version in Mongo
+QUESTION_BANK_CHECK_SECONDS = float(os.getenv("QUESTION_BANK_CHECK_SECONDS", "30"))
+
+# Bumped by app/seed_questions.py (or by hand) whenever questions change
+VERSION_ID = "question_bank"
+
+# Everything the mock endpoints read from a question document
+QUESTION_FIELDS = {
+    "question": 1,
+    "options": 1,
+    "correctAnswer": 1,
+    "board": 1,
+    "subject": 1,
+    "class": 1,
+    "chapter": 1,
+    "topic": 1,
+    "concept": 1,
+    "difficulty": 1,
+    "explanation": 1
+}
+
+
+def _label(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+@dataclass(slots=True, frozen=True)
+class Question:
+    id: str
+    question: str
+    options: Tuple[str, ...]
+    correct: int
+    board: Optional[str]
+    subject: Optional[str]
+    class_level: Optional[int]
+    chapter: Optional[str]
+    topic: str
+    concept: str
+    difficulty: str
+    explanation: str
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "Question":
+        topic = doc.get("topic", "General")
+
+        return cls(
+            id=str(doc["_id"]),
+            question=doc["question"],
+            options=tuple(doc["options"]),
+            correct=doc["correctAnswer"],
+            board=_label(doc.get("board")),
+            subject=_label(doc.get("subject")),
+            class_level=doc.get("class"),
+            chapter=_label(doc.get("chapter")),
+            topic=_label(topic),
+            concept=_label(doc.get("concept", topic)),
+            difficulty=_label(doc.get("difficulty", "medium")),
+            explanation=doc.get("explanation", "Explanation not available.")
+        )
+
+    @property
+    def pool(self):
+        return (self.board, self.subject, self.class_level)
+
+    @property
+    def stratum(self):
+        return (self.chapter, self.topic, self.difficulty)
+
+    def public(self) -> dict:
+        """What a student sees while taking the test (no answer)."""
+        return {"id": self.id, "question": self.question, "options": list(self.options)}
+
+
+def matches(wanted: tuple, key: tuple) -> bool:
+    return all(w is None or w == k for w, k in zip(wanted, key))
+
+
+class QuestionBank:
+    """
+    Read-through, in-process copy of the `questions` collection.
+
+    Questions are seeded once and almost never change, so the whole bank is
+    held in memory, indexed by id and as id pools: one per (board, subject,
+    class), split into strata by (chapter, topic, difficulty) for
+    `question_sampler`. A `version` document in `app_meta` is checked at
+    most every `check_seconds`; when it has moved (the seed script bumps
+    it), the bank reloads. Ids not in memory are fetched from Mongo and
+    kept.
+    """
+
+    def __init__(self, check_seconds: float = QUESTION_BANK_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self.by_id: Dict[str, Question] = {}
+        self.pools: Dict[tuple, Dict[tuple, List[str]]] = {}
+        self.version = None
+        self.loaded = False
+        self.checked_at = 0.0
+        self.lock = asyncio.Lock()
+
+        self.loads = 0
+        self.misses = 0
+
+    # ---------- freshness ----------
+
+    async def current_version(self):
+        meta = app.db.meta_collection
+
+        if meta is None:
+            return None
+
+        doc = await meta.find_one({"_id": VERSION_ID}, {"version": 1})
+        return doc.get("version") if doc else None
+
+    async def ensure_fresh(self):
+        if self.loaded and time.monotonic() - self.checked_at < self.check_seconds:
+            return
+
+        async with self.lock:
+            if self.loaded and time.monotonic() - self.checked_at < self.check_seconds:
+                return
+
+            version = await self.current_version()
+            self.checked_at = time.monotonic()
+
+            if not self.loaded or version != self.version:
+                await self.load(version)
+
+    async def load(self, version=None):
+        cursor = app.db.questions_collection.find({}, QUESTION_FIELDS)
+
+        by_id = {}
+        pools = {}
+        skipped = 0
+
+        async for doc in cursor:
+            q = self.parse(doc)
+            if q is None:
+                skipped += 1
+                continue
+            by_id[q.id] = q
+            pools.setdefault(q.pool, {}).setdefault(q.stratum, []).append(q.id)
+
+        # Swap in one step: readers see the old bank or the new one
+        self.by_id, self.pools = by_id, pools
+        self.version = version
+        self.loaded = True
+        self.loads += 1
+
+        print(f"📚 Question bank loaded: {len(by_id)} questions (version {version})")
+        if skipped:
+            print(f"⚠️ Skipped {skipped} malformed question documents")
+
+    @staticmethod
+    def parse(doc: dict) -> Optional[Question]:
+        try:
+            return Question.from_doc(doc)
+        except (KeyError, TypeError):
+            return None
+
+    def invalidate(self):
+        """Reload on the next request."""
+        self.loaded = False
+
+    # ---------- reads ----------
+
+    async def get_many(self, question_ids) -> Dict[str, Question]:
+        """id -> Question for the ids that exist; unknown ids are read through from Mongo."""
+        await self.ensure_fresh()
+
+        found = {}
+        missing = []
+
+        for qid in question_ids:
+            q = self.by_id.get(qid)
+            if q is not None:
+                found[qid] = q
+            elif ObjectId.is_valid(qid):
+                missing.append(ObjectId(qid))
+
+        if missing:
+            self.misses += len(missing)
+            cursor = app.db.questions_collection.find({"_id": {"$in": missing}}, QUESTION_FIELDS)
+
+            async for doc in cursor:
+                q = self.parse(doc)
+                if q is not None:
+                    self.by_id[q.id] = q
+                    found[q.id] = q
+
+        return found
+
+    async def ordered(self, question_ids) -> List[Question]:
+        """Questions in the given order, skipping any that no longer exist."""
+        found = await self.get_many(question_ids)
+        return [found[qid] for qid in question_ids if qid in found]
+
+    async def strata(
+        self,
+        board: str = None,
+        subject: str = None,
+        class_level: int = None,
+        chapter: str = None,
+        topic: str = None,
+        difficulty: str = None
+    ) -> Dict[tuple, List[str]]:
+        """
+        (board, subject, class, chapter, topic, difficulty) -> ids, for every
+        stratum matching the filters that are given. The lists are the
+        bank's own: read them, do not modify them.
+        """
+        await self.ensure_fresh()
+
+        pool_wanted = (board, subject, class_level)
+        stratum_wanted = (chapter, topic, difficulty)
+
+        if None in pool_wanted:
+            pools = [(key, pool) for key, pool in self.pools.items() if matches(pool_wanted, key)]
+        else:
+            pools = [(pool_wanted, self.pools.get(pool_wanted, {}))]
+
+        return {
+            pool_key + stratum_key: ids
+            for pool_key, pool in pools
+            for stratum_key, ids in pool.items()
+            if matches(stratum_wanted, stratum_key)
+        }
+
+    async def sample(
+        self,
+        count: int,
+        exclude: Set[str] = None,
+        weigh: Callable[[Dict[tuple, List[str]]], Dict[tuple, float]] = None,
+        **filters
+    ) -> List[Question]:
+        """
+        Up to `count` distinct matching questions, stratified by chapter,
+        topic and difficulty, avoiding `exclude` while others remain.
+        `weigh(strata)` gives each stratum's share instead of its size.
+        """
+        strata = await self.strata(**filters)
+        excluded = {}
+
+        for qid in exclude or ():
+            q = self.by_id.get(qid)
+            if q is not None:
+                excluded.setdefault(q.pool + q.stratum, set()).add(qid)
+
+        picked = draw(strata, count, excluded, weigh(strata) if weigh else None)
+        return [self.by_id[qid] for qid in picked]
+
+    def stats(self) -> dict:
+        return {
+            "questions": len(self.by_id),
+            "pools": len(self.pools),
+            "strata": sum(len(pool) for pool in self.pools.values()),
+            "version": self.version,
+            "loads": self.loads,
+            "read_through_misses": self.misses,
+        }
+
+
+question_bank = QuestionBank()
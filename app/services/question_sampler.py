@@ -0,0 +1,132 @@
+"""
+Stratified sampling over the question bank's in-memory id pools.
+
+A test of `count` questions is split across strata (chapter, topic,
+difficulty) in proportion to how many questions each holds, then drawn
+without replacement inside each stratum. A bigger bank therefore means
+more candidates, not a slower or lopsided draw. Questions from the
+student's last few tests are left out while enough others remain.
+"""
+
+import os
+import random
+from typing import Dict, Hashable, List, Set
+
+import app.db
+
+
+# Questions from this many of the student's latest tests are not repeated
+MOCK_EXCLUDE_RECENT_TESTS = int(os.getenv("MOCK_EXCLUDE_RECENT_TESTS", "3"))
+
+
+def allocate(
+    sizes: Dict[Hashable, int],
+    count: int,
+    weights: Dict[Hashable, float] = None
+) -> Dict[Hashable, int]:
+    """
+    How many to draw from each stratum: in proportion to `weights`
+    (default: the sizes themselves), never more than a stratum holds.
+    Whatever a full stratum cannot take is shared out among the rest;
+    the fractions left over are drawn at random, so every stratum gets
+    its quota on average.
+    """
+    weights = sizes if weights is None else weights
+    taken = dict.fromkeys(sizes, 0)
+    open_keys = [key for key, size in sizes.items() if size > 0 and weights.get(key, 0) > 0]
+    left = min(count, sum(sizes[key] for key in open_keys))
+
+    while left > 0 and open_keys:
+        total = sum(weights[key] for key in open_keys)
+        quotas = {key: left * weights[key] / total for key in open_keys}
+        whole = {key: min(int(quota), sizes[key] - taken[key]) for key, quota in quotas.items()}
+
+        if not any(whole.values()):
+            # Every quota is below one: pick `left` strata, each with
+            # probability equal to its quota (systematic sampling)
+            random.shuffle(open_keys)
+            point, reached = random.random(), 0.0
+            chosen = set()
+
+            for key in open_keys:
+                reached += quotas[key]
+                if reached > point and len(chosen) < left:
+                    chosen.add(key)
+                    point += 1
+
+            # Rounding can leave the last point just out of reach
+            for key in open_keys:
+                if len(chosen) == left:
+                    break
+                chosen.add(key)
+
+            for key in chosen:
+                taken[key] += 1
+            break
+
+        for key, n in whole.items():
+            taken[key] += n
+            left -= n
+
+        open_keys = [key for key in open_keys if taken[key] < sizes[key]]
+
+    return taken
+
+
+def draw(
+    strata: Dict[Hashable, List[str]],
+    count: int,
+    excluded: Dict[Hashable, Set[str]] = None,
+    weights: Dict[Hashable, float] = None
+) -> List[str]:
+    """
+    Up to `count` distinct ids, stratified, in random order. `excluded`
+    holds the ids to avoid, grouped by stratum, so only those strata pay
+    for skipping them. `weights` (per stratum) replaces proportional
+    allocation.
+    """
+    excluded = excluded or {}
+    sizes = {key: len(ids) - len(excluded.get(key, ())) for key, ids in strata.items()}
+    sizes = {key: size for key, size in sizes.items() if size > 0}
+    picked = []
+
+    for key, n in allocate(sizes, count, weights).items():
+        if not n:
+            continue
+
+        ids = strata[key]
+        skip = excluded.get(key)
+
+        if skip:
+            # A random n + len(skip) always holds n that are not skipped
+            candidates = random.sample(ids, min(len(ids), n + len(skip)))
+            picked.extend([qid for qid in candidates if qid not in skip][:n])
+        else:
+            picked.extend(random.sample(ids, n))
+
+    # Not enough unseen questions: repeat seen ones rather than shorten the test
+    short = count - len(picked)
+    if short > 0:
+        seen = [qid for key, ids in excluded.items() if key in strata for qid in ids]
+        picked.extend(random.sample(seen, min(short, len(seen))))
+
+    # Strata were drawn one after another: interleave them
+    random.shuffle(picked)
+    return picked
+
+
+async def recently_seen(user_id, tests: int = MOCK_EXCLUDE_RECENT_TESTS) -> Set[str]:
+    """Question ids of the student's latest `tests` tests, whatever their status."""
+    if tests <= 0:
+        return set()
+
+    cursor = app.db.test_sessions_collection.find(
+        {"user_id": user_id},
+        {"question_ids": 1}
+    ).sort("started_at", -1).limit(tests)
+
+    seen = set()
+    async for session in cursor:
+        seen.update(session.get("question_ids", []))
+
+    return seen
@@ -0,0 +1,95 @@
+from contextlib import asynccontextmanager
+import asyncio
+import weakref
+
+
+class SessionBusy(Exception):
+    """Another turn for this session is still running and did not finish in time."""
+
+
+class SessionLocks:
+    """
+    One asyncio.Lock per session, held for the whole turn.
+
+    Locks live in a WeakValueDictionary: whoever is holding or waiting on a
+    lock keeps it alive, and it disappears on its own once the session goes
+    quiet, so idle sessions cost nothing here.
+
+    `once` additionally collapses identical in-flight turns (double tap,
+    client retry): the duplicate awaits the first request's result instead
+    of queueing a second LLM round-trip.
+    """
+
+    def __init__(self, wait_seconds: float):
+        self.wait_seconds = wait_seconds
+        self.locks = weakref.WeakValueDictionary()   # chat_id -> asyncio.Lock
+        self.pending = {}                            # (chat_id, fingerprint) -> asyncio.Task
+
+        self.waited = 0
+        self.rejected = 0
+        self.deduped = 0
+
+    @asynccontextmanager
+    async def hold(self, chat_id):
+        lock = self.locks.get(chat_id)
+
+        if lock is None:
+            lock = asyncio.Lock()
+            self.locks[chat_id] = lock
+
+        if not lock.locked():
+            await lock.acquire()
+        else:
+            self.waited += 1
+            try:
+                await asyncio.wait_for(lock.acquire(), self.wait_seconds)
+            except asyncio.TimeoutError:
+                lock = None
+
+            if lock is None:
+                # Raised outside the except block and without the lock in
+                # scope, so a kept exception does not keep the lock alive
+                self.rejected += 1
+                raise SessionBusy(chat_id)
+
+        try:
+            yield
+        finally:
+            lock.release()
+
+    async def once(self, chat_id, fingerprint: str, run):
+        """
+        Await `run()` unless the same (chat_id, fingerprint) is already in
+        flight, in which case await that one. The work runs as its own task,
+        so a client that disconnects mid-turn does not cancel it for a retry
+        that is waiting on the same result.
+        """
+        key = (chat_id, fingerprint)
+        task = self.pending.get(key)
+
+        if task is not None:
+            self.deduped += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.create_task(run())
+        self.pending[key] = task
+        task.add_done_callback(lambda t: self._finished(key, t))
+
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self.pending.get(key) is task:
+            del self.pending[key]
+
+        # Nobody may be left awaiting it (client gone): mark the error as seen
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "locks": len(self.locks),
+            "in_flight": len(self.pending),
+            "waited": self.waited,
+            "rejected": self.rejected,
+            "deduped": self.deduped,
+        }
@@ -0,0 +1,346 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+import asyncio
+import gc
+import os
+import pickle
+import struct
+import time
+import zlib
+
+from app.services.session_state import SessionState
+from app.services.session_store import SESSION_IDLE_HOURS, SESSION_STORE
+
+# In requirements.txt; only SESSION_SNAPSHOT_CODEC=pickle runs without them
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# -----------------------------------
+# Config
+# -----------------------------------
+
+ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+
+# Where the memory store writes its snapshot ("" disables). The memory store
+# is per process: run one worker, or use SESSION_STORE=mongo, which persists
+# every session already and needs no snapshot.
+SESSION_SNAPSHOT_DIR = os.getenv("SESSION_SNAPSHOT_DIR", str(ROOT_DIR / "session_snapshots"))
+
+# "msgpack" (msgpack + zstd) or "pickle" (pickle + zlib: an explicit
+# fallback for hosts without msgpack/zstandard, slower to restore)
+SESSION_SNAPSHOT_CODEC = os.getenv("SESSION_SNAPSHOT_CODEC", "msgpack")
+
+# Changed sessions are appended to the journal this often
+SESSION_CHECKPOINT_SECONDS = float(os.getenv("SESSION_CHECKPOINT_SECONDS", "60"))
+
+BASE_NAME = "sessions.snapshot"
+MAGIC = b"SWSS"
+FRAME = struct.Struct(">BI")    # codec, payload length
+EPOCH = datetime(1970, 1, 1)
+
+
+# -----------------------------------
+# Encoding
+# -----------------------------------
+# Each frame records its own codec, so a snapshot is read correctly after
+# SESSION_SNAPSHOT_CODEC changes, as long as the packages it was written
+# with are installed; otherwise reading it fails naming the missing ones.
+
+PACK_MSGPACK, PACK_PICKLE = 1, 2
+ZIP_ZSTD, ZIP_ZLIB = 16, 32
+
+
+def encode(obj, codec_name: str = SESSION_SNAPSHOT_CODEC) -> bytes:
+    if codec_name == "pickle":
+        data = zlib.compress(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL), 1)
+        codec = PACK_PICKLE | ZIP_ZLIB
+    else:
+        data = zstandard.ZstdCompressor(level=3).compress(msgpack.packb(obj, use_bin_type=True))
+        codec = PACK_MSGPACK | ZIP_ZSTD
+
+    return FRAME.pack(codec, len(data)) + data
+
+
+def missing_codecs(codec: int) -> list:
+    return [
+        package
+        for flag, package, module in ((ZIP_ZSTD, "zstandard", zstandard), (PACK_MSGPACK, "msgpack", msgpack))
+        if codec & flag and module is None
+    ]
+
+
+def decode(codec: int, data: bytes):
+    missing = missing_codecs(codec)
+    if missing:
+        raise RuntimeError(
+            f"snapshot was written with {' and '.join(missing)}, not installed here "
+            f"(pip install {' '.join(missing)})"
+        )
+
+    if codec & ZIP_ZSTD:
+        data = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        data = zlib.decompress(data)
+
+    if codec & PACK_MSGPACK:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+    return pickle.loads(data)
+
+
+def read_frames(path: Path):
+    """
+    Decoded frames, and the offset just past the last complete one. A torn
+    frame at the end (crash mid-append) is left out.
+    """
+    frames = []
+
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path.name} is not a session snapshot")
+
+        end = f.tell()
+
+        while True:
+            head = f.read(FRAME.size)
+            if len(head) < FRAME.size:
+                break
+
+            codec, length = FRAME.unpack(head)
+            data = f.read(length)
+            if len(data) < length:
+                break
+
+            frames.append(decode(codec, data))
+            end = f.tell()
+
+    return frames, end
+
+
+def pack_session(chat_id, state: SessionState, size: int):
+    data = state.to_dict()
+    last_active = data.pop("last_active", None) or datetime.utcnow()
+    return [chat_id, data, size, (last_active - EPOCH).total_seconds()]
+
+
+# -----------------------------------
+# Snapshots
+# -----------------------------------
+
+class SessionSnapshots:
+    """
+    A full base snapshot plus an append-only journal of changed sessions.
+
+    `checkpoint` appends the sessions saved or removed since the last call
+    (the store records their ids once snapshots are attached). `compact`
+    rewrites the base from everything in memory and starts a new journal;
+    it runs on shutdown and whenever the journal outgrows the base. Journals
+    are tied to a base generation, so a journal left over from before a
+    compaction is never replayed on top of the newer base.
+    """
+
+    def __init__(self, store, directory, idle_hours: float = SESSION_IDLE_HOURS):
+        self.store = store
+        self.directory = Path(directory)
+        self.idle_seconds = idle_hours * 3600
+        self.generation = 0
+        self.write_lock = asyncio.Lock()
+
+        store.changed = set()
+
+    @property
+    def base_path(self) -> Path:
+        return self.directory / BASE_NAME
+
+    def journal_path(self, generation: int) -> Path:
+        return self.directory / f"sessions.{generation}.journal"
+
+    # ---------- restore ----------
+
+    def restore(self) -> int:
+        """Load the last snapshot into the (empty) store; returns sessions restored."""
+        # Millions of small containers are created here and all of them
+        # survive: cyclic GC passes over them would only add time
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+
+        try:
+            return self.restore_sessions()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def read_snapshot(self) -> dict:
+        """chat_id -> packed session, base with the journal replayed on top."""
+        sessions = {}
+
+        if self.base_path.exists():
+            frames, _ = read_frames(self.base_path)
+            for frame in frames:
+                self.generation = frame["generation"]
+                sessions.update((entry[0], entry) for entry in frame["sessions"])
+
+        journal = self.journal_path(self.generation)
+        if journal.exists():
+            frames, end = read_frames(journal)
+            for frame in frames:
+                sessions.update((entry[0], entry) for entry in frame["put"])
+                for chat_id in frame["del"]:
+                    sessions.pop(chat_id, None)
+
+            # Drop a torn tail so the next append starts on a frame boundary
+            if end < journal.stat().st_size:
+                os.truncate(journal, end)
+
+        return sessions
+
+    def restore_sessions(self) -> int:
+        started = time.perf_counter()
+
+        try:
+            sessions = self.read_snapshot()
+        except Exception as e:
+            print("⚠️ Session snapshot unreadable, starting empty:", str(e))
+            return 0
+
+        if not sessions:
+            return 0
+
+        now = time.time()
+        restored = 0
+
+        # Oldest first, so the store's LRU order survives the restart
+        for chat_id, data, size, last_active in sorted(sessions.values(), key=lambda e: e[3]):
+            idle = max(0.0, now - last_active)
+            if idle > self.idle_seconds:
+                continue
+
+            state = SessionState.from_dict(data)
+            state.last_active = EPOCH + timedelta(seconds=last_active)
+            self.store.restore(chat_id, state, size, idle)
+            restored += 1
+
+        self.store.changed.clear()
+        print(f"♻️ Restored {restored} sessions in {time.perf_counter() - started:.2f}s")
+        return restored
+
+    # ---------- write ----------
+
+    def take_changes(self):
+        """Swap out the changed-id set; later turns go into the next checkpoint."""
+        changed, self.store.changed = self.store.changed, set()
+        puts, dels = [], []
+
+        for chat_id in changed:
+            state = self.store.peek(chat_id)
+            if state is None:
+                dels.append(chat_id)
+            else:
+                puts.append(pack_session(chat_id, state, self.store.sizes.get(chat_id, 0)))
+
+        return puts, dels
+
+    def take_all(self):
+        self.store.changed = set()
+        return [
+            pack_session(chat_id, state, self.store.sizes.get(chat_id, 0))
+            for chat_id, state in self.store.items()
+        ]
+
+    def append_journal(self, puts, dels) -> int:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.journal_path(self.generation)
+        frame = encode({"put": puts, "del": dels})
+
+        with open(path, "ab") as f:
+            if f.tell() == 0:
+                f.write(MAGIC)
+            f.write(frame)
+            f.flush()
+            os.fsync(f.fileno())
+
+        return path.stat().st_size
+
+    def write_base(self, sessions):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        old_journal = self.journal_path(self.generation)
+        generation = self.generation + 1
+
+        tmp = self.base_path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(encode({"generation": generation, "saved_at": time.time(), "sessions": sessions}))
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp, self.base_path)
+        self.generation = generation
+
+        if old_journal.exists():
+            old_journal.unlink()
+
+    async def checkpoint(self) -> int:
+        """Append changed sessions to the journal; compact when it outgrows the base."""
+        async with self.write_lock:
+            puts, dels = self.take_changes()
+            if not puts and not dels:
+                return 0
+
+            try:
+                journal_bytes = await asyncio.to_thread(self.append_journal, puts, dels)
+            except Exception:
+                self.store.changed.update(entry[0] for entry in puts)
+                self.store.changed.update(dels)
+                raise
+
+            base_bytes = self.base_path.stat().st_size if self.base_path.exists() else 0
+
+        if journal_bytes > max(base_bytes, 1 << 20):
+            await self.compact()
+
+        return len(puts) + len(dels)
+
+    async def compact(self) -> int:
+        async with self.write_lock:
+            sessions = self.take_all()
+            try:
+                await asyncio.to_thread(self.write_base, sessions)
+            except Exception:
+                # The old base and journal are untouched: journal everything next time
+                self.store.changed.update(entry[0] for entry in sessions)
+                raise
+            return len(sessions)
+
+    async def run(self, interval: float = SESSION_CHECKPOINT_SECONDS):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.checkpoint()
+            except Exception as e:
+                print("⚠️ Session checkpoint failed:", str(e))
+
+
+def create_session_snapshots(store, directory: str = SESSION_SNAPSHOT_DIR):
+    # The Mongo store already persists every session
+    if not directory or SESSION_STORE == "mongo":
+        return None
+
+    if SESSION_SNAPSHOT_CODEC == "msgpack":
+        missing = missing_codecs(PACK_MSGPACK | ZIP_ZSTD)
+        if missing:
+            raise RuntimeError(
+                f"Session snapshots need {' and '.join(missing)} (pip install -r requirements.txt), "
+                f"or set SESSION_SNAPSHOT_CODEC=pickle"
+            )
+    elif SESSION_SNAPSHOT_CODEC != "pickle":
+        raise ValueError(f"Unknown SESSION_SNAPSHOT_CODEC: {SESSION_SNAPSHOT_CODEC}")
+
+    return SessionSnapshots(store, directory)
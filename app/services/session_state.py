@@ -0,0 +1,274 @@
+from collections import deque
+from dataclasses import dataclass, field, fields
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import sys
+
+
+# -----------------------------------
+# Limits
+# -----------------------------------
+
+HISTORY_LIMIT = 20          # chat messages kept for context
+MICRO_HISTORY_LIMIT = 5     # micro-diagnosis signals kept for rolling scores
+
+
+# -----------------------------------
+# Enum-like values
+# -----------------------------------
+# Plain (interned) strings rather than Enum: they go straight into prompts,
+# JSON responses and Mongo, and every session shares one copy of each.
+
+class Mode:
+    EXPLAIN = "explain"
+    SOCRATIC = "socratic"
+    CHAT = "chat"
+    PROBLEMS = "problems"
+    LEARN = "learn"
+    IDLE = "idle"
+
+
+class TrainingMode:
+    GUIDED = "guided"
+    SOCRATIC = "socratic"
+    STRUCTURAL = "structural"
+
+
+def intern(value):
+    """Labels coming back from the LLM (domain, intent, ...) are shared, not copied per session."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+# -----------------------------------
+# Sub-states (created on first use)
+# -----------------------------------
+
+@dataclass(slots=True)
+class SocraticState:
+    original_question: Optional[str] = None
+    steps: List[str] = field(default_factory=list)
+    current: int = 0
+    failures: int = 0
+    user_attempts: List[str] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class MockQuizState:
+    """In-chat mini mock ("start physics mock")."""
+    active: bool = False
+    questions: List[dict] = field(default_factory=list)
+    current: int = 0
+
+
+@dataclass(slots=True)
+class ExamSimulationState:
+    """Follow-up "write it in board exam format" check."""
+    active: bool = False
+    question_type: Optional[str] = None
+
+
+@dataclass(slots=True)
+class PracticeState:
+    """/problems"""
+    problem: Optional[str] = None
+    ptype: Optional[str] = None
+    solved: bool = False
+    interaction_count: int = 0
+    last_response: str = ""
+
+
+@dataclass(slots=True)
+class LearnState:
+    """/learn"""
+    step_index: int = 0
+    steps: List[dict] = field(default_factory=list)
+    attempts: Dict[str, int] = field(default_factory=dict)
+    concept_check: bool = False
+
+
+SUB_STATES = {
+    "socratic": SocraticState,
+    "quiz": MockQuizState,
+    "exam": ExamSimulationState,
+    "practice": PracticeState,
+    "learn": LearnState,
+}
+
+# Fields holding interned labels
+LABEL_FIELDS = ("board", "mode", "domain", "subject", "intent", "question_type", "current_training_mode")
+
+
+# -----------------------------------
+# Session
+# -----------------------------------
+
+@dataclass(slots=True)
+class SessionState:
+    board: str = "CBSE"
+    mode: str = Mode.EXPLAIN
+    domain: Optional[str] = None
+    subject: Optional[str] = None
+    intent: Optional[str] = None
+    question_type: Optional[str] = None
+
+    diagnosis: Optional[str] = None
+    clarification: Optional[str] = None
+    diagnostic_profile: Optional[dict] = None
+
+    rolling_confidence: float = 0.5
+    discipline_score: float = 0.5
+    current_training_mode: str = TrainingMode.GUIDED
+
+    last_question: Optional[str] = None
+    last_topic: Optional[str] = None
+    last_answer: Optional[str] = None
+
+    session_id: Any = None
+    user_id: Optional[str] = None
+    last_active: datetime = field(default_factory=datetime.utcnow)
+
+    # Lazily created: an empty deque alone costs ~600 bytes, and most
+    # sessions only ever chat
+    _history: Optional[deque] = None
+    _micro_history: Optional[deque] = None
+    _socratic: Optional[SocraticState] = None
+    _quiz: Optional[MockQuizState] = None
+    _exam: Optional[ExamSimulationState] = None
+    _practice: Optional[PracticeState] = None
+    _learn: Optional[LearnState] = None
+
+    # ---------- histories (ring buffers) ----------
+
+    @property
+    def history(self):
+        """Read-only view; append through `remember`."""
+        return self._history if self._history is not None else ()
+
+    @property
+    def micro_history(self):
+        """Read-only view; append through `add_micro`."""
+        return self._micro_history if self._micro_history is not None else ()
+
+    def remember(self, role: str, content: str):
+        if self._history is None:
+            self._history = deque(maxlen=HISTORY_LIMIT)
+        self._history.append({"role": role, "content": content})
+
+    def add_micro(self, signal: dict):
+        if self._micro_history is None:
+            self._micro_history = deque(maxlen=MICRO_HISTORY_LIMIT)
+        self._micro_history.append(signal)
+
+    # ---------- sub-states ----------
+
+    @property
+    def socratic(self) -> SocraticState:
+        if self._socratic is None:
+            self._socratic = SocraticState()
+        return self._socratic
+
+    @socratic.setter
+    def socratic(self, value: SocraticState):
+        self._socratic = value
+
+    @property
+    def quiz(self) -> MockQuizState:
+        if self._quiz is None:
+            self._quiz = MockQuizState()
+        return self._quiz
+
+    @property
+    def exam(self) -> ExamSimulationState:
+        if self._exam is None:
+            self._exam = ExamSimulationState()
+        return self._exam
+
+    @property
+    def practice(self) -> PracticeState:
+        if self._practice is None:
+            self._practice = PracticeState()
+        return self._practice
+
+    @property
+    def learn(self) -> LearnState:
+        if self._learn is None:
+            self._learn = LearnState()
+        return self._learn
+
+    # Checks that must not allocate a sub-state
+
+    @property
+    def quiz_active(self) -> bool:
+        return self._quiz is not None and self._quiz.active
+
+    @property
+    def exam_active(self) -> bool:
+        return self._exam is not None and self._exam.active
+
+    # ---------- updates ----------
+
+    def classify(self, domain, subject, intent, question_type):
+        self.domain = intern(domain)
+        self.subject = intern(subject)
+        self.intent = intern(intent)
+        self.question_type = intern(question_type)
+
+    # ---------- serialization ----------
+
+    def to_dict(self) -> dict:
+        """
+        Compact, BSON/JSON-friendly form: default-valued fields and unused
+        sub-states are left out, deques become lists.
+        """
+        out = {}
+
+        for f in fields(self):
+            value = getattr(self, f.name)
+
+            if f.name.startswith("_"):
+                if isinstance(value, deque):
+                    out[f.name[1:]] = list(value)
+                elif value is not None:
+                    out[f.name[1:]] = _sub_to_dict(value)
+                continue
+
+            if value != _DEFAULTS.get(f.name):
+                out[f.name] = value
+
+        return out
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SessionState":
+        # One constructor call; snapshot restore runs this for every session
+        kwargs = {}
+
+        for key, value in data.items():
+            decoder = _DECODERS.get(key)
+            if decoder is not None:
+                kwargs[decoder[0]] = decoder[1](value)
+            elif key in _FIELD_NAMES:
+                kwargs[key] = value
+
+        return cls(**kwargs)
+
+
+def _sub_to_dict(sub) -> dict:
+    return {f.name: getattr(sub, f.name) for f in fields(sub)}
+
+
+_FIELD_NAMES = {f.name for f in fields(SessionState) if not f.name.startswith("_")}
+
+# to_dict key -> (constructor argument, converter), for everything not stored as-is
+_DECODERS = {
+    "history": ("_history", lambda v: deque(v, maxlen=HISTORY_LIMIT)),
+    "micro_history": ("_micro_history", lambda v: deque(v, maxlen=MICRO_HISTORY_LIMIT)),
+    **{name: (name, intern) for name in LABEL_FIELDS},
+    **{name: ("_" + name, lambda v, sub=sub: sub(**v)) for name, sub in SUB_STATES.items()},
+}
+
+# Scalar defaults, to leave them out of to_dict (last_active is always kept)
+_DEFAULTS = {
+    f.name: getattr(SessionState(), f.name)
+    for f in fields(SessionState)
+    if not f.name.startswith("_") and f.name != "last_active"
+}
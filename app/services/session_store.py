@@ -0,0 +1,520 @@
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
+import asyncio
+import heapq
+import itertools
+import os
+import pickle
+import time
+
+from pymongo import DeleteOne, ReplaceOne
+from pymongo.errors import BulkWriteError
+
+import app.db
+from app.config import SESSION_IDLE_HOURS
+from app.services.session_locks import SessionLocks
+from app.services.session_state import SessionState
+
+
+# -----------------------------------
+# Config
+# -----------------------------------
+
+# "memory" (this process only) or "mongo" (shared across workers, survives deploys)
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+
+# Mongo only: persist after each turn (0) or batch dirty sessions every few seconds (1)
+SESSION_WRITE_BEHIND = os.getenv("SESSION_WRITE_BEHIND", "0") == "1"
+SESSION_FLUSH_SECONDS = float(os.getenv("SESSION_FLUSH_SECONDS", "2"))
+
+# Past this, the least recently used sessions are dropped from memory
+SESSION_MEMORY_BUDGET_MB = float(os.getenv("SESSION_MEMORY_BUDGET_MB", "256"))
+
+# Expiry runs this often, removing at most SESSION_EXPIRY_SLICE sessions
+# before yielding to the event loop
+SESSION_SWEEP_SECONDS = float(os.getenv("SESSION_SWEEP_SECONDS", "30"))
+SESSION_EXPIRY_SLICE = int(os.getenv("SESSION_EXPIRY_SLICE", "500"))
+
+# A turn waits this long for the previous turn of the same session before
+# it is rejected (0 = reject overlapping turns immediately)
+SESSION_TURN_WAIT_SECONDS = float(os.getenv("SESSION_TURN_WAIT_SECONDS", "20"))
+
+
+def estimate_size(state: SessionState) -> int:
+    """Pickled compact form: a stable proxy for how much a session holds."""
+    try:
+        return len(pickle.dumps(state.to_dict(), protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 4096
+
+
+# -----------------------------------
+# Memory backend
+# -----------------------------------
+
+class MemorySessionStore:
+    """
+    Sessions in this process, least recently used first.
+
+    Reads (`get`) are synchronous so the chat engine can use them directly.
+    Endpoints wrap each turn in `turn()`, which is where backends load state
+    before and persist it after. Sizes are re-measured once per turn.
+
+    Every `get`/`put` counts as activity. Idle expiry pops a min-heap of
+    last-touch times instead of scanning all sessions: a touch only updates
+    `touched`, and a popped entry that turns out to be stale is pushed back
+    with the newer time, so the heap holds about one entry per session.
+
+    Turns of one session never overlap: `turn()` holds that session's lock
+    from load to save.
+    """
+
+    name = "memory"
+
+    def __init__(self, budget_bytes: int, turn_wait_seconds: float = SESSION_TURN_WAIT_SECONDS):
+        self.budget_bytes = budget_bytes
+        self.locks = SessionLocks(turn_wait_seconds)
+        self.sessions = OrderedDict()    # chat_id -> state
+        self.sizes = {}
+        self.total_bytes = 0
+        self.evictions = 0
+
+        self.touched = {}                # chat_id -> monotonic time of last access
+        self.idle_heap = []              # (touch time to check it at, seq, chat_id)
+        self.scheduled = {}              # chat_id -> seq of its live heap entry
+        self.seq = itertools.count()
+        self.expired = 0
+
+        # Ids saved or removed since the last snapshot checkpoint; None
+        # until snapshots are attached (see session_snapshot.py)
+        self.changed = None
+
+    # ---------- sync access ----------
+
+    def get(self, chat_id):
+        state = self.sessions.get(chat_id)
+
+        if state is not None:
+            self.sessions.move_to_end(chat_id)
+            self.touch(chat_id, state)
+
+        return state
+
+    def peek(self, chat_id):
+        """Read without counting as activity (debug/admin views)."""
+        return self.sessions.get(chat_id)
+
+    def put(self, chat_id, state):
+        self.sessions[chat_id] = state
+        self.sessions.move_to_end(chat_id)
+        self.touch(chat_id, state)
+        self.measure(chat_id)
+
+    def delete(self, chat_id) -> bool:
+        self.forget(chat_id)
+        return self.sessions.pop(chat_id, None) is not None
+
+    def clear(self) -> int:
+        count = len(self.sessions)
+        if self.changed is not None:
+            self.changed.update(self.sessions)
+        self.sessions.clear()
+        self.sizes.clear()
+        self.total_bytes = 0
+        self.touched.clear()
+        self.idle_heap.clear()
+        self.scheduled.clear()
+        return count
+
+    def items(self):
+        return list(self.sessions.items())
+
+    def __contains__(self, chat_id):
+        return chat_id in self.sessions
+
+    def __len__(self):
+        return len(self.sessions)
+
+    # ---------- budget ----------
+
+    def measure(self, chat_id):
+        state = self.sessions.get(chat_id)
+        if state is None:
+            return
+
+        size = estimate_size(state)
+        self.total_bytes += size - self.sizes.get(chat_id, 0)
+        self.sizes[chat_id] = size
+
+    def evictable(self, chat_id) -> bool:
+        return True
+
+    def enforce_budget(self, keep=None):
+        if self.total_bytes <= self.budget_bytes:
+            return
+
+        for chat_id in list(self.sessions):
+            if self.total_bytes <= self.budget_bytes:
+                break
+
+            if chat_id != keep and self.evictable(chat_id):
+                self.drop(chat_id)
+                self.evictions += 1
+
+    def drop(self, chat_id):
+        """Forget locally (budget eviction, expiry); unlike `delete`, not a reset."""
+        self.forget(chat_id)
+        self.sessions.pop(chat_id, None)
+
+    def forget(self, chat_id):
+        if self.changed is not None:
+            self.changed.add(chat_id)
+        self.total_bytes -= self.sizes.pop(chat_id, 0)
+        self.touched.pop(chat_id, None)
+        # Its heap entry becomes stale and is discarded when popped
+        self.scheduled.pop(chat_id, None)
+
+    def restore(self, chat_id, state, size: int, idle_seconds: float):
+        """Bulk load from a snapshot: keeps the saved idle time and size instead of re-measuring."""
+        self.sessions[chat_id] = state
+        self.total_bytes += size - self.sizes.get(chat_id, 0)
+        self.sizes[chat_id] = size
+        self.touched[chat_id] = time.monotonic() - idle_seconds
+        self.scheduled.pop(chat_id, None)
+        self.schedule(chat_id, self.touched[chat_id])
+
+    # ---------- idle expiry ----------
+
+    def touch(self, chat_id, state):
+        state.last_active = datetime.utcnow()
+        self.touched[chat_id] = time.monotonic()
+
+        if chat_id not in self.scheduled:
+            self.schedule(chat_id, self.touched[chat_id])
+
+    def schedule(self, chat_id, at):
+        seq = next(self.seq)
+        self.scheduled[chat_id] = seq
+        heapq.heappush(self.idle_heap, (at, seq, chat_id))
+
+    def expire(self, max_idle_seconds: float) -> int:
+        """Drop every session idle for longer than `max_idle_seconds`, in one go."""
+        removed, _ = self.expire_slice(max_idle_seconds, limit=0)
+        return removed
+
+    def expire_slice(self, max_idle_seconds: float, limit: int):
+        """
+        Drop sessions idle for longer than `max_idle_seconds`, oldest first,
+        looking at no more than `limit` heap entries (0 = no limit).
+        Returns (dropped, more_due).
+        """
+        cutoff = time.monotonic() - max_idle_seconds
+        removed = 0
+        popped = 0
+        more = False
+        busy = []
+
+        while self.idle_heap and self.idle_heap[0][0] <= cutoff:
+            if limit and popped >= limit:
+                more = True
+                break
+
+            at, seq, chat_id = heapq.heappop(self.idle_heap)
+            popped += 1
+
+            if self.scheduled.get(chat_id) != seq:
+                continue
+
+            last = self.touched.get(chat_id, at)
+
+            if last > cutoff:
+                # Used since it was scheduled: move it to its real position
+                self.schedule(chat_id, last)
+            elif not self.evictable(chat_id):
+                busy.append(chat_id)
+            else:
+                self.drop(chat_id)
+                removed += 1
+
+        # Not yet persisted: look again next sweep
+        for chat_id in busy:
+            self.schedule(chat_id, cutoff + SESSION_SWEEP_SECONDS)
+
+        # Stale entries from deletes: rebuild once they dominate
+        if len(self.idle_heap) > 2 * len(self.scheduled) + 1024:
+            self.idle_heap = [e for e in self.idle_heap if self.scheduled.get(e[2]) == e[1]]
+            heapq.heapify(self.idle_heap)
+
+        self.expired += removed
+        return removed, more
+
+    async def reap(self, max_idle_seconds: float, slice_size: int = SESSION_EXPIRY_SLICE) -> int:
+        """Expire in slices, yielding between them so requests are never stalled."""
+        removed = 0
+
+        while True:
+            dropped, more = self.expire_slice(max_idle_seconds, limit=slice_size)
+            removed += dropped
+
+            if not more:
+                break
+
+            await asyncio.sleep(0)
+
+        self.enforce_budget()
+        return removed
+
+    # ---------- turn hooks ----------
+
+    async def load(self, chat_id):
+        return self.get(chat_id)
+
+    async def save(self, chat_id):
+        if self.changed is not None and chat_id in self.sessions:
+            self.changed.add(chat_id)
+        self.measure(chat_id)
+        self.enforce_budget(keep=chat_id)
+
+    async def flush(self):
+        pass
+
+    async def close(self):
+        await self.flush()
+
+    @asynccontextmanager
+    async def turn(self, chat_id):
+        """Raises SessionBusy if the session's previous turn does not finish in time."""
+        async with self.locks.hold(chat_id):
+            await self.load(chat_id)
+            try:
+                yield
+            finally:
+                await self.save(chat_id)
+
+    async def run_turn(self, chat_id, fingerprint: str, handler):
+        """
+        `await handler()` inside `turn(chat_id)`. A request with the same
+        fingerprint arriving while it runs gets the same result.
+        """
+        async def run():
+            async with self.turn(chat_id):
+                return await handler()
+
+        return await self.locks.once(chat_id, fingerprint, run)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "sessions": len(self.sessions),
+            "bytes": self.total_bytes,
+            "budget_bytes": self.budget_bytes,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "turns": self.locks.stats(),
+        }
+
+
+# -----------------------------------
+# Mongo backend
+# -----------------------------------
+
+class MongoSessionStore(MemorySessionStore):
+    """
+    Memory is a working set in front of `chat_sessions`, so any worker can
+    pick up any session. Each document carries a `rev`; `load` only re-reads
+    a session another worker has advanced since we last saw it.
+
+    Writes are conditional on the rev this worker loaded, so two workers
+    that ran a turn on the same version cannot overwrite each other: the
+    second write matches nothing (or, for a session new to this worker,
+    collides with the stored `_id`). That turn is dropped as a conflict and
+    the session is reloaded from Mongo on its next turn.
+
+    Write-through persists at the end of every turn. Write-behind marks the
+    session dirty and a background task bulk-writes dirty sessions every
+    `flush_seconds` (cheaper; sticky routing keeps conflicts rare, as another
+    worker can read a session up to one flush interval old).
+    """
+
+    name = "mongo"
+
+    def __init__(self, budget_bytes: int, write_behind: bool = False, flush_seconds: float = 2.0, **kwargs):
+        super().__init__(budget_bytes, **kwargs)
+        self.write_behind = write_behind
+        self.flush_seconds = flush_seconds
+        self.revs = {}           # chat_id -> rev last read or written
+        self.dirty = set()
+        self.deleted = set()
+        self.clear_all = False
+        self.conflicts = 0
+        self.flusher = None
+        self.flush_lock = asyncio.Lock()
+
+    @property
+    def collection(self):
+        return app.db.chat_sessions_collection
+
+    # ---------- sync access ----------
+
+    def delete(self, chat_id) -> bool:
+        removed = super().delete(chat_id)
+        self.dirty.discard(chat_id)
+        self.deleted.add(chat_id)
+        return removed
+
+    def clear(self) -> int:
+        count = super().clear()
+        self.revs.clear()
+        self.dirty.clear()
+        self.deleted.clear()
+        self.clear_all = True
+        return count
+
+    def forget(self, chat_id):
+        super().forget(chat_id)
+        self.revs.pop(chat_id, None)
+
+    def evictable(self, chat_id) -> bool:
+        # Dirty sessions exist only here until the next flush
+        return chat_id not in self.dirty
+
+    # ---------- turn hooks ----------
+
+    async def load(self, chat_id):
+        if self.collection is None or chat_id in self.dirty:
+            return self.get(chat_id)
+
+        query = {"_id": chat_id}
+
+        if chat_id in self.sessions and chat_id in self.revs:
+            query["rev"] = {"$ne": self.revs[chat_id]}
+
+        doc = await self.collection.find_one(query)
+
+        if doc is not None:
+            self.sessions[chat_id] = SessionState.from_dict(doc["state"])
+            self.revs[chat_id] = doc.get("rev", 0)
+            self.measure(chat_id)
+
+        return self.get(chat_id)
+
+    async def save(self, chat_id):
+        if chat_id in self.sessions:
+            self.dirty.add(chat_id)
+
+        await super().save(chat_id)
+
+        if not self.write_behind:
+            await self.flush()
+        elif self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self.flush_loop())
+
+    async def flush_loop(self):
+        while self.dirty or self.deleted or self.clear_all:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+    async def flush(self):
+        if self.collection is None:
+            return
+
+        async with self.flush_lock:
+            ops = []
+
+            if self.clear_all:
+                self.clear_all = False
+                try:
+                    await self.collection.delete_many({})
+                except Exception as e:
+                    print("⚠️ Session clear failed:", str(e))
+                    self.clear_all = True
+                    return
+
+            deleted, self.deleted = self.deleted, set()
+
+            if deleted:
+                try:
+                    # Before the writes: a deleted session may have been re-created since
+                    await self.collection.bulk_write([DeleteOne({"_id": chat_id}) for chat_id in deleted], ordered=False)
+                except Exception as e:
+                    print("⚠️ Session flush failed:", str(e))
+                    self.deleted |= deleted
+                    return
+
+            dirty, self.dirty = self.dirty, set()
+            written = []
+
+            for chat_id in dirty:
+                state = self.sessions.get(chat_id)
+                if state is None:
+                    continue
+
+                loaded = self.revs.get(chat_id, 0)
+                written.append((chat_id, loaded + 1))
+                ops.append(ReplaceOne(
+                    # Still the version this worker loaded (0: not stored, or stored before revs)
+                    {"_id": chat_id, "rev": loaded if loaded else {"$exists": False}},
+                    {"_id": chat_id, "rev": loaded + 1, "last_active": state.last_active, "state": state.to_dict()},
+                    upsert=True
+                ))
+
+            if not ops:
+                return
+
+            failed = {}
+            try:
+                await self.collection.bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                failed = {error["index"]: error for error in e.details.get("writeErrors", [])}
+            except Exception as e:
+                print("⚠️ Session flush failed:", str(e))
+                self.dirty |= {chat_id for chat_id, _ in written} - self.deleted
+                return
+
+            for i, (chat_id, rev) in enumerate(written):
+                error = failed.get(i)
+
+                if error is None:
+                    self.revs[chat_id] = rev
+
+                elif error.get("code") == 11000:
+                    # Another worker saved this session since we loaded it
+                    # (the upsert hit its _id): keep theirs, reload next turn
+                    self.conflicts += 1
+                    print(f"⚠️ Session {chat_id} changed by another worker; turn dropped")
+                    self.dirty.discard(chat_id)
+                    self.drop(chat_id)
+
+                elif chat_id not in self.deleted:
+                    print("⚠️ Session flush failed:", error.get("errmsg"))
+                    self.dirty.add(chat_id)
+
+    async def close(self):
+        if self.flusher is not None:
+            self.flusher.cancel()
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "write_behind": self.write_behind,
+            "dirty": len(self.dirty),
+            "conflicts": self.conflicts,
+        }
+
+
+# -----------------------------------
+# Active store
+# -----------------------------------
+
+def create_session_store(backend: str = SESSION_STORE):
+    budget = int(SESSION_MEMORY_BUDGET_MB * 1024 * 1024)
+
+    if backend == "mongo":
+        return MongoSessionStore(budget, write_behind=SESSION_WRITE_BEHIND, flush_seconds=SESSION_FLUSH_SECONDS)
+
+    return MemorySessionStore(budget)
+
+
+session_store = create_session_store()
@@ -1,23 +1,24 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from datetime import datetime, timezone, timedelta
-from app.db import users_collection
+import app.db
+from app.services.user_cache import user_cache
 
 
 async def reset_monthly_credits():
 
     now = datetime.now(timezone.utc)
 
-    cursor = users_collection.find({
+    cursor = app.db.users_collection.find({
         "plan": "pro",
         "subscription_status": "active",
         "subscription_current_period_end": {"$lte": now}
-    })
+    }, {"monthly_credit_limit": 1})
 
     async for user in cursor:
 
         next_period = now + timedelta(days=30)
 
-        await users_collection.update_one(
+        await app.db.users_collection.update_one(
             {"_id": user["_id"]},
             {
                 "$set": {
@@ -27,6 +28,7 @@ async def reset_monthly_credits():
                 }
             }
         )
+        user_cache.invalidate(user["_id"])
 
     print("✅ Monthly credit reset completed")
 
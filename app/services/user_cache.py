@@ -0,0 +1,111 @@
+from collections import OrderedDict
+import os
+import time
+from typing import Optional
+
+from bson import ObjectId
+
+import app.db
+
+
+# -----------------------------------
+# Config
+# -----------------------------------
+
+# How long an authenticated user is served without re-reading Mongo
+USER_CACHE_SECONDS = float(os.getenv("USER_CACHE_SECONDS", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+# What request handlers read from the current user (never the password hash)
+USER_FIELDS = {
+    "name": 1,
+    "email": 1,
+    "role": 1,
+    "board": 1,
+    "class_level": 1,
+    "plan": 1,
+    "plan_type": 1,
+    "is_paid": 1,
+    "valid_until": 1,
+    "credits_remaining": 1,
+    "monthly_credit_limit": 1,
+    "mock_attempts_used": 1,
+    "subscription_status": 1,
+    "subscription_current_period_end": 1
+}
+
+
+class UserCache:
+    """
+    Authenticated users by id, for `get_current_user`.
+
+    Every authenticated request used to read the whole user document. Now
+    a user is read (projected to USER_FIELDS) at most every `ttl`
+    seconds. Writes that change what a request would check go through
+    here: `apply_inc` keeps counters the app itself changes (credits,
+    attempts) current in place, and `invalidate` drops a user whose plan
+    or balance was changed elsewhere (billing, monthly reset).
+
+    Each caller gets its own copy, so a handler changing the dict does not
+    change the cache. Per process: another worker's credit deduction is
+    seen here within `ttl`, and is enforced by Mongo regardless (the
+    deduction is conditional on the balance); a balance too low for a
+    request is re-read before it is refused (`check_credits`).
+    """
+
+    def __init__(self, ttl: float = USER_CACHE_SECONDS, max_size: int = USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.users = OrderedDict()   # user_id (str) -> (expires_at, user)
+
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        entry = self.users.get(user_id)
+
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            self.users.move_to_end(user_id)
+            return dict(entry[1])
+
+        if not ObjectId.is_valid(user_id):
+            return None
+
+        self.misses += 1
+        user = await app.db.users_collection.find_one({"_id": ObjectId(user_id)}, USER_FIELDS)
+
+        if user is None:
+            self.users.pop(user_id, None)
+            return None
+
+        self.users[user_id] = (time.monotonic() + self.ttl, user)
+        self.users.move_to_end(user_id)
+
+        while len(self.users) > self.max_size:
+            self.users.popitem(last=False)
+
+        return dict(user)
+
+    def apply_inc(self, user_id, inc: dict):
+        """Mirror an `$inc` that was just written."""
+        entry = self.users.get(str(user_id))
+        if entry is None:
+            return
+
+        user = entry[1]
+        for field, amount in inc.items():
+            user[field] = user.get(field, 0) + amount
+
+    def invalidate(self, user_id):
+        self.users.pop(str(user_id), None)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.users),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+user_cache = UserCache()
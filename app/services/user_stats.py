@@ -0,0 +1,285 @@
+from datetime import datetime, timezone
+
+import app.db
+from app.services.analytics_pipelines import student_aggregates
+
+
+# -----------------------------------
+# Limits
+# -----------------------------------
+
+RECENT_LIMIT = 50        # per-test summaries kept (/mock/history)
+INSIGHTS_WINDOW = 20     # tests /analytics/learning-insights looks at
+HISTORY_LIMIT = 1000     # accuracy time series (/progress)
+
+
+# -----------------------------------
+# Field names
+# -----------------------------------
+# Topics and difficulties become field names under `topics` / `difficulty`,
+# where "." and a leading "$" would be read as paths/operators.
+
+def stat_key(name) -> str:
+    name = str(name).replace(".", "．")
+    return "＄" + name[1:] if name.startswith("$") else name
+
+
+def stat_name(key: str) -> str:
+    key = key.replace("．", ".")
+    return "$" + key[1:] if key.startswith("＄") else key
+
+
+# -----------------------------------
+# Per-test summary
+# -----------------------------------
+
+def count_by(results, field: str, default: str):
+    """[[name, correct, total], ...] for one test."""
+    counts = {}
+
+    for r in results:
+        name = r.get(field, default)
+        entry = counts.setdefault(name, [name, 0, 0])
+        entry[2] += 1
+        if r.get("isCorrect"):
+            entry[1] += 1
+
+    return list(counts.values())
+
+
+def test_summary(session_id, session: dict, results, score, total, accuracy, weak_topics, completed_at) -> dict:
+    """What the stats keep about one completed test."""
+    return {
+        "session_id": str(session_id),
+        "subject": session.get("subject"),
+        "class_level": session.get("class_level"),
+        "chapter": session.get("chapter"),
+        "score": score,
+        "total": total,
+        "accuracy": accuracy,
+        "weak_topics": weak_topics,
+        "duration": session.get("duration"),
+        "completed_at": completed_at,
+        "topics": count_by(results, "topic", "General"),
+        "difficulties": count_by(results, "difficulty", "medium"),
+    }
+
+
+def summary_from_session(s: dict) -> dict:
+    return test_summary(
+        s["_id"], s, s.get("results", []),
+        s.get("score"), s.get("total"), s.get("accuracy", 0),
+        s.get("weak_topics", []), s.get("completed_at")
+    )
+
+
+# -----------------------------------
+# Writes
+# -----------------------------------
+
+def summary_update(summary: dict) -> dict:
+    """One atomic update folding a finished test into the user's stats."""
+    inc = {"tests": 1, "accuracy_sum": summary["accuracy"]}
+
+    for name, correct, total in summary["topics"]:
+        inc[f"topics.{stat_key(name)}.correct"] = correct
+        inc[f"topics.{stat_key(name)}.total"] = total
+
+    for name, correct, total in summary["difficulties"]:
+        inc[f"difficulty.{stat_key(name)}.correct"] = correct
+        inc[f"difficulty.{stat_key(name)}.total"] = total
+
+    return {
+        "$inc": inc,
+        "$max": {"best_accuracy": summary["accuracy"]},
+        "$set": {
+            "last_accuracy": summary["accuracy"],
+            "updated_at": datetime.now(timezone.utc)
+        },
+        "$push": {
+            "accuracy_history": {"$each": [summary["accuracy"]], "$slice": -HISTORY_LIMIT},
+            "recent": {"$each": [summary], "$slice": -RECENT_LIMIT}
+        }
+    }
+
+
+async def record_test(user_id, summary: dict):
+    """
+    Fold a test into the student's stats. Call after the session is marked
+    completed: a student without a stats document yet gets one built from
+    all their completed tests, this one included, rather than a document
+    that only knows this test. A test already in `recent` is not counted
+    again.
+    """
+    uncounted = {"_id": user_id, "recent.session_id": {"$ne": summary["session_id"]}}
+
+    result = await app.db.user_stats_collection.update_one(uncounted, summary_update(summary))
+    if result.matched_count:
+        return
+
+    # No document (or the test is already counted): build it if missing,
+    # then count the test in case the document came from elsewhere without it
+    await rebuild_user_stats(user_id)
+    await app.db.user_stats_collection.update_one(uncounted, summary_update(summary))
+
+
+async def rebuild_user_stats(user_id) -> dict:
+    """
+    Build a stats document from every completed test, and store it unless
+    one exists by now (a concurrent submit's `$inc` is never overwritten).
+    Only needed once per student; afterwards each submit updates the
+    document directly. The counting runs in Mongo (`student_pipeline`), so
+    only the aggregates come back.
+    """
+    agg = await student_aggregates(user_id, RECENT_LIMIT, HISTORY_LIMIT)
+
+    stats = {"_id": user_id, "tests": 0, "accuracy_sum": 0, "topics": {}, "difficulty": {},
+             "accuracy_history": [], "recent": []}
+
+    if not agg["totals"] or not agg["totals"][0]["tests"]:
+        # Nothing to store: the first submit builds the document
+        return stats
+
+    totals = agg["totals"][0]
+    totals.pop("_id", None)
+    stats.update(totals)
+
+    for group in ("topics", "difficulty"):
+        stats[group] = {
+            stat_key(row["_id"]): {"correct": row["correct"], "total": row["total"]}
+            for row in agg[group]
+        }
+
+    # Per-test counters of the recent tests, keyed by session
+    per_test = {}
+    for field, rows in (("topics", agg["recent_topics"]), ("difficulties", agg["recent_difficulty"])):
+        for row in rows:
+            counts = per_test.setdefault(row["_id"]["session"], {"topics": [], "difficulties": []})
+            counts[field].append([row["_id"]["name"], row["correct"], row["total"]])
+
+    for s in reversed(agg["recent"]):
+        summary = summary_from_session(s)
+        summary.update(per_test.get(s["_id"], {}))
+        stats["recent"].append(summary)
+
+    stats["updated_at"] = datetime.now(timezone.utc)
+
+    await app.db.user_stats_collection.update_one(
+        {"_id": user_id},
+        {"$setOnInsert": {k: v for k, v in stats.items() if k != "_id"}},
+        upsert=True
+    )
+    return stats
+
+
+# -----------------------------------
+# Reads
+# -----------------------------------
+
+async def get_user_stats(user_id) -> dict:
+    stats = await app.db.user_stats_collection.find_one({"_id": user_id})
+
+    if stats is None:
+        stats = await rebuild_user_stats(user_id)
+
+    return stats
+
+
+def accuracy_by(counters: dict) -> dict:
+    return {
+        stat_name(key): round((c["correct"] / c["total"]) * 100)
+        for key, c in counters.items()
+        if c.get("total")
+    }
+
+
+def rows_accuracy(rows) -> dict:
+    return {name: round((correct / total) * 100) for name, correct, total in rows if total}
+
+
+def progress_view(stats: dict) -> dict:
+    """/progress"""
+    tests = stats.get("tests", 0)
+
+    if not tests:
+        return {
+            "total_tests": 0,
+            "average_accuracy": 0,
+            "best_score": 0,
+            "last_score": 0,
+            "accuracy_history": [],
+            "topic_mastery": {},
+            "improvement_rate": 0
+        }
+
+    return {
+        "total_tests": tests,
+        "average_accuracy": round(stats["accuracy_sum"] / tests),
+        "best_score": stats["best_accuracy"],
+        "last_score": stats["last_accuracy"],
+        "accuracy_history": stats.get("accuracy_history", []),
+        "topic_mastery": accuracy_by(stats.get("topics", {})),
+        "improvement_rate": stats["last_accuracy"] - stats["first_accuracy"]
+    }
+
+
+def insights_view(stats: dict) -> dict:
+    """/analytics/learning-insights: the last INSIGHTS_WINDOW tests."""
+    window = stats.get("recent", [])[-INSIGHTS_WINDOW:]
+
+    if not window:
+        return {
+            "learning_velocity": 0,
+            "difficulty_strength": {},
+            "weakest_topic": None,
+            "strongest_topic": None,
+            "recommended_topic": None
+        }
+
+    topics = {}
+    difficulties = {}
+
+    for summary in window:
+        for totals, rows in ((topics, summary["topics"]), (difficulties, summary["difficulties"])):
+            for name, correct, total in rows:
+                entry = totals.setdefault(name, [name, 0, 0])
+                entry[1] += correct
+                entry[2] += total
+
+    topic_accuracy = rows_accuracy(topics.values())
+
+    weakest_topic = min(topic_accuracy, key=topic_accuracy.get) if topic_accuracy else None
+    strongest_topic = max(topic_accuracy, key=topic_accuracy.get) if topic_accuracy else None
+
+    # Newest minus oldest in the window
+    learning_velocity = 0
+    if len(window) >= 2:
+        learning_velocity = round(window[-1]["accuracy"] - window[0]["accuracy"])
+
+    return {
+        "learning_velocity": learning_velocity,
+        "difficulty_strength": rows_accuracy(difficulties.values()),
+        "weakest_topic": weakest_topic,
+        "strongest_topic": strongest_topic,
+        "recommended_topic": weakest_topic
+    }
+
+
+def history_view(stats: dict) -> list:
+    """/mock/history: newest first."""
+    return [
+        {
+            "session_id": s["session_id"],
+            "subject": s.get("subject"),
+            "class_level": s.get("class_level"),
+            "score": s.get("score"),
+            "total": s.get("total"),
+            "accuracy": s.get("accuracy"),
+            "chapter": s.get("chapter"),
+            "weak_topics": s.get("weak_topics", []),
+            "topic_accuracy": rows_accuracy(s["topics"]),
+            "duration": s.get("duration"),
+            "completed_at": s.get("completed_at")
+        }
+        for s in reversed(stats.get("recent", []))
+    ]
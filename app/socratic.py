@@ -1,9 +1,10 @@
 import os
 import traceback
-from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, List
 import google.generativeai as genai
 from app.rag.retriever import retrieve
+from app.services.session_state import Mode, SessionState, SocraticState, TrainingMode
+from app.services.session_store import session_store
 import json
 
 # =====================================================
@@ -14,74 +15,22 @@ MODEL_NAME = "models/gemini-flash-latest"
 model = genai.GenerativeModel(MODEL_NAME)
 
 # =====================================================
-# In-memory chat store
+# Chat store (memory or Mongo, see app.services.session_store)
 # =====================================================
-chat_states: Dict[str, Dict[str, Any]] = {}
-
-def get_state(chat_id: str) -> Dict[str, Any]:
+def get_state(chat_id: str) -> SessionState:
     """Get or create chat state for a given chat ID"""
-    if chat_id not in chat_states:
-        chat_states[chat_id] = {
-            "board": "CBSE",
-            "domain": None,
-            "subject": None,
-            "intent": None,
-            "mode": "explain",
-            "diagnosis": None,
-            "clarification": None,
-            "declared_gap": None,
-            "micro_history": [],
-            "rolling_confidence": 0.5,
-            "discipline_score": 0.5,
-            "current_training_mode": "guided",
-            "verification_answers": None,
-            "diagnostic_profile": None,
-            "history": [],
-            "context_window": [],
-
-            # ==============================
-            # SOCRATIC MODE
-            # ==============================
-            "socratic": {
-                "original_question": None,
-                "steps": [],
-                "current": 0,
-                "failures": 0,
-                "user_attempts": []
-            },
-
-            # ==============================
-            # EXAM SIMULATION (SHORT ANSWER)
-            # ==============================
-            "exam_simulation_active": False,
-            "last_expected_keywords": [],
-            "last_question_type": None,
-
-            # ==============================
-            # 🔥 NEW: FULL MOCK EXAM ENGINE
-            # ==============================
-            "mock_exam": {
-                "active": False,
-                "subject": None,
-                "current_index": 0,
-                "questions": [],
-                "answers": [],
-                "scores": [],
-                "total_score": 0
-            },
-
-            "last_question": None,
-            "last_topic": None,
-            "last_answer": None,
-
-            "mock_active": False,
-            "mock_questions": [],
-            "mock_current": 0,
-            "last_active": datetime.utcnow()
-        }
+    state = session_store.get(chat_id)
+
+    if state is None:
+        state = SessionState(session_id=chat_id)
+        session_store.put(chat_id, state)
 
-    chat_states[chat_id]["last_active"] = datetime.utcnow()
-    return chat_states[chat_id]
+    return state
+
+
+def clear_chat(chat_id) -> bool:
+    """Forget a conversation (reset / new chat)."""
+    return session_store.delete(chat_id)
 
 
 def generate_class10_physics_mock():
@@ -1137,13 +1086,13 @@ def chat_reply(
     # RESET
     # =====================================================
     if reset:
-        chat_states.pop(chat_id, None)
+        clear_chat(chat_id)
         return "Session reset. Ask me any question!"
 
     state = get_state(chat_id)
 
     if board:
-        state["board"] = board
+        state.board = board
 
     user_text = user_text.strip()
     if not user_text:
@@ -1157,71 +1106,70 @@ def chat_reply(
     # - Not in mock mode
     # =====================================================
     if (
-        state.get("diagnostic_profile")
-        and not state.get("mock_active")
+        state.diagnostic_profile
+        and not state.quiz_active
         and len(user_text.split()) > 12
     ):
 
-        topic = state.get("last_topic", "") or state.get("last_question", "")
+        topic = state.last_topic or state.last_question or ""
 
         micro = micro_diagnose_student_response(
             topic=topic,
             student_response=user_text
         )
 
-        state["micro_history"].append(micro)
-        state["micro_history"] = state["micro_history"][-5:]
+        # Ring buffer: keeps the last MICRO_HISTORY_LIMIT signals
+        state.add_micro(micro)
 
         # Update rolling confidence
         avg_conf = sum(
             m.get("confidence_signal", 0.5)
-            for m in state["micro_history"]
-        ) / len(state["micro_history"])
+            for m in state.micro_history
+        ) / len(state.micro_history)
 
-        state["rolling_confidence"] = round(avg_conf, 2)
+        state.rolling_confidence = round(avg_conf, 2)
 
         # Update discipline score
         avg_disc = sum(
             m.get("structural_discipline", 0.5)
-            for m in state["micro_history"]
-        ) / len(state["micro_history"])
+            for m in state.micro_history
+        ) / len(state.micro_history)
 
-        state["discipline_score"] = round(avg_disc, 2)
+        state.discipline_score = round(avg_disc, 2)
 
         # Dynamic training mode
-        if any(m.get("misconception_detected") for m in state["micro_history"]):
-            state["current_training_mode"] = "socratic"
-
-        elif state["discipline_score"] < 0.4:
-            state["current_training_mode"] = "structural"
+        if any(m.get("misconception_detected") for m in state.micro_history):
+            state.current_training_mode = TrainingMode.SOCRATIC
 
-        elif state["rolling_confidence"] < 0.4:
-            state["current_training_mode"] = "guided"
+        elif state.discipline_score < 0.4:
+            state.current_training_mode = TrainingMode.STRUCTURAL
 
-        elif any(m["misconception_detected"] for m in state["micro_history"]):
-            state["current_training_mode"] = "socratic"
+        elif state.rolling_confidence < 0.4:
+            state.current_training_mode = TrainingMode.GUIDED
 
         else:
-            state["current_training_mode"] = "socratic"
+            state.current_training_mode = TrainingMode.SOCRATIC
 
     # =====================================================
     # START CLASS 10 PHYSICS MOCK
     # =====================================================
     if user_text.lower() in ["start class 10 physics mock", "start physics mock"]:
 
-        state["mock_questions"] = generate_class10_physics_mock()
-        state["mock_current"] = 0
-        state["mock_active"] = True
+        quiz = state.quiz
+        quiz.questions = generate_class10_physics_mock()
+        quiz.current = 0
+        quiz.active = True
 
-        first_q = state["mock_questions"][0]["question"]
+        first_q = quiz.questions[0]["question"]
         return f"Class 10 Physics Mini Mock Started.\n\nQuestion 1:\n{first_q}"
 
     # =====================================================
     # HANDLE MOCK ANSWERS
     # =====================================================
-    if state.get("mock_active"):
+    if state.quiz_active:
 
-        current_q = state["mock_questions"][state["mock_current"]]
+        quiz = state.quiz
+        current_q = quiz.questions[quiz.current]
         keywords = current_q["keywords"]
         max_marks = current_q["marks"]
 
@@ -1247,28 +1195,28 @@ def chat_reply(
             for m in missing:
                 feedback += f"- {m}\n"
 
-        state["mock_current"] += 1
+        quiz.current += 1
 
-        if state["mock_current"] < len(state["mock_questions"]):
-            next_q = state["mock_questions"][state["mock_current"]]["question"]
+        if quiz.current < len(quiz.questions):
+            next_q = quiz.questions[quiz.current]["question"]
             feedback += f"\nNext Question:\n{next_q}"
         else:
             feedback += "\nMock Completed."
-            state["mock_active"] = False
+            quiz.active = False
 
         return feedback
 
     # =====================================================
     # EXAM SIMULATION
     # =====================================================
-    if state.get("exam_simulation_active"):
+    if state.exam_active:
 
         evaluation = evaluate_exam_answer(
-            question=state.get("last_question"),
-            model_answer=state.get("last_answer"),
+            question=state.last_question,
+            model_answer=state.last_answer,
             student_answer=user_text,
-            board=state.get("board"),
-            question_type=state.get("last_question_type", "short")
+            board=state.board,
+            question_type=state.exam.question_type or "short"
         )
 
         feedback = f"Score: {evaluation['score']}/{evaluation['max_score']}\n\n"
@@ -1286,10 +1234,10 @@ def chat_reply(
         feedback += f"\nImprovement Advice:\n{evaluation['improvement_advice']}\n\n"
         feedback += f"Ideal Full-Mark Answer:\n{evaluation['model_improved_answer']}"
 
-        state["exam_simulation_active"] = False
-        state["history"].append({"role": "user", "content": user_text})
-        state["history"].append({"role": "assistant", "content": feedback})
-        state["last_answer"] = feedback
+        state.exam.active = False
+        state.remember("user", user_text)
+        state.remember("assistant", feedback)
+        state.last_answer = feedback
 
         return feedback
 
@@ -1298,24 +1246,23 @@ def chat_reply(
     # =====================================================
     original_question = user_text
 
-    if is_followup_question(user_text, state["history"]):
+    history = list(state.history)
+
+    if is_followup_question(user_text, history):
         user_text = build_contextualized_question(
             user_text,
-            state.get("last_question", ""),
-            state.get("last_topic", ""),
-            state.get("last_answer", ""),
-            state["history"]
+            state.last_question or "",
+            state.last_topic or "",
+            state.last_answer or "",
+            history
         )
 
-    domain, subject = classify_domain(user_text, state["history"])
-    intent = classify_intent(user_text, domain, state["history"])
+    domain, subject = classify_domain(user_text, history)
+    intent = classify_intent(user_text, domain, history)
     question_type = classify_exam_question_type(user_text)
 
-    state["domain"] = domain
-    state["subject"] = subject
-    state["intent"] = intent
-    state["question_type"] = question_type
-    state["last_question"] = user_text
+    state.classify(domain, subject, intent, question_type)
+    state.last_question = user_text
 
     # =====================================================
     # DERIVATION / NUMERICAL → SOCRATIC
@@ -1325,65 +1272,49 @@ def chat_reply(
         steps = generate_steps(domain, subject, user_text)
 
         if steps:
-            state["socratic"] = {
-                "original_question": user_text,
-                "steps": steps,
-                "current": 0,
-                "failures": 0,
-                "user_attempts": []
-            }
-            state["mode"] = "socratic"
+            state.socratic = SocraticState(
+                original_question=user_text,
+                steps=steps
+            )
+            state.mode = Mode.SOCRATIC
 
             return f"Let's solve step by step.\n\nStep 1: {steps[0]}"
 
     # =====================================================
     # EXPLANATION MODE (ADAPTIVE)
     # =====================================================
-    teaching_mode = state.get("current_training_mode")
+    teaching_mode = state.current_training_mode
 
     prompt = build_explanation_prompt(
-        state["board"],
+        state.board,
         domain,
         subject,
         intent,
         user_text,
-        state["history"],
+        history,
         teaching_mode=teaching_mode,
         question_type=question_type,
-        clarification=state.get("clarification"),
-        declared_gap=state.get("diagnosis")
+        clarification=state.clarification,
+        declared_gap=state.diagnosis
     )
 
     answer = clean_latex(gemini(prompt) or "Please rephrase your question.")
 
-    state["history"].append({"role": "user", "content": original_question})
-    state["history"].append({"role": "assistant", "content": answer})
-    state["last_answer"] = answer
+    # Ring buffer: keeps the last HISTORY_LIMIT messages
+    state.remember("user", original_question)
+    state.remember("assistant", answer)
+    state.last_answer = answer
 
     if question_type in ("definition", "short"):
-        state["exam_simulation_active"] = True
-        state["last_question_type"] = question_type
+        state.exam.active = True
+        state.exam.question_type = state.question_type
         answer += "\n\nNow write this answer in proper board exam format (2-mark style)."
 
-    if len(state["history"]) > 20:
-        state["history"] = state["history"][-20:]
-
     return answer
 
 # =====================================================
 # SESSION CLEANUP
 # =====================================================
-def cleanup_old_sessions(max_age_hours: int = 24):
-    """Remove inactive chat sessions"""
-    now = datetime.utcnow()
-    to_remove = []
-    
-    for chat_id, state in chat_states.items():
-        age = (now - state["last_active"]).total_seconds() / 3600
-        if age > max_age_hours:
-            to_remove.append(chat_id)
-    
-    for chat_id in to_remove:
-        chat_states.pop(chat_id, None)
-    
-    return len(to_remove)
\ No newline at end of file
+def cleanup_old_sessions(max_age_hours: float = 24):
+    """Remove inactive chat sessions, returns how many were removed"""
+    return session_store.expire(max_age_hours * 3600)
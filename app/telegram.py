@@ -1,5 +1,7 @@
 from fastapi import APIRouter, Request
-from app.socratic import chat_reply
+from app.socratic import chat_reply, clear_chat
+from app.services.session_locks import SessionBusy
+from app.services.session_store import session_store
 from app import db
 import httpx
 import os
@@ -26,6 +28,7 @@ async def telegram_webhook(request: Request):
     # 🔹 Handle /clear BEFORE Gemini
     if text.lower() in ("/clear", "/reset", "/new"):
         clear_chat(chat_id)
+        await session_store.save(chat_id)
         async with httpx.AsyncClient() as client:
             await client.post(
                 f"{TELEGRAM_API}/sendMessage",
@@ -66,7 +69,14 @@ async def telegram_webhook(request: Request):
             )
 
         # ✅ Correct variable
-        reply = chat_reply(chat_id, text)
+        try:
+            async with session_store.turn(chat_id):
+                reply = chat_reply(chat_id, text)
+
+        except SessionBusy:
+            # Ack anyway: a non-2xx makes Telegram redeliver the update,
+            # queueing yet another turn behind the running one
+            reply = "⏳ Still working on your last message, please wait a moment."
 
         await client.post(
             f"{TELEGRAM_API}/sendMessage",
@@ -6,6 +6,8 @@ import google.generativeai as genai
 from dotenv import load_dotenv
 import os
 
+from app.rag.manifest import build_manifest, write_manifest
+
 # --------------------------------------------------
 # ENV
 # --------------------------------------------------
@@ -60,4 +62,13 @@ with open(META_PATH, "w", encoding="utf-8") as f:
         indent=2
     )
 
+# Record model + dimension so the retriever can refuse a mismatched query model
+write_manifest(VECTOR_DIR, build_manifest(
+    VECTOR_DIR,
+    [INDEX_PATH.name, META_PATH.name],
+    {"gemini": {"model": EMBED_MODEL, "dim": dim, "index_file": INDEX_PATH.name, "encoding": "flat"}},
+    chunker_version=None,
+    chunks=len(documents),
+))
+
 print("✅ FAISS index rebuilt with dim =", dim)